@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Excel文件比较工具性能基准测试脚本
+用法：
+    python bench/benchmark.py column_alignment [--rows 1000] [--cols 240]
+    python bench/benchmark.py added_row_styles [--rows 1000] [--cols 240]
+    python bench/benchmark.py highlight_modes [--rows 1000] [--cols 240]
+    python bench/benchmark.py diff_engines [--rows 1000] [--cols 240]
+    python bench/benchmark.py row_fingerprints [--rows 1000] [--cols 240]
+    python bench/benchmark.py parallel_diff [--rows 1000000] [--cols 240] [--workers 8]
+    python bench/benchmark.py parallel_load [--rows 1000] [--cols 240]
+    python bench/benchmark.py fast_reader [--rows 1000] [--cols 240]
+    python bench/benchmark.py column_projection [--rows 1000] [--cols 240]
+    python bench/benchmark.py parse_cache [--rows 1000] [--cols 240]
+    python bench/benchmark.py preview [--rows 1000] [--cols 240]
+"""
+
+import argparse
+import datetime
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# 项目根目录
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "web"))
+
+import openpyxl
+from openpyxl.styles import PatternFill, Font, Border, Side, Alignment
+
+import compare_excel_web
+from compare_excel_web import ColumnProjection, ParseCache, SheetTable, StyleRegistry, add_highlight_rules, align_columns, diff_cells_numpy, diff_cells_parallel, diff_cells_python, load_sheet_table, read_sheet_preview, load_sheet_tables, skip_identical_rows
+
+
+def timed(func, *args):
+    """执行函数并返回(结果, 耗时秒数)"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def make_wide_tables(rows, cols, header_row=1, seed=0):
+    """生成一对宽表：比较表中约1%的单元格被修改"""
+    rng = random.Random(seed)
+    header = tuple(f"列名{c}" for c in range(1, cols + 1))
+    data_baseline = [tuple(rng.randint(0, 1000) for _ in range(cols)) for _ in range(rows)]
+    data_compare = [
+        tuple(v + 1 if rng.random() < 0.01 else v for v in row)
+        for row in data_baseline
+    ]
+    padding = [tuple(None for _ in range(cols))] * (header_row - 1)
+    table_baseline = SheetTable("基准", ["基准"], padding + [header] + data_baseline)
+    table_compare = SheetTable("比较", ["比较"], padding + [header] + data_compare)
+    return table_baseline, table_compare
+
+
+def bench_column_alignment(args):
+    """宽表列映射：逐行重建列名映射 vs 预先计算一次列对齐"""
+    header_row = 1
+    table_baseline, table_compare = make_wide_tables(args.rows, args.cols, header_row)
+    row_mapping = {r: r for r in range(header_row + 1, table_baseline.max_row + 1)}
+
+    def per_row_col_name_map():
+        # 旧实现：每个匹配行都重新扫描两边的表头
+        changed = 0
+        for row_baseline, row_compare in row_mapping.items():
+            col_name_map = {}
+            for col_b in range(1, table_baseline.max_col + 1):
+                col_name_b = table_baseline.header_name(header_row, col_b)
+                if not col_name_b:
+                    continue
+                for col_c in range(1, table_compare.max_col + 1):
+                    if table_compare.header_name(header_row, col_c) == col_name_b:
+                        col_name_map[col_b] = col_c
+                        break
+            values_baseline = table_baseline.rows[row_baseline - 1]
+            values_compare = table_compare.rows[row_compare - 1]
+            for col_b, col_c in col_name_map.items():
+                if values_baseline[col_b - 1] != values_compare[col_c - 1]:
+                    changed += 1
+        return changed
+
+    def shared_alignment():
+        # 新实现：列对齐只计算一次，所有匹配行共用
+        compared_cols = list(align_columns(table_baseline, table_compare, header_row).mapping.items())
+        changed = 0
+        for row_baseline, row_compare in row_mapping.items():
+            values_baseline = table_baseline.rows[row_baseline - 1]
+            values_compare = table_compare.rows[row_compare - 1]
+            for col_b, col_c in compared_cols:
+                if values_baseline[col_b - 1] != values_compare[col_c - 1]:
+                    changed += 1
+        return changed
+
+    print(f"宽表列映射基准测试: {args.rows}行 x {args.cols}列")
+    changed_old, elapsed_old = timed(per_row_col_name_map)
+    changed_new, elapsed_new = timed(shared_alignment)
+    assert changed_old == changed_new, (changed_old, changed_new)
+    print(f"  逐行重建列名映射: {elapsed_old:.3f}s（{changed_old}处差异）")
+    print(f"  预先计算列对齐:   {elapsed_new:.3f}s（{changed_new}处差异）")
+    print(f"  加速比: {elapsed_old / elapsed_new:.1f}x")
+
+
+def bench_added_row_styles(args):
+    """差异结果新增行格式：逐单元格创建Font/Border/Alignment vs 共享样式缓存"""
+    fill_deleted = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
+    side = Side(style="thin")
+
+    def make_sheet():
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        for col in range(1, args.cols + 1):
+            cell = ws.cell(row=1, column=col, value=col)
+            cell.number_format = "0.00"
+            cell.font = Font(name="微软雅黑", size=10, bold=col % 2 == 0)
+            cell.border = Border(left=side, right=side, top=side, bottom=side)
+            cell.alignment = Alignment(horizontal="center")
+        return wb, ws
+
+    def per_cell_styles():
+        # 旧实现：每个新增单元格都新建样式对象
+        wb, ws = make_sheet()
+        template_cells = [ws.cell(row=1, column=col) for col in range(1, args.cols + 1)]
+        for row in range(2, args.rows + 2):
+            for col, template_cell in enumerate(template_cells, start=1):
+                new_cell = ws.cell(row=row, column=col)
+                new_cell.number_format = template_cell.number_format
+                new_cell.font = Font(**template_cell.font.__dict__)
+                new_cell.border = Border(**template_cell.border.__dict__)
+                new_cell.alignment = Alignment(**template_cell.alignment.__dict__)
+                new_cell.fill = fill_deleted
+
+    def shared_styles():
+        # 新实现：每种 (模板样式, 填充) 只解析一次
+        wb, ws = make_sheet()
+        registry = StyleRegistry(ws)
+        template_styles = [ws.cell(row=1, column=col)._style for col in range(1, args.cols + 1)]
+        for row in range(2, args.rows + 2):
+            for col, template_style in enumerate(template_styles, start=1):
+                registry.apply_fill(ws.cell(row=row, column=col), fill_deleted, template_style)
+
+    print(f"新增行格式基准测试: {args.rows}行 x {args.cols}列")
+    _, elapsed_old = timed(per_cell_styles)
+    _, elapsed_new = timed(shared_styles)
+    print(f"  逐单元格创建样式: {elapsed_old:.3f}s")
+    print(f"  共享样式缓存:     {elapsed_new:.3f}s")
+    print(f"  加速比: {elapsed_old / elapsed_new:.1f}x")
+
+
+def bench_highlight_modes(args):
+    """差异标记：逐单元格填充 vs 合并区域的条件格式（含保存文件）"""
+    rng = random.Random(0)
+    fill_changed = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
+    fill_added = PatternFill(start_color="00FF00", end_color="00FF00", fill_type="solid")
+    # 约20%的行整行删除（成段出现），约1%的单元格数值变化
+    deleted_rows = [row for row in range(2, args.rows + 2) if (row // 10) % 5 == 0]
+    deleted_set = set(deleted_rows)
+    changed_cells = [
+        (row, col) for row in range(2, args.rows + 2) if row not in deleted_set
+        for col in range(1, args.cols + 1) if rng.random() < 0.01
+    ]
+
+    def make_workbook():
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        for row in range(1, args.rows + 2):
+            ws.append([row * col for col in range(1, args.cols + 1)])
+        return wb, ws
+
+    def save_size(wb):
+        with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as f:
+            path = f.name
+        try:
+            wb.save(path)
+            return os.path.getsize(path)
+        finally:
+            os.unlink(path)
+
+    def cell_fills(wb, ws):
+        registry = StyleRegistry(ws)
+        for row, col in changed_cells:
+            registry.apply_fill(ws.cell(row=row, column=col), fill_changed)
+        for row in deleted_rows:
+            for col in range(1, args.cols + 1):
+                registry.apply_fill(ws.cell(row=row, column=col), fill_added)
+        return save_size(wb)
+
+    def conditional_rules(wb, ws):
+        regions = add_highlight_rules(ws, fill_changed, [(row, col, col) for row, col in changed_cells])
+        regions += add_highlight_rules(ws, fill_added, [(row, 1, args.cols) for row in deleted_rows])
+        return save_size(wb), regions
+
+    print(f"差异标记基准测试: {args.rows}行 x {args.cols}列，{len(deleted_rows)}行删除，{len(changed_cells)}处数值变化")
+    size_old, elapsed_old = timed(cell_fills, *make_workbook())
+    (size_new, regions), elapsed_new = timed(conditional_rules, *make_workbook())
+    print(f"  逐单元格填充: {elapsed_old:.3f}s，文件 {size_old / 1024:.0f}KB")
+    print(f"  条件格式区域: {elapsed_new:.3f}s，文件 {size_new / 1024:.0f}KB（{regions}个区域）")
+    print(f"  加速比: {elapsed_old / elapsed_new:.1f}x")
+
+
+def bench_diff_engines(args):
+    """匹配行单元格比较：纯Python逐单元格比较 vs NumPy按列向量化比较"""
+    if compare_excel_web.np is None:
+        print("未安装NumPy，跳过该基准测试")
+        return
+    header_row = 1
+    table_baseline, table_compare = make_wide_tables(args.rows, args.cols, header_row)
+    row_mapping = {r: r for r in range(header_row + 1, table_baseline.max_row + 1)}
+    compared_cols = list(align_columns(table_baseline, table_compare, header_row).mapping.items())
+
+    print(f"单元格比较引擎基准测试: {args.rows}行 x {args.cols}列")
+    changed_old, elapsed_old = timed(diff_cells_python, table_baseline, table_compare, row_mapping, compared_cols)
+    # object数组在加载阶段构建一次，单独计时
+    _, elapsed_array = timed(lambda: (table_baseline.values_array(), table_compare.values_array()))
+    changed_new, elapsed_new = timed(diff_cells_numpy, table_baseline, table_compare, row_mapping, compared_cols)
+    assert changed_old == changed_new
+    print(f"  纯Python逐单元格: {elapsed_old:.3f}s（{len(changed_old)}处差异）")
+    print(f"  NumPy按列向量化:  {elapsed_new:.3f}s（{len(changed_new)}处差异，另有构建数组 {elapsed_array:.3f}s）")
+    print(f"  加速比: {elapsed_old / elapsed_new:.1f}x")
+
+
+def bench_row_fingerprints(args):
+    """匹配行单元格比较：全部逐单元格比较 vs 先用行指纹跳过未变化的行"""
+    rng = random.Random(0)
+    header = tuple(f"列名{c}" for c in range(1, args.cols + 1))
+    data_baseline = [tuple(rng.randint(0, 1000) for _ in range(args.cols)) for _ in range(args.rows)]
+    # 约2%的行有一个单元格被修改，其余行完全相同
+    data_compare = []
+    for row in data_baseline:
+        if rng.random() < 0.02:
+            col = rng.randrange(args.cols)
+            row = row[:col] + (row[col] + 1,) + row[col + 1:]
+        data_compare.append(row)
+    table_baseline = SheetTable("基准", ["基准"], [header] + data_baseline)
+    table_compare = SheetTable("比较", ["比较"], [header] + data_compare)
+    row_mapping = {r: r for r in range(2, table_baseline.max_row + 1)}
+    compared_cols = list(align_columns(table_baseline, table_compare, 1).mapping.items())
+
+    def with_fingerprints():
+        rows_to_compare, skipped_rows = skip_identical_rows(table_baseline, table_compare, row_mapping, compared_cols)
+        return diff_cells_python(table_baseline, table_compare, rows_to_compare, compared_cols), skipped_rows
+
+    print(f"行指纹基准测试: {args.rows}行 x {args.cols}列")
+    changed_old, elapsed_old = timed(diff_cells_python, table_baseline, table_compare, row_mapping, compared_cols)
+    (changed_new, skipped_rows), elapsed_new = timed(with_fingerprints)
+    assert changed_old == changed_new
+    print(f"  全部逐单元格比较: {elapsed_old:.3f}s（{len(changed_old)}处差异）")
+    print(f"  行指纹跳过相同行: {elapsed_new:.3f}s（跳过{skipped_rows}/{len(row_mapping)}行）")
+    print(f"  加速比: {elapsed_old / elapsed_new:.1f}x")
+
+
+def bench_parallel_diff(args):
+    """匹配行单元格比较：单进程 vs 多进程分块比较（进程数按1、2、4…递增到--workers）"""
+    header_row = 1
+    table_baseline, table_compare = make_wide_tables(args.rows, args.cols, header_row)
+    row_mapping = {r: r for r in range(header_row + 1, table_baseline.max_row + 1)}
+    compared_cols = list(align_columns(table_baseline, table_compare, header_row).mapping.items())
+
+    print(f"多进程比较基准测试: {args.rows}行 x {args.cols}列，CPU核心数 {os.cpu_count()}，子进程启动方式 {multiprocessing.get_start_method()}")
+    changed_single, elapsed_single = timed(diff_cells_python, table_baseline, table_compare, row_mapping, compared_cols)
+    print(f"  单进程:   {elapsed_single:.3f}s（{len(changed_single)}处差异）")
+    workers = 2
+    while workers <= args.workers:
+        changed, elapsed = timed(diff_cells_parallel, table_baseline, table_compare, row_mapping, compared_cols, workers)
+        assert changed == changed_single
+        print(f"  {workers}个进程: {elapsed:.3f}s，加速比 {elapsed_single / elapsed:.1f}x")
+        workers *= 2
+
+
+def bench_parallel_load(args):
+    """加载基准文件和比较文件：依次加载 vs 两个进程并行加载"""
+    table_baseline, table_compare = make_wide_tables(args.rows, args.cols)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = []
+        for name, table in (("baseline", table_baseline), ("compare", table_compare)):
+            wb = openpyxl.Workbook(write_only=True)
+            ws = wb.create_sheet(table.title)
+            for row in table.rows:
+                ws.append(row)
+            path = os.path.join(temp_dir, f"{name}.xlsx")
+            wb.save(path)
+            paths.append(path)
+
+        print(f"并行加载基准测试: 2个文件，各{args.rows}行 x {args.cols}列，CPU核心数 {os.cpu_count()}")
+        (tables_old, _), elapsed_old = timed(load_sheet_tables, paths, False)
+        # 不受文件大小阈值限制，始终并行加载
+        compare_excel_web.PARALLEL_LOAD_MIN_BYTES = 0
+        (tables_new, _), elapsed_new = timed(load_sheet_tables, paths, True)
+        assert [t.rows for t in tables_old] == [t.rows for t in tables_new]
+        print(f"  依次加载: {elapsed_old:.3f}s")
+        print(f"  并行加载: {elapsed_new:.3f}s")
+        print(f"  加速比: {elapsed_old / elapsed_new:.1f}x")
+
+
+def bench_fast_reader(args):
+    """加载单个工作簿的数值表：openpyxl只读模式 vs 直接解析XML的快速读取器"""
+    table, _ = make_wide_tables(args.rows, args.cols)
+    start_date = datetime.datetime(2024, 1, 1)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(table.title)
+        # 附加日期列和布尔列，覆盖日期格式转换和各种单元格类型
+        for row_idx, row in enumerate(table.rows):
+            ws.append(row + (start_date + datetime.timedelta(days=row_idx % 3650), row_idx % 2 == 0))
+        path = os.path.join(temp_dir, "workbook.xlsx")
+        wb.save(path)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+
+        print(f"快速读取基准测试: {args.rows}行 x {args.cols + 2}列，文件大小 {size_mb:.1f}MB")
+        table_old, elapsed_old = timed(load_sheet_table, path)
+        table_new, elapsed_new = timed(load_sheet_table, path, "fast")
+        assert table_old.rows == table_new.rows
+        print(f"  openpyxl只读模式: {elapsed_old:.3f}s")
+        print(f"  快速读取: {elapsed_new:.3f}s")
+        print(f"  加速比: {elapsed_old / elapsed_new:.1f}x")
+
+
+def bench_column_projection(args):
+    """加载宽表：全部列 vs 只加载3个特征列和5个比较列（openpyxl只读模式和快速读取）"""
+    table, _ = make_wide_tables(args.rows, args.cols)
+    header = table.rows[0]
+    projection = ColumnProjection(1, include=header[3:8], always=header[:3])
+    with tempfile.TemporaryDirectory() as temp_dir:
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(table.title)
+        for row in table.rows:
+            ws.append(row)
+        path = os.path.join(temp_dir, "workbook.xlsx")
+        wb.save(path)
+
+        print(f"列投影基准测试: {args.rows}行 x {args.cols}列，只加载8列")
+        for reader in ("openpyxl", "fast"):
+            results = []
+            for label, reader_projection in (("全部列", None), ("列投影", projection)):
+                loaded, elapsed = timed(load_sheet_table, path, reader, reader_projection)
+                # 单独测量加载结果的内存占用，不计入耗时
+                tracemalloc.start()
+                load_sheet_table(path, reader, reader_projection)
+                peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+                tracemalloc.stop()
+                results.append(loaded)
+                print(f"  {reader} {label}: {elapsed:.3f}s，内存峰值 {peak:.1f}MB")
+            full, projected = results
+            assert all(
+                full.rows[r][c - 1] == projected.rows[r][c - 1]
+                for r in range(full.max_row) for c in projected.loaded_cols
+            )
+
+
+def bench_parse_cache(args):
+    """重复加载同一个文件：每次重新解析 vs 读取磁盘上的解析缓存"""
+    table, _ = make_wide_tables(args.rows, args.cols)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(table.title)
+        for row in table.rows:
+            ws.append(row)
+        path = os.path.join(temp_dir, "workbook.xlsx")
+        wb.save(path)
+        cache = ParseCache(os.path.join(temp_dir, "cache"))
+
+        print(f"解析缓存基准测试: {args.rows}行 x {args.cols}列")
+        ((table_parsed,), _), elapsed_parse = timed(load_sheet_tables, [path], False, "openpyxl", None, cache, 1)
+        ((table_cached,), _), elapsed_cached = timed(load_sheet_tables, [path], False, "openpyxl", None, cache, 1)
+        assert table_cached.from_cache and table_parsed.rows == table_cached.rows
+        print(f"  首次加载（解析并写入缓存）: {elapsed_parse:.3f}s")
+        print(f"  再次加载（命中缓存）: {elapsed_cached:.3f}s")
+        print(f"  加速比: {elapsed_parse / elapsed_cached:.1f}x")
+
+
+def bench_preview(args):
+    """预览前10行 x 20列：完整加载工作簿后截取 vs 只读取预览范围"""
+    table, _ = make_wide_tables(args.rows, args.cols)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(table.title)
+        for row in table.rows:
+            ws.append(row)
+        path = os.path.join(temp_dir, "workbook.xlsx")
+        wb.save(path)
+
+        def preview_full_load():
+            wb_full = openpyxl.load_workbook(path, data_only=True)
+            ws_full = wb_full.active
+            return [[ws_full.cell(row=r, column=c).value for c in range(1, 21)] for r in range(1, 11)]
+
+        print(f"预览基准测试: {args.rows}行 x {args.cols}列，预览前10行 x 20列")
+        expected, elapsed_old = timed(preview_full_load)
+        preview, elapsed_new = timed(read_sheet_preview, path, 10, 20)
+        assert expected == [[preview.value(r, c) for c in range(1, 21)] for r in range(1, 11)]
+        print(f"  完整加载后截取: {elapsed_old:.3f}s")
+        print(f"  只读取预览范围: {elapsed_new:.4f}s")
+        print(f"  加速比: {elapsed_old / elapsed_new:.0f}x")
+
+
+BENCHMARKS = {
+    "column_alignment": bench_column_alignment,
+    "added_row_styles": bench_added_row_styles,
+    "highlight_modes": bench_highlight_modes,
+    "diff_engines": bench_diff_engines,
+    "row_fingerprints": bench_row_fingerprints,
+    "parallel_diff": bench_parallel_diff,
+    "parallel_load": bench_parallel_load,
+    "fast_reader": bench_fast_reader,
+    "column_projection": bench_column_projection,
+    "parse_cache": bench_parse_cache,
+    "preview": bench_preview,
+}
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="Excel文件比较工具性能基准测试")
+    parser.add_argument("name", choices=sorted(BENCHMARKS), help="基准测试名称")
+    parser.add_argument("--rows", type=int, default=1000, help="数据行数")
+    parser.add_argument("--cols", type=int, default=240, help="列数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="最大进程数（parallel_diff）")
+    parser.add_argument("--start-method", choices=multiprocessing.get_all_start_methods(),
+                        help="子进程启动方式，例如在Linux上用spawn模拟Windows（parallel_diff、parallel_load）")
+    args = parser.parse_args()
+    if args.start_method:
+        multiprocessing.set_start_method(args.start_method)
+    BENCHMARKS[args.name](args)
+
+
+if __name__ == "__main__":
+    main()
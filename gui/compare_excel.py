@@ -1,18 +1,46 @@
 import openpyxl
-from openpyxl.styles import PatternFill, Font, Border, Side, Alignment
-from openpyxl.utils import get_column_letter
+from openpyxl.styles import PatternFill
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.utils import get_column_letter, column_index_from_string, range_boundaries
+from openpyxl.utils.datetime import from_excel, from_ISO8601, CALENDAR_WINDOWS_1900, CALENDAR_MAC_1904
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.read_only import ReadOnlyCell
+from openpyxl.worksheet.dimensions import ColumnDimension
+from openpyxl.worksheet._reader import WorkSheetParser
 import os
+import hashlib
+import pickle
+import json
+import posixpath
+import zipfile
+from xml.etree import ElementTree
+from xml.parsers import expat
 import subprocess
 import stat
+import time
+from copy import copy, deepcopy
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+from itertools import islice
 import sys
 import queue
 import threading
+import multiprocessing
 import datetime
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
 import webbrowser
 import io
 
+# 可选依赖：NumPy用于向量化的单元格比较，未安装时使用纯Python实现
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # 全局队列：用于子线程与GUI线程通信
 log_queue = queue.Queue()
 progress_queue = queue.Queue()
@@ -26,11 +54,1552 @@ PROJECT_URL = "https://github.com/caifugao110/table-comparison-hyl"
 DEFAULT_APPEARANCE_MODE = "light"  # "dark", "light", "system"
 DEFAULT_COLOR_THEME = "blue"     # "blue", "green", "dark-blue"
 
+# 结果文件输出模式：完整格式在内存中编辑工作簿，流式输出逐行写出，适合超大文件
+OUTPUT_MODES = {"完整格式": "styled", "流式输出": "streaming"}
+# 差异标记方式：单元格填充逐单元格设置颜色，条件格式将标记合并为区域规则，适合差异很多的文件
+HIGHLIGHT_MODE_OPTIONS = {"单元格填充": "fills", "条件格式": "conditional"}
+# 数值表读取方式：快速读取直接解析XLSX中的XML，适合超大文件
+READER_OPTIONS = {"标准读取": "openpyxl", "快速读取": "fast"}
+
 # 初始化主题
 ctk.set_appearance_mode(DEFAULT_APPEARANCE_MODE)
 ctk.set_default_color_theme(DEFAULT_COLOR_THEME)
 
-def compare_excel_files(baseline_path, compare_path, output_baseline_path, output_compare_path, results_folder, original_filename, timestamp, header_row=3, key_fields=None, stop_event=None):
+class SheetTable:
+    """工作表数值表：按行主序紧凑保存单元格值，行号和列号均从1开始"""
+
+    def __init__(self, title, sheetnames, rows, loaded_cols=None, declared_dimensions=None):
+        self.title = title
+        self.sheetnames = sheetnames
+        # 工作表XML中声明的尺寸 (行数, 列数)，未声明时为None；实际范围以加载的数据为准
+        self.declared_dimensions = declared_dimensions
+        # 是否直接取自磁盘上的解析缓存
+        self.from_cache = False
+        # 按列投影加载时数据区只包含这些列（列号集合），None表示加载了全部列
+        self.loaded_cols = loaded_cols
+        self.max_col = max((len(row) for row in rows), default=0)
+        # 补齐长度不一的行，保证 rows[r - 1][c - 1] 可直接访问
+        self.rows = [row if len(row) == self.max_col else row + (None,) * (self.max_col - len(row)) for row in rows]
+        self.max_row = len(self.rows)
+        self._array = None
+        self._fingerprints = {}
+
+    def values_array(self):
+        """以NumPy object数组返回全部单元格值（需要安装NumPy），首次调用时构建并缓存"""
+        if self._array is None:
+            self._array = np.array(self.rows, dtype=object).reshape(self.max_row, self.max_col)
+        return self._array
+
+    @staticmethod
+    def row_projection(cols):
+        """返回按给定列截取行内容的函数，结果为值元组"""
+        # 连续的列用切片截取，比逐列取值快得多；列顺序较乱时才逐列取值
+        runs = []
+        for col in cols:
+            if runs and col == runs[-1][1] + 1:
+                runs[-1][1] = col
+            else:
+                runs.append([col, col])
+        if len(runs) == 1:
+            part = slice(runs[0][0] - 1, runs[0][1])
+            return lambda row: row[part]
+        if len(runs) <= 8:
+            slices = [slice(start - 1, end) for start, end in runs]
+            return lambda row: sum((row[part] for part in slices), ())
+        return itemgetter(*(col - 1 for col in cols))
+
+    def row_fingerprints(self, cols):
+        """按给定列计算每行内容的哈希指纹（下标为行号-1），同一组列只计算一次"""
+        cols = tuple(cols)
+        fingerprints = self._fingerprints.get(cols)
+        if fingerprints is None:
+            projection = self.row_projection(cols)
+            fingerprints = [hash(projection(row)) for row in self.rows]
+            self._fingerprints[cols] = fingerprints
+        return fingerprints
+
+    def value(self, row, col):
+        """获取单元格值，超出范围时返回None"""
+        if 1 <= row <= self.max_row and 1 <= col <= self.max_col:
+            return self.rows[row - 1][col - 1]
+        return None
+
+    def header_name(self, header_row, col):
+        """获取表头单元格去除首尾空白后的列名，空单元格返回空字符串"""
+        value = self.value(header_row, col)
+        return str(value).strip() if value is not None else ""
+
+    def dimension_summary(self):
+        """声明尺寸与实际使用范围的说明文字"""
+        declared = "未声明"
+        if self.declared_dimensions is not None:
+            declared = f"{self.declared_dimensions[0]}行 x {self.declared_dimensions[1]}列"
+        return f"声明尺寸 {declared}，实际使用范围 {self.max_row}行 x {self.max_col}列"
+
+    def is_loaded(self, col):
+        """数据区是否加载了该列"""
+        return self.loaded_cols is None or col in self.loaded_cols
+
+
+class ColumnProjection:
+    """列投影：只加载需要比较的列
+    
+    include为允许列表，exclude为排除列表，元素可以是表头列名或列号（从1开始，也可写作"列3"）；
+    always中的列（通常是特征列）始终加载。表头行及以上的行总是完整加载，
+    数据区中未选中的单元格在解析时直接跳过，值为None。
+    """
+
+    def __init__(self, header_row, include=None, exclude=None, always=()):
+        self.header_row = header_row
+        self.include = list(include) if include else None
+        self.exclude = list(exclude) if exclude else []
+        self.always = list(always)
+
+    @staticmethod
+    def _resolve_columns(entries, header_values):
+        """将列名或列号解析为列号集合，找不到的列名忽略"""
+        cols_by_name = {}
+        for col, value in enumerate(header_values, start=1):
+            if value is not None:
+                cols_by_name.setdefault(str(value).strip(), col)
+        cols = set()
+        for entry in entries:
+            col = cols_by_name.get(str(entry).strip())
+            if col is None:
+                try:
+                    col = int(str(entry).strip().replace("列", ""))
+                except ValueError:
+                    continue
+            if col >= 1:
+                cols.add(col)
+        return cols
+
+    def resolve(self, header_values):
+        """根据表头行的值计算数据区需要加载的列号集合，返回None表示全部加载"""
+        if self.include is None and not self.exclude:
+            return None
+        always = self._resolve_columns(self.always, header_values)
+        if self.include is not None:
+            return self._resolve_columns(self.include, header_values) | always
+        excluded = self._resolve_columns(self.exclude, header_values) - always
+        return {col for col in range(1, len(header_values) + 1) if col not in excluded}
+
+
+# XLSX包内部使用的命名空间和关系类型
+SHEET_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+RELATIONSHIPS_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PACKAGE_RELATIONSHIPS_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+
+def _read_relationships(zf, rels_path, base_dir):
+    """读取关系文件，返回 {关系ID: (关系类型, 包内路径)}"""
+    relationships = {}
+    if rels_path not in zf.namelist():
+        return relationships
+    root = ElementTree.fromstring(zf.read(rels_path))
+    for rel in root.iter(f"{{{PACKAGE_RELATIONSHIPS_NS}}}Relationship"):
+        target = rel.get("Target", "")
+        if rel.get("TargetMode") == "External":
+            continue
+        path = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(base_dir, target))
+        relationships[rel.get("Id")] = (rel.get("Type", ""), path)
+    return relationships
+
+
+def _read_shared_strings(zf, path, count=None):
+    """流式读取共享字符串表，字符串经过驻留，相同文本只保存一份；给出count时读够count个即停止"""
+    strings = []
+    if path is None:
+        return strings
+    si_tag = f"{{{SHEET_MAIN_NS}}}si"
+    t_tag = f"{{{SHEET_MAIN_NS}}}t"
+    r_tag = f"{{{SHEET_MAIN_NS}}}r"
+    with zf.open(path) as src:
+        for _, node in ElementTree.iterparse(src):
+            if node.tag != si_tag:
+                continue
+            # 与openpyxl一致：只取直接的<t>和富文本<r><t>，忽略注音<rPh>
+            parts = []
+            for child in node:
+                if child.tag == t_tag:
+                    parts.append(child.text or "")
+                elif child.tag == r_tag:
+                    text = child.find(t_tag)
+                    if text is not None:
+                        parts.append(text.text or "")
+            strings.append(sys.intern("".join(parts).replace("x005F_", "")))
+            node.clear()
+            if count is not None and len(strings) >= count:
+                break
+    return strings
+
+
+def _read_date_styles(zf, path):
+    """读取样式表，返回 (日期格式样式下标集合, 时长格式样式下标集合)"""
+    date_styles = set()
+    timedelta_styles = set()
+    if path is None:
+        return date_styles, timedelta_styles
+    root = ElementTree.fromstring(zf.read(path))
+    custom_formats = {
+        int(num_fmt.get("numFmtId")): num_fmt.get("formatCode")
+        for num_fmt in root.iter(f"{{{SHEET_MAIN_NS}}}numFmt")
+    }
+    cell_xfs = root.find(f"{{{SHEET_MAIN_NS}}}cellXfs")
+    if cell_xfs is None:
+        return date_styles, timedelta_styles
+    for idx, xf in enumerate(cell_xfs.iter(f"{{{SHEET_MAIN_NS}}}xf")):
+        num_fmt_id = int(xf.get("numFmtId", 0))
+        fmt = custom_formats.get(num_fmt_id) or BUILTIN_FORMATS.get(num_fmt_id)
+        if fmt is None:
+            continue
+        if is_date_format(fmt):
+            date_styles.add(idx)
+        if is_timedelta_format(fmt):
+            timedelta_styles.add(idx)
+    return date_styles, timedelta_styles
+
+
+def _cast_number(value):
+    """与openpyxl一致：含小数点或指数的数字转为float，否则转为int"""
+    if "." in value or "E" in value or "e" in value:
+        return float(value)
+    return int(value)
+
+
+def _read_workbook_info(zf):
+    """定位XLSX包中的工作簿、活动工作表、共享字符串表和样式表"""
+    workbook_path = "xl/workbook.xml"
+    for rel_type, rel_path in _read_relationships(zf, "_rels/.rels", "").values():
+        if rel_type.endswith("/officeDocument"):
+            workbook_path = rel_path
+    workbook_dir = posixpath.dirname(workbook_path)
+    workbook_rels = _read_relationships(
+        zf, posixpath.join(workbook_dir, "_rels", posixpath.basename(workbook_path) + ".rels"), workbook_dir
+    )
+    shared_strings_path = styles_path = None
+    for rel_type, rel_path in workbook_rels.values():
+        if rel_type.endswith("/sharedStrings"):
+            shared_strings_path = rel_path
+        elif rel_type.endswith("/styles"):
+            styles_path = rel_path
+    
+    workbook_root = ElementTree.fromstring(zf.read(workbook_path))
+    sheets = [
+        (sheet.get("name"), sheet.get(f"{{{RELATIONSHIPS_NS}}}id"))
+        for sheet in workbook_root.iter(f"{{{SHEET_MAIN_NS}}}sheet")
+    ]
+    if not sheets:
+        raise ValueError("工作簿中没有工作表")
+    active_index = 0
+    workbook_view = workbook_root.find(f"{{{SHEET_MAIN_NS}}}bookViews/{{{SHEET_MAIN_NS}}}workbookView")
+    if workbook_view is not None:
+        active_index = int(workbook_view.get("activeTab", 0))
+    if not 0 <= active_index < len(sheets):
+        active_index = 0
+    workbook_pr = workbook_root.find(f"{{{SHEET_MAIN_NS}}}workbookPr")
+    date1904 = workbook_pr is not None and workbook_pr.get("date1904") in ("1", "true")
+    title, sheet_rel_id = sheets[active_index]
+    return {
+        "title": title,
+        "sheetnames": [name for name, _ in sheets],
+        "sheet_path": workbook_rels[sheet_rel_id][1],
+        "epoch": CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900,
+        "shared_strings_path": shared_strings_path,
+        "styles_path": styles_path,
+    }
+
+
+def read_xlsx_values(path, projection=None):
+    """不经过openpyxl对象模型，直接解析XLSX包中活动工作表的单元格值
+    
+    用expat逐个事件解析工作表XML，不构建元素树；共享字符串解析为驻留的字符串表，
+    日期格式的数字转换为datetime，公式单元格取缓存的计算结果（与data_only=True一致）。
+    给出projection（ColumnProjection）时，数据区中未选中列的单元格不做类型转换，直接跳过。
+    行尾的空单元格和末尾的空行在解析过程中即被去掉，只保留实际使用的范围。
+    返回 (工作表名称, 全部工作表名称, 按行的值元组列表, 加载的列号集合, 声明的尺寸)
+    """
+    with zipfile.ZipFile(path) as zf:
+        workbook = _read_workbook_info(zf)
+        title = workbook["title"]
+        sheetnames = workbook["sheetnames"]
+        epoch = workbook["epoch"]
+        sheet_path = workbook["sheet_path"]
+        shared_strings_path = workbook["shared_strings_path"]
+        styles_path = workbook["styles_path"]
+        
+        shared_strings = _read_shared_strings(zf, shared_strings_path)
+        date_styles, timedelta_styles = _read_date_styles(zf, styles_path)
+        
+        rows = []
+        column_indexes = {}
+        # 样式下标保持为字符串，免去逐个单元格的int转换
+        date_styles = {str(idx) for idx in date_styles}
+        timedelta_styles = {str(idx) for idx in timedelta_styles}
+        # 工作表声明的尺寸只用于日志，常因残留的格式远大于实际数据
+        declared_dimensions = None
+        # 解析状态：当前行的行号和值列表，当前单元格的列号、类型、样式和文本片段
+        row_idx = col = 0
+        row_values = text = None
+        data_type = "n"
+        style = "0"
+        in_rph = False
+        # 列投影在解析完表头行后确定；skip_cell表示当前单元格不在投影中
+        loaded_cols = None
+        projection_pending = projection is not None
+        skip_cell = False
+        row_tag = f"{SHEET_MAIN_NS} row"
+        cell_tag = f"{SHEET_MAIN_NS} c"
+        value_tag = f"{SHEET_MAIN_NS} v"
+        text_tag = f"{SHEET_MAIN_NS} t"
+        rph_tag = f"{SHEET_MAIN_NS} rPh"
+        dimension_tag = f"{SHEET_MAIN_NS} dimension"
+        
+        # 按出现频率排列分支：单元格和值元素远多于行元素
+        def start_element(name, attrs):
+            nonlocal row_idx, col, row_values, text, data_type, style, in_rph, declared_dimensions
+            nonlocal loaded_cols, projection_pending, skip_cell
+            if name == cell_tag:
+                coordinate = attrs.get("r")
+                if coordinate:
+                    letters = coordinate.rstrip("0123456789")
+                    col = column_indexes.get(letters)
+                    if col is None:
+                        col = column_indexes[letters] = column_index_from_string(letters)
+                else:
+                    col += 1
+                data_type = attrs.get("t", "n")
+                style = attrs.get("s", "0")
+                text = None
+                skip_cell = loaded_cols is not None and col not in loaded_cols
+            elif name == value_tag or (name == text_tag and not in_rph):
+                if skip_cell:
+                    return
+                if text is None:
+                    text = []
+                parser.CharacterDataHandler = text.append
+            elif name == row_tag:
+                row_number = attrs.get("r")
+                row_idx = int(row_number) if row_number else row_idx + 1
+                row_values = []
+                col = 0
+                if projection_pending and row_idx > projection.header_row:
+                    header_values = rows[projection.header_row - 1] if len(rows) >= projection.header_row else ()
+                    loaded_cols = projection.resolve(header_values)
+                    projection_pending = False
+            elif name == rph_tag:
+                in_rph = True
+            elif name == dimension_tag:
+                _, _, max_col, max_row = range_boundaries(attrs.get("ref", ""))
+                declared_dimensions = (max_row, max_col)
+        
+        def end_element(name):
+            nonlocal in_rph
+            if name == value_tag or name == text_tag:
+                parser.CharacterDataHandler = None
+            elif name == cell_tag:
+                if skip_cell:
+                    return
+                value = "".join(text) if text else None
+                if value:
+                    if data_type == "n":
+                        value = _cast_number(value)
+                        if style in date_styles:
+                            try:
+                                value = from_excel(value, epoch, timedelta=style in timedelta_styles)
+                            except (OverflowError, ValueError):
+                                value = "#VALUE!"
+                    elif data_type == "s":
+                        value = shared_strings[int(value)]
+                    elif data_type == "b":
+                        value = bool(int(value))
+                    elif data_type == "d":
+                        value = from_ISO8601(value)
+                if col > len(row_values):
+                    if col - 1 > len(row_values):
+                        row_values.extend([None] * (col - 1 - len(row_values)))
+                    row_values.append(value)
+                else:
+                    row_values[col - 1] = value
+            elif name == row_tag:
+                # 去掉行尾的空单元格；空行不保存，遇到后续的非空行时再补齐，末尾的空行因此被自然丢弃
+                while row_values and row_values[-1] is None:
+                    row_values.pop()
+                if not row_values:
+                    return
+                # 缺失的行补为空行
+                if row_idx > len(rows):
+                    rows.extend([()] * (row_idx - 1 - len(rows)))
+                    rows.append(tuple(row_values))
+                else:
+                    rows[row_idx - 1] = tuple(row_values)
+            elif name == rph_tag:
+                in_rph = False
+        
+        parser = expat.ParserCreate(namespace_separator=" ")
+        parser.buffer_text = True
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        with zf.open(sheet_path) as src:
+            parser.ParseFile(src)
+    
+    return title, sheetnames, rows, loaded_cols, declared_dimensions
+
+
+class _PreviewComplete(Exception):
+    """预览所需的行已读够，用于提前结束expat解析"""
+
+
+def read_sheet_preview(path, max_rows, max_cols=None):
+    """只读取活动工作表左上角 max_rows 行 x max_cols 列（None表示不限列数）的单元格值
+    
+    工作表XML读到第max_rows行之后立即停止解析，共享字符串表也只解析到预览中用到的最大下标为止，
+    耗时与工作簿大小基本无关。返回SheetTable，declared_dimensions为工作表声明的尺寸。
+    """
+    with zipfile.ZipFile(path) as zf:
+        workbook = _read_workbook_info(zf)
+        
+        # 先收集预览范围内单元格的原始文本，再统一转换类型
+        raw_cells = []
+        cell = {}
+        declared_dimensions = None
+        row_idx = 0
+        sheet_ns = f"{SHEET_MAIN_NS} "
+        
+        def start_element(name, attrs):
+            nonlocal row_idx, declared_dimensions
+            if not name.startswith(sheet_ns):
+                return
+            tag = name[len(sheet_ns):]
+            if tag == "c":
+                coordinate = attrs.get("r")
+                col = column_index_from_string(coordinate.rstrip("0123456789")) if coordinate else cell.get("col", 0) + 1
+                cell.clear()
+                cell.update(col=col, type=attrs.get("t", "n"), style=int(attrs.get("s", 0)), text=[], capture=False)
+            elif tag == "v" or (tag == "t" and not cell.get("in_rph")):
+                cell["capture"] = True
+            elif tag == "rPh":
+                cell["in_rph"] = True
+            elif tag == "row":
+                row_number = attrs.get("r")
+                row_idx = int(row_number) if row_number else row_idx + 1
+                if row_idx > max_rows:
+                    raise _PreviewComplete()
+                cell.clear()
+            elif tag == "dimension":
+                _, _, max_col, max_row = range_boundaries(attrs.get("ref", ""))
+                declared_dimensions = (max_row, max_col)
+        
+        def end_element(name):
+            if not name.startswith(sheet_ns):
+                return
+            tag = name[len(sheet_ns):]
+            if tag == "c":
+                if (max_cols is None or cell["col"] <= max_cols) and cell["text"]:
+                    raw_cells.append((row_idx, cell["col"], cell["type"], cell["style"], "".join(cell["text"])))
+            elif tag in ("v", "t"):
+                cell["capture"] = False
+            elif tag == "rPh":
+                cell["in_rph"] = False
+            elif tag == "sheetData":
+                raise _PreviewComplete()
+        
+        def character_data(data):
+            if cell.get("capture"):
+                cell["text"].append(data)
+        
+        parser = expat.ParserCreate(namespace_separator=" ")
+        parser.buffer_text = True
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        parser.CharacterDataHandler = character_data
+        with zf.open(workbook["sheet_path"]) as src:
+            try:
+                parser.ParseFile(src)
+            except _PreviewComplete:
+                pass
+        
+        # 只解析到用到的最大共享字符串下标
+        shared_indexes = [int(text) for _, _, data_type, _, text in raw_cells if data_type == "s"]
+        shared_strings = _read_shared_strings(zf, workbook["shared_strings_path"], max(shared_indexes) + 1) if shared_indexes else []
+        date_styles, timedelta_styles = _read_date_styles(zf, workbook["styles_path"])
+    
+    rows = []
+    for row, col, data_type, style, text in raw_cells:
+        if data_type == "n":
+            value = _cast_number(text)
+            if style in date_styles:
+                try:
+                    value = from_excel(value, workbook["epoch"], timedelta=style in timedelta_styles)
+                except (OverflowError, ValueError):
+                    value = "#VALUE!"
+        elif data_type == "s":
+            value = shared_strings[int(text)]
+        elif data_type == "b":
+            value = bool(int(text))
+        elif data_type == "d":
+            value = from_ISO8601(text)
+        else:
+            value = text
+        while len(rows) < row:
+            rows.append([])
+        row_values = rows[row - 1]
+        row_values.extend([None] * (col - len(row_values)))
+        row_values[col - 1] = value
+    return SheetTable(workbook["title"], workbook["sheetnames"], [tuple(row) for row in rows], declared_dimensions=declared_dimensions)
+
+
+# 数值表加载后端：openpyxl只读模式，或直接解析XML的快速读取器
+SHEET_READERS = ("openpyxl", "fast")
+
+
+def load_sheet_table(path, reader="openpyxl", projection=None):
+    """加载活动工作表的单元格值，reader选择加载后端（见SHEET_READERS），projection为可选的列投影"""
+    if reader == "fast":
+        return SheetTable(*read_xlsx_values(path, projection))
+    if reader != "openpyxl":
+        raise ValueError(f"未知的读取后端: {reader}")
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)  # 只加载数据，不加载公式
+    try:
+        ws = wb.active
+        # 声明的尺寸常因残留的格式延伸到XFD1048576，不按它补齐行列，只记录下来用于日志
+        declared_dimensions = (ws.max_row, ws.max_column) if ws.max_row and ws.max_column else None
+        ws.reset_dimensions()
+        rows = []
+        loaded_cols = None
+        projection_pending = projection is not None
+        for row_idx, row in enumerate(ws.iter_rows(values_only=True), start=1):
+            # 列投影：表头行及以上完整保留，数据区只保留投影中的列，其余单元格值不再被引用
+            if projection_pending and row_idx > projection.header_row:
+                loaded_cols = projection.resolve(rows[projection.header_row - 1] if len(rows) >= projection.header_row else ())
+                if loaded_cols is not None:
+                    kept_indexes = sorted(col - 1 for col in loaded_cols)
+                projection_pending = False
+            if loaded_cols is not None:
+                projected = [None] * len(row)
+                for i in kept_indexes:
+                    if i < len(row):
+                        projected[i] = row[i]
+                row = projected
+            # 去掉行尾的空单元格；空行不保存，遇到后续的非空行时再补齐，末尾的空行因此被自然丢弃
+            end = len(row)
+            while end and row[end - 1] is None:
+                end -= 1
+            if end:
+                rows.extend([()] * (row_idx - 1 - len(rows)))
+                rows.append(tuple(row[:end]))
+        return SheetTable(ws.title, wb.sheetnames, rows, loaded_cols, declared_dimensions)
+    finally:
+        wb.close()
+
+
+# 两个文件合计超过该大小时才在子进程中并行加载，小文件的进程启动开销大于收益
+PARALLEL_LOAD_MIN_BYTES = 2 * 1024 * 1024
+
+
+# 解析缓存的默认容量上限，超出时按最近使用时间淘汰最旧的条目
+PARSE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# 缓存条目格式版本，数值表结构变化时递增，旧条目自然失效
+PARSE_CACHE_VERSION = 1
+
+
+def file_sha256(path):
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """数值表的磁盘缓存：同一个文件重复比较时直接读取解析结果
+    
+    条目以pickle保存在folder中，键由文件内容的SHA-256、活动工作表名称、表头行号和列投影组成，
+    与文件路径和修改时间无关。读取命中时更新条目的修改时间，总大小超过max_bytes时淘汰最久未用的条目。
+    """
+
+    def __init__(self, folder, max_bytes=PARSE_CACHE_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    def entry_path(self, path, header_row, projection=None, sha256=None):
+        """计算文件对应的缓存条目路径，sha256为已知的文件内容哈希时不再重新读取文件计算"""
+        with zipfile.ZipFile(path) as zf:
+            sheet_name = _read_workbook_info(zf)["title"]
+        projection_key = None
+        if projection is not None:
+            projection_key = (projection.header_row, projection.include, projection.exclude, projection.always)
+        key = repr((PARSE_CACHE_VERSION, sha256 or file_sha256(path), sheet_name, header_row, projection_key))
+        return os.path.join(self.folder, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".pkl")
+
+    def load(self, entry):
+        """读取缓存条目，未命中或条目损坏时返回None"""
+        try:
+            with open(entry, "rb") as f:
+                state = pickle.load(f)
+            os.utime(entry)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # 损坏的条目直接丢弃，重新解析
+            self._remove(entry)
+            return None
+        table = SheetTable(state["title"], state["sheetnames"], state["rows"], state["loaded_cols"], state["declared_dimensions"])
+        table.from_cache = True
+        return table
+
+    def store(self, entry, table):
+        """写入缓存条目（先写临时文件再原子替换），然后按容量淘汰旧条目"""
+        os.makedirs(self.folder, exist_ok=True)
+        state = {
+            "title": table.title,
+            "sheetnames": table.sheetnames,
+            "rows": table.rows,
+            "loaded_cols": table.loaded_cols,
+            "declared_dimensions": table.declared_dimensions,
+        }
+        temp_path = f"{entry}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, entry)
+        finally:
+            self._remove(temp_path)
+        self.evict()
+
+    def evict(self):
+        """总大小超过上限时，按最近使用时间从旧到新删除条目"""
+        entries = []
+        with os.scandir(self.folder) as it:
+            for item in it:
+                if item.name.endswith(".pkl"):
+                    info = item.stat()
+                    entries.append((info.st_mtime, info.st_size, item.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# 结果缓存中所有结果文件的总大小上限，超过时淘汰最久未用的比较结果
+RESULT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+# 结果缓存条目格式版本，结果文件的内容或格式变化时递增，旧条目自然失效
+RESULT_CACHE_VERSION = 1
+
+
+class ResultCache:
+    """比较结果的缓存：同一对文件以相同选项重复比较时直接返回上次生成的结果文件
+    
+    键由两个文件内容的SHA-256和影响结果的比较选项组成，与文件名和上传路径无关；
+    每个条目是folder中的一个JSON清单，记录结果文件的路径和比较输出。命中时更新清单的修改时间，
+    所有条目的结果文件总大小超过max_bytes时，按最近使用时间从旧到新删除条目及其结果文件。
+    janitor为结果目录的ResultsJanitor时，结果文件经由它删除，正在下载的文件不会被删除；
+    同时登记为它的on_remove，结果目录清理删除结果文件时一并删除引用这些文件的条目。
+    """
+
+    def __init__(self, folder, max_bytes=RESULT_CACHE_MAX_BYTES, janitor=None):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.janitor = janitor
+        if janitor is not None:
+            janitor.on_remove = self.forget_files
+
+    @staticmethod
+    def key(baseline_path, compare_path, options):
+        """计算缓存键，options为影响结果文件内容的比较选项（可JSON序列化的字典）"""
+        return ResultCache.key_from_hashes(file_sha256(baseline_path), file_sha256(compare_path), options)
+
+    @staticmethod
+    def key_from_hashes(baseline_sha256, compare_sha256, options):
+        """由已知的文件内容SHA-256计算缓存键，例如上传时已边接收边计算了哈希"""
+        key = json.dumps([RESULT_CACHE_VERSION, baseline_sha256, compare_sha256, options],
+                         ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _manifest_path(self, key):
+        return os.path.join(self.folder, key + ".json")
+
+    def lookup(self, key):
+        """返回命中条目的清单（files为结果文件路径，output为比较输出），未命中或结果文件已删除时返回None"""
+        manifest_path = self._manifest_path(key)
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            ParseCache._remove(manifest_path)
+            return None
+        if not manifest.get("files") or not all(os.path.exists(path) for path in manifest["files"]):
+            # 结果文件已被删除，条目失效
+            ParseCache._remove(manifest_path)
+            return None
+        try:
+            # 结果文件一并更新修改时间，结果目录清理按最近使用时间计算保留期
+            for path in [manifest_path] + manifest["files"]:
+                os.utime(path)
+        except OSError:
+            pass
+        return manifest
+
+    def store(self, key, files, output=""):
+        """记录一次比较的结果文件（先写临时文件再原子替换），然后按容量淘汰旧条目"""
+        os.makedirs(self.folder, exist_ok=True)
+        manifest_path = self._manifest_path(key)
+        temp_path = f"{manifest_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"files": [os.path.abspath(path) for path in files], "output": output}, f, ensure_ascii=False)
+            os.replace(temp_path, manifest_path)
+        finally:
+            ParseCache._remove(temp_path)
+        self.evict()
+
+    def evict(self):
+        """结果文件总大小超过上限时，按最近使用时间从旧到新删除条目和它的结果文件（保留最新的条目）"""
+        entries = []
+        with os.scandir(self.folder) as it:
+            for item in it:
+                if not item.name.endswith(".json"):
+                    continue
+                try:
+                    with open(item.path, "r", encoding="utf-8") as f:
+                        files = json.load(f)["files"]
+                    mtime = item.stat().st_mtime
+                except (OSError, ValueError, KeyError):
+                    continue
+                size = sum(os.path.getsize(path) for path in files if os.path.exists(path))
+                entries.append((mtime, size, item.path, files))
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, manifest_path, files in sorted(entries)[:-1]:
+            if total <= self.max_bytes:
+                break
+            # 先删除清单，之后的比较不再命中该条目；正在下载的结果文件保留，由结果目录清理按保留时长删除
+            ParseCache._remove(manifest_path)
+            for path in files:
+                if not os.path.exists(path):
+                    continue
+                file_size = os.path.getsize(path)
+                if self._remove_result(path):
+                    total -= file_size
+
+    def forget_files(self, paths):
+        """删除引用了任一给定结果文件的条目（结果文件已被删除）"""
+        removed = {os.path.abspath(path) for path in paths}
+        try:
+            with os.scandir(self.folder) as it:
+                manifest_paths = [item.path for item in it if item.name.endswith(".json")]
+        except FileNotFoundError:
+            return
+        for manifest_path in manifest_paths:
+            try:
+                with open(manifest_path, "r", encoding="utf-8") as f:
+                    files = json.load(f)["files"]
+            except (OSError, ValueError, KeyError):
+                continue
+            if removed.intersection(files):
+                ParseCache._remove(manifest_path)
+
+    def _remove_result(self, path):
+        """删除一个结果文件，成功时返回True"""
+        if self.janitor is not None:
+            return self.janitor.remove(path)
+        try:
+            # 结果文件被设置为只读，Windows上需要先恢复写权限才能删除
+            os.chmod(path, stat.S_IREAD | stat.S_IWRITE)
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+
+# 结果文件的默认保留时长（秒）、目录总大小上限和清理间隔（秒）
+RESULTS_TTL_SECONDS = 24 * 3600
+RESULTS_MAX_BYTES = 2 * 1024 * 1024 * 1024
+RESULTS_JANITOR_INTERVAL = 600
+# 修改时间在该秒数以内的文件视为正在生成，按大小清理时不删除
+RESULTS_MIN_AGE_SECONDS = 600
+# 只清理生成的结果文件，以点开头的文件（如 .gitkeep）和其他文件不处理
+RESULTS_JANITOR_SUFFIXES = (".xlsx",)
+
+
+class ResultsJanitor:
+    """结果目录的后台清理：删除超过保留时长的结果文件，目录总大小超过上限时从最旧的文件开始删除
+    
+    只处理 RESULTS_JANITOR_SUFFIXES 中的文件类型，以点开头的文件不处理。
+    
+    删除时先在锁内把文件原子地改名为 .deleting 再删除，正在下载的文件（acquire登记、release释放）不会被删除，
+    下载方在同一把锁内检查文件是否存在，因此不会出现打开到一半被删掉的情况。
+    metrics() 返回累计清理的文件数、回收的字节数和目录当前大小等指标，
+    on_cleanup(删除的文件数, 回收的字节数) 在某次清理删除了文件时调用；
+    on_remove(删除的文件路径列表) 同样在删除了文件时调用，结果缓存借此删除引用这些文件的条目。
+    """
+
+    def __init__(self, folder, ttl_seconds=RESULTS_TTL_SECONDS, max_bytes=RESULTS_MAX_BYTES,
+                 interval=RESULTS_JANITOR_INTERVAL, min_age_seconds=RESULTS_MIN_AGE_SECONDS, on_cleanup=None, on_remove=None):
+        self.folder = folder
+        self.on_cleanup = on_cleanup
+        self.on_remove = on_remove
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.min_age_seconds = min_age_seconds
+        self.lock = threading.Lock()
+        self.in_use = {}  # 文件路径 -> 正在进行的下载数
+        self.stats = {
+            "runs": 0,
+            "files_removed": 0,
+            "bytes_reclaimed": 0,
+            "errors": 0,
+            "last_run_at": None,
+            "last_run_seconds": None,
+            "last_files_removed": 0,
+            "last_bytes_reclaimed": 0,
+            "folder_files": 0,
+            "folder_bytes": 0,
+        }
+        self._thread = None
+        self._stop = threading.Event()
+
+    def acquire(self, path):
+        """登记一次下载，文件不存在（或已被清理）时返回False"""
+        with self.lock:
+            if not os.path.isfile(path):
+                return False
+            self.in_use[path] = self.in_use.get(path, 0) + 1
+            return True
+
+    def release(self, path):
+        """下载结束"""
+        with self.lock:
+            remaining = self.in_use.get(path, 0) - 1
+            if remaining > 0:
+                self.in_use[path] = remaining
+            else:
+                self.in_use.pop(path, None)
+
+    @staticmethod
+    def is_managed(name):
+        """文件是否由清理负责：结果文件和结果缓存清单，跳过以点开头的文件"""
+        return not name.startswith(".") and name.lower().endswith(RESULTS_JANITOR_SUFFIXES)
+
+    def run_once(self):
+        """执行一次清理，返回本次删除的文件数和回收的字节数"""
+        started = time.monotonic()
+        now = time.time()
+        files = []
+        leftovers = []
+        try:
+            with os.scandir(self.folder) as it:
+                for item in it:
+                    if not item.is_file():
+                        continue
+                    if item.name.endswith(".deleting"):
+                        # 上次改名后没有删掉的文件
+                        if self.is_managed(item.name[:-len(".deleting")]):
+                            leftovers.append(item.path)
+                        continue
+                    if not self.is_managed(item.name):
+                        continue
+                    info = item.stat()
+                    files.append((info.st_mtime, info.st_size, item.path))
+        except FileNotFoundError:
+            files = []
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        
+        # 先删除过期的文件，再按修改时间从旧到新删除，直到总大小不超过上限
+        expired = [entry for entry in files if now - entry[0] > self.ttl_seconds]
+        kept = [entry for entry in files if now - entry[0] <= self.ttl_seconds]
+        candidates = expired + [entry for entry in kept if now - entry[0] > self.min_age_seconds]
+        removed_paths = []
+        removed_bytes = 0
+        for mtime, size, path in candidates:
+            if now - mtime <= self.ttl_seconds and total <= self.max_bytes:
+                break
+            if self.remove(path):
+                removed_paths.append(path)
+                removed_bytes += size
+                total -= size
+        removed_files = len(removed_paths)
+        for path in leftovers:
+            self._delete(path)
+        
+        with self.lock:
+            self.stats["runs"] += 1
+            self.stats["files_removed"] += removed_files
+            self.stats["bytes_reclaimed"] += removed_bytes
+            self.stats["last_run_at"] = now
+            self.stats["last_run_seconds"] = round(time.monotonic() - started, 3)
+            self.stats["last_files_removed"] = removed_files
+            self.stats["last_bytes_reclaimed"] = removed_bytes
+            self.stats["folder_files"] = len(files) - removed_files
+            self.stats["folder_bytes"] = total
+        if removed_files and self.on_remove is not None:
+            self.on_remove(removed_paths)
+        if removed_files and self.on_cleanup is not None:
+            self.on_cleanup(removed_files, removed_bytes)
+        return removed_files, removed_bytes
+
+    def metrics(self):
+        """返回清理指标的副本"""
+        with self.lock:
+            return dict(self.stats, ttl_seconds=self.ttl_seconds, max_bytes=self.max_bytes, downloads_in_progress=sum(self.in_use.values()))
+
+    def start(self):
+        """启动后台清理线程，启动时先清理一次"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                with self.lock:
+                    self.stats["errors"] += 1
+            if self._stop.wait(self.interval):
+                break
+
+    def remove(self, path):
+        """删除结果文件：在锁内把未被下载的文件原子地改名，再删除，成功时返回True"""
+        trash_path = path + ".deleting"
+        with self.lock:
+            if path in self.in_use:
+                return False
+            try:
+                os.replace(path, trash_path)
+            except OSError:
+                # 文件已被删除，或在Windows上被其他程序打开
+                return False
+        return self._delete(trash_path)
+
+    def _delete(self, path):
+        try:
+            # 结果文件被设置为只读，Windows上需要先恢复写权限才能删除
+            os.chmod(path, stat.S_IREAD | stat.S_IWRITE)
+            os.remove(path)
+            return True
+        except OSError:
+            with self.lock:
+                self.stats["errors"] += 1
+            return False
+
+
+def load_sheet_tables(paths, parallel=True, reader="openpyxl", projection=None, cache=None, header_row=None, file_hashes=None):
+    """加载多个文件的数值表，返回 (数值表列表, 是否并行加载)
+    
+    parallel为True且文件较大时，每个文件在单独的进程中解析，总耗时约等于最大文件的加载时间；
+    cache为ParseCache时先按文件内容查找缓存，只解析未命中的文件，并将解析结果写回缓存；
+    file_hashes为 {文件路径: 内容SHA-256}，已知哈希的文件查找缓存时不再重新计算
+    """
+    tables = [None] * len(paths)
+    entries = [None] * len(paths)
+    if cache is not None:
+        for i, path in enumerate(paths):
+            entries[i] = cache.entry_path(path, header_row, projection, (file_hashes or {}).get(path))
+            tables[i] = cache.load(entries[i])
+    pending = [i for i, table in enumerate(tables) if table is None]
+    pending_paths = [paths[i] for i in pending]
+    
+    used_parallel = parallel and len(pending_paths) > 1 and sum(os.path.getsize(path) for path in pending_paths) >= PARALLEL_LOAD_MIN_BYTES
+    if used_parallel:
+        with ProcessPoolExecutor(max_workers=len(pending_paths)) as executor:
+            loaded = list(executor.map(load_sheet_table, pending_paths, [reader] * len(pending_paths), [projection] * len(pending_paths)))
+    else:
+        loaded = [load_sheet_table(path, reader, projection) for path in pending_paths]
+    
+    for i, table in zip(pending, loaded):
+        tables[i] = table
+        if cache is not None:
+            try:
+                cache.store(entries[i], table)
+            except OSError:
+                # 缓存写入失败（如磁盘已满）不影响本次比较
+                pass
+    return tables, used_parallel
+
+
+def read_sheet_rows(path, row_numbers, width):
+    """流式读取活动工作表中指定行的完整单元格值，返回 {行号: 补齐到width列的值元组}"""
+    wanted = set(row_numbers)
+    values = {}
+    if not wanted:
+        return values
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        ws.reset_dimensions()
+        for row_idx, row in enumerate(ws.iter_rows(max_row=max(wanted), values_only=True), start=1):
+            if row_idx in wanted:
+                values[row_idx] = (tuple(row) + (None,) * width)[:width]
+    finally:
+        wb.close()
+    return values
+
+
+def match_rows_by_content(rows_baseline, rows_compare):
+    """按整行内容匹配行：基准行号 -> 比较行号
+    
+    将比较文件的行内容哈希到多重映射中，内容相同的行按出现顺序依次消费，
+    结果与逐行顺序查找首个未使用的相同行一致，但耗时与行数成线性关系。
+    """
+    compare_rows_by_content = {}
+    for row_compare, content in enumerate(rows_compare, start=1):
+        compare_rows_by_content.setdefault(content, deque()).append(row_compare)
+    
+    row_mapping = {}
+    for row_baseline, content in enumerate(rows_baseline, start=1):
+        candidates = compare_rows_by_content.get(content)
+        if candidates:
+            row_mapping[row_baseline] = candidates.popleft()
+    return row_mapping
+
+
+def skip_identical_rows(table_baseline, table_compare, row_mapping, compared_cols):
+    """用行指纹筛掉对齐列内容完全相同的匹配行，返回 (仍需逐单元格比较的行映射, 跳过的行数)
+    
+    指纹只用于快速找出一定有变化的行，指纹相同的行确认对齐列的值全部相等后才跳过
+    """
+    if not compared_cols:
+        return {}, len(row_mapping)
+    fingerprints_baseline = table_baseline.row_fingerprints(col_baseline for col_baseline, _ in compared_cols)
+    fingerprints_compare = table_compare.row_fingerprints(col_compare for _, col_compare in compared_cols)
+    # 指纹不同的行一定有变化；指纹相同时哈希可能碰撞（如 hash(-1) == hash(-2)），再比较对齐列的值确认
+    values_baseline = SheetTable.row_projection([col_baseline for col_baseline, _ in compared_cols])
+    values_compare = SheetTable.row_projection([col_compare for _, col_compare in compared_cols])
+    rows_baseline = table_baseline.rows
+    rows_compare = table_compare.rows
+    remaining = {
+        row_baseline: row_compare for row_baseline, row_compare in row_mapping.items()
+        if fingerprints_baseline[row_baseline - 1] != fingerprints_compare[row_compare - 1]
+        or values_baseline(rows_baseline[row_baseline - 1]) != values_compare(rows_compare[row_compare - 1])
+    }
+    return remaining, len(row_mapping) - len(remaining)
+
+
+def diff_cells_python(table_baseline, table_compare, row_mapping, compared_cols):
+    """逐单元格比较匹配行，返回 [(基准行, 基准列, 比较行, 比较列)]"""
+    rows_baseline = table_baseline.rows
+    rows_compare = table_compare.rows
+    changed_cells = []
+    for row_baseline, row_compare in row_mapping.items():
+        values_baseline = rows_baseline[row_baseline - 1]
+        values_compare = rows_compare[row_compare - 1]
+        for col_baseline, col_compare in compared_cols:
+            # 只在值不同时标记为黄色（数值变化）
+            if values_baseline[col_baseline - 1] != values_compare[col_compare - 1]:
+                changed_cells.append((row_baseline, col_baseline, row_compare, col_compare))
+    return changed_cells
+
+
+def diff_cells_numpy(table_baseline, table_compare, row_mapping, compared_cols):
+    """按列向量化比较匹配行，结果与diff_cells_python完全一致（顺序也相同）
+    
+    单元格值放入object数组，比较时仍使用Python的相等语义（1 == 1.0、None、日期等），
+    按匹配行号一次性取出对齐的列后整块比较，再批量取出发生变化的坐标。
+    """
+    if not row_mapping or not compared_cols:
+        return []
+    rows_b = np.fromiter(row_mapping.keys(), dtype=np.intp, count=len(row_mapping))
+    rows_c = np.fromiter(row_mapping.values(), dtype=np.intp, count=len(row_mapping))
+    cols_b = np.array([col_baseline for col_baseline, _ in compared_cols], dtype=np.intp)
+    cols_c = np.array([col_compare for _, col_compare in compared_cols], dtype=np.intp)
+    values_b = table_baseline.values_array()[np.ix_(rows_b - 1, cols_b - 1)]
+    values_c = table_compare.values_array()[np.ix_(rows_c - 1, cols_c - 1)]
+    changed = np.not_equal(values_b, values_c).astype(bool)
+    row_indexes, col_indexes = np.nonzero(changed)
+    return list(zip(
+        rows_b[row_indexes].tolist(), cols_b[col_indexes].tolist(),
+        rows_c[row_indexes].tolist(), cols_c[col_indexes].tolist(),
+    ))
+
+
+# 多进程比较：匹配行少于该数量时进程启动开销大于收益，仍在当前进程中比较
+PARALLEL_DIFF_MIN_ROWS = 20000
+
+# 子进程中的比较数据，fork方式下由进程池初始化函数设置一次，各数据块只传递行下标范围
+_diff_worker_state = None
+
+
+def _init_diff_worker(rows_baseline, rows_compare, compared_cols):
+    global _diff_worker_state
+    _diff_worker_state = (rows_baseline, rows_compare, compared_cols)
+
+
+def _diff_rows(rows_baseline, rows_compare, compared_cols, start=0):
+    """比较一个数据块中对应的行，返回 [(匹配行下标, 对齐列下标)]，start为数据块第一行的下标"""
+    indexes = [(col_baseline - 1, col_compare - 1) for col_baseline, col_compare in compared_cols]
+    changed = []
+    for i, (values_baseline, values_compare) in enumerate(zip(rows_baseline, rows_compare), start):
+        for k, (index_baseline, index_compare) in enumerate(indexes):
+            if values_baseline[index_baseline] != values_compare[index_compare]:
+                changed.append((i, k))
+    return changed
+
+
+def _diff_chunk(bounds):
+    """比较 [start, end) 范围内的匹配行（数据来自进程池初始化时设置的比较数据）"""
+    rows_baseline, rows_compare, compared_cols = _diff_worker_state
+    start, end = bounds
+    return _diff_rows(rows_baseline[start:end], rows_compare[start:end], compared_cols, start)
+
+
+def _fork_start_method():
+    """子进程是否以fork方式启动（Linux默认），Windows和macOS默认为spawn"""
+    return multiprocessing.get_start_method() == "fork"
+
+
+def diff_cells_parallel(table_baseline, table_compare, row_mapping, compared_cols, workers, progress=None):
+    """把匹配行切分成数据块，在多个进程中并行比较，按块顺序合并，结果与diff_cells_python完全一致
+    
+    fork方式下匹配行的数据在创建进程池时由子进程直接继承，不需要序列化，之后每个数据块只传递行下标范围；
+    spawn方式（Windows的GUI程序）下每个数据块只序列化自己的行，全部数据合计只传递一次，
+    而不是通过初始化函数给每个子进程各传一份完整数据。子进程只返回变化单元格的下标。
+    progress: 可选的回调，每合并一个数据块后以已比较的行数调用
+    """
+    mapped_rows = list(row_mapping.items())
+    if not mapped_rows or not compared_cols:
+        return []
+    rows_baseline = [table_baseline.rows[row_baseline - 1] for row_baseline, _ in mapped_rows]
+    rows_compare = [table_compare.rows[row_compare - 1] for _, row_compare in mapped_rows]
+    # 每个进程分到多个数据块，行的差异分布不均时负载也能保持均衡
+    chunk_size = -(-len(mapped_rows) // (workers * 4))
+    bounds = [(start, min(start + chunk_size, len(mapped_rows))) for start in range(0, len(mapped_rows), chunk_size)]
+    
+    changed_cells = []
+    if _fork_start_method():
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_diff_worker,
+                                       initargs=(rows_baseline, rows_compare, compared_cols))
+        chunks = executor.map(_diff_chunk, bounds)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        chunks = executor.map(
+            _diff_rows,
+            [rows_baseline[start:end] for start, end in bounds],
+            [rows_compare[start:end] for start, end in bounds],
+            [compared_cols] * len(bounds),
+            [start for start, _ in bounds]
+        )
+    with executor:
+        for (_, end), chunk in zip(bounds, chunks):
+            for i, k in chunk:
+                row_baseline, row_compare = mapped_rows[i]
+                col_baseline, col_compare = compared_cols[k]
+                changed_cells.append((row_baseline, col_baseline, row_compare, col_compare))
+            if progress is not None:
+                progress(end)
+    return changed_cells
+
+
+# 单元格比较引擎："auto" 安装了NumPy时使用向量化比较，否则逐单元格比较
+DIFF_ENGINES = ("auto", "numpy", "python")
+
+
+def diff_matched_cells(table_baseline, table_compare, row_mapping, compared_cols, engine="auto", workers=1, progress=None):
+    """比较匹配行的对齐列，返回 (变化单元格列表, 实际使用的引擎)
+    
+    workers: 比较进程数，0表示使用全部CPU核心；大于1且匹配行足够多时（numpy引擎除外）使用多进程比较
+    progress: 可选的回调，以已比较的行数调用；单进程比较时匹配行按DIFF_PROGRESS_BLOCK_ROWS分块比较，结果不变
+    """
+    if engine == "numpy" and np is None:
+        raise ValueError("未安装NumPy，无法使用numpy比较引擎")
+    workers = workers or os.cpu_count() or 1
+    if engine != "numpy" and workers > 1 and len(row_mapping) >= PARALLEL_DIFF_MIN_ROWS:
+        return diff_cells_parallel(table_baseline, table_compare, row_mapping, compared_cols, workers, progress), f"parallel({workers}进程)"
+    if engine == "numpy" or (engine == "auto" and np is not None):
+        diff_cells, used_engine = diff_cells_numpy, "numpy"
+    else:
+        diff_cells, used_engine = diff_cells_python, "python"
+    if progress is None:
+        return diff_cells(table_baseline, table_compare, row_mapping, compared_cols), used_engine
+    # 各引擎都按匹配行的顺序输出，分块比较后依次拼接与整体比较的结果相同
+    changed_cells = []
+    mapped_rows = iter(row_mapping.items())
+    processed = 0
+    while processed < len(row_mapping):
+        block = dict(islice(mapped_rows, DIFF_PROGRESS_BLOCK_ROWS))
+        changed_cells.extend(diff_cells(table_baseline, table_compare, block, compared_cols))
+        processed += len(block)
+        progress(processed)
+    return changed_cells, used_engine
+
+
+def plan_diff_rows(baseline_row_count, added_row_list, rows_compare, key_indexes_compare, key_to_row, data_start_row):
+    """一次性计算差异结果文件的最终行顺序
+    
+    新增行放在比较文件中其上一行对应的基准行之后（连续的新增行沿用同一位置并保持原有顺序），
+    上方没有数据行的新增行放在第一个数据行之前，找不到对应基准行的新增行放在末尾。
+    返回按输出顺序排列的 (来源, 行号) 列表，来源为 "baseline"（基准行号）或 "added"（比较行号）。
+    """
+    anchor_of = {}  # 比较行号 -> 插入位置之前的基准行号，None表示末尾
+    added_after = {}  # 基准行号 -> 紧随其后的新增行
+    added_at_end = []
+    for row_compare in sorted(added_row_list):
+        prev_row = row_compare - 1
+        if prev_row in anchor_of:
+            anchor = anchor_of[prev_row]
+        elif prev_row < data_start_row:
+            anchor = data_start_row - 1
+        else:
+            prev_values = rows_compare[prev_row - 1]
+            anchor = key_to_row.get(tuple(prev_values[i] for i in key_indexes_compare))
+        anchor_of[row_compare] = anchor
+        if anchor is None:
+            added_at_end.append(row_compare)
+        else:
+            added_after.setdefault(anchor, []).append(row_compare)
+    
+    plan = []
+    for row_baseline in range(1, baseline_row_count + 1):
+        plan.append(("baseline", row_baseline))
+        for row_compare in added_after.get(row_baseline, ()):
+            plan.append(("added", row_compare))
+    plan.extend(("added", row_compare) for row_compare in added_at_end)
+    return plan
+
+
+def plan_highlight_runs(diff_plan, changed_cells, deleted_row_list, max_col):
+    """把基准文件上的标记换算到差异结果的输出行号
+    
+    返回 (数值变化区段, 删除行区段, 新增行区段)，区段格式为 (行号, 起始列, 结束列)
+    """
+    output_row_of = {}
+    added_runs = []
+    for output_row, (source, row) in enumerate(diff_plan, start=1):
+        if source == "baseline":
+            output_row_of[row] = output_row
+        else:
+            added_runs.append((output_row, 1, max_col))
+    changed_runs = [(output_row_of[row_baseline], col_baseline, col_baseline) for row_baseline, col_baseline, _, _ in changed_cells]
+    deleted_runs = [(output_row_of[row_baseline], 1, max_col) for row_baseline in deleted_row_list]
+    return changed_runs, deleted_runs, added_runs
+
+
+# 流式输出模式下可以保留的格式
+STREAMING_FIDELITY_OPTIONS = ("column_widths", "row_heights", "number_formats", "fills", "fonts", "borders", "alignment")
+
+
+class StyleRegistry:
+    """输出工作簿的共享样式缓存
+    
+    每种 (源样式, 标记填充) 组合只解析并登记到输出工作簿一次，
+    之后所有单元格直接复用同一份样式数组，不再逐单元格创建样式对象。
+    """
+
+    def __init__(self, ws, fidelity=STREAMING_FIDELITY_OPTIONS):
+        self.ws = ws
+        self.fidelity = set(fidelity)
+        self._styles = {}
+        self._filled_styles = {}
+
+    def apply(self, cell, source_cell=None, fill=None):
+        """把源单元格的样式（按保真度选项）和标记填充应用到输出单元格"""
+        style_id = source_cell._style_id if source_cell is not None else 0
+        key = (style_id, fill)
+        style = self._styles.get(key)
+        if style is None:
+            template = WriteOnlyCell(self.ws)
+            if style_id:
+                if "number_formats" in self.fidelity:
+                    template.number_format = source_cell.number_format
+                if "fonts" in self.fidelity:
+                    template.font = source_cell.font
+                if "borders" in self.fidelity:
+                    template.border = source_cell.border
+                if "alignment" in self.fidelity:
+                    template.alignment = source_cell.alignment
+                if "fills" in self.fidelity:
+                    template.fill = source_cell.fill
+            if fill is not None:
+                template.fill = fill
+            style = self._styles[key] = template._style
+        cell._style = copy(style)
+
+    def apply_fill(self, cell, fill, template_style=None):
+        """在同一工作簿内为单元格叠加标记填充
+        
+        样式取自template_style（默认为单元格自身的样式），相同的 (样式, 填充) 组合只解析一次。
+        """
+        source_style = template_style if template_style is not None else cell._style
+        if source_style is None:
+            # 新建的空单元格还没有样式数组
+            source_style = StyleArray()
+        key = (tuple(source_style), fill)
+        style = self._filled_styles.get(key)
+        if style is None:
+            cell._style = copy(source_style)
+            if fill is not None:
+                cell.fill = fill
+            style = self._filled_styles[key] = copy(cell._style)
+        cell._style = copy(style)
+
+
+class StyledSheetReader:
+    """以只读流式模式逐行读取第一个工作表的单元格（含样式）、列宽和行高"""
+
+    def __init__(self, path):
+        self.wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        self.ws = self.wb.active
+        # 列宽：[(起始列, 结束列, 宽度)]，读到第一行时已解析完成
+        self.column_widths = []
+
+    def iter_rows(self):
+        """逐行返回 (行号, {列号: 单元格}, 行高)，只包含源文件中实际存在的行"""
+        ws = self.ws
+        with ws._get_source() as src:
+            parser = WorkSheetParser(src, ws._shared_strings, data_only=True, epoch=self.wb.epoch,
+                                     date_formats=self.wb._date_formats, timedelta_formats=self.wb._timedelta_formats)
+            for row_idx, cells in parser.parse():
+                if not self.column_widths:
+                    for attrs in parser.column_dimensions.values():
+                        if "width" in attrs:
+                            self.column_widths.append((int(attrs["min"]), int(attrs["max"]), float(attrs["width"])))
+                height = parser.row_dimensions.get(str(row_idx), {}).get("ht")
+                row_cells = {cell["column"]: ReadOnlyCell(ws, **cell) for cell in cells}
+                yield row_idx, row_cells, float(height) if height is not None else None
+
+    def read_row(self, row):
+        """读取指定行的单元格，读到该行后立即停止"""
+        for row_idx, row_cells, _ in self.iter_rows():
+            if row_idx >= row:
+                return row_cells if row_idx == row else {}
+        return {}
+
+    def close(self):
+        self.wb.close()
+
+
+def write_streaming_sheet(source_path, output_path, title, max_col, fidelity=STREAMING_FIDELITY_OPTIONS,
+                          cell_fills=None, row_fills=None, extra_rows=None, template_row=None, highlights=None):
+    """以write_only模式流式写出结果工作簿，内存占用与工作表大小无关
+    
+    cell_fills: {行号: {列号: 填充}}，单元格标记（数值变化）
+    row_fills: {行号: 填充}，整行标记（删除行/新增行）
+    extra_rows: {源行号: [(值列表, 填充), ...]}，紧随该源行写入的额外行（差异结果中的新增行），
+                格式取自源文件的template_row行
+    highlights: [(填充, 区段列表), ...]，以条件格式规则写入的标记（按输出行号），见add_highlight_rules
+    """
+    cell_fills = cell_fills or {}
+    row_fills = row_fills or {}
+    extra_rows = extra_rows or {}
+    fidelity = set(fidelity)
+    
+    # 新增行的格式模板
+    template_cells = {}
+    if extra_rows and template_row:
+        template_reader = StyledSheetReader(source_path)
+        try:
+            template_cells = template_reader.read_row(template_row)
+        finally:
+            template_reader.close()
+    
+    wb_out = openpyxl.Workbook(write_only=True)
+    ws_out = wb_out.create_sheet(title)
+    registry = StyleRegistry(ws_out, fidelity)
+    output_row = 0
+    
+    def append_row(out, height=None):
+        nonlocal output_row
+        output_row += 1
+        if height is not None and "row_heights" in fidelity:
+            ws_out.row_dimensions[output_row].height = height
+        ws_out.append(out)
+    
+    def write_extra_rows(source_row):
+        for values, fill in extra_rows.get(source_row, ()):
+            out = []
+            for col in range(1, max(max_col, len(values)) + 1):
+                cell = WriteOnlyCell(ws_out, value=values[col - 1] if col <= len(values) else None)
+                registry.apply(cell, template_cells.get(col), fill)
+                out.append(cell)
+            append_row(out)
+    
+    reader = StyledSheetReader(source_path)
+    try:
+        next_row = 1
+        for row_idx, row_cells, height in reader.iter_rows():
+            if output_row == 0 and "column_widths" in fidelity:
+                # 列宽必须在写入第一行之前设置
+                for min_col, max_col_dim, width in reader.column_widths:
+                    letter = get_column_letter(min_col)
+                    ws_out.column_dimensions[letter] = ColumnDimension(ws_out, index=letter, min=min_col, max=max_col_dim, width=width)
+            # 源文件中缺失的行写为空行
+            while next_row < row_idx:
+                append_row([])
+                write_extra_rows(next_row)
+                next_row += 1
+            
+            row_fill = row_fills.get(row_idx)
+            fills = cell_fills.get(row_idx, {})
+            width = max(max(row_cells, default=0), max_col if row_fill is not None else 0, max(fills, default=0))
+            out = []
+            for col in range(1, width + 1):
+                source_cell = row_cells.get(col)
+                fill = row_fill if row_fill is not None else fills.get(col)
+                if fill is None and (source_cell is None or not source_cell.has_style):
+                    out.append(source_cell.value if source_cell is not None else None)
+                    continue
+                cell = WriteOnlyCell(ws_out, value=source_cell.value if source_cell is not None else None)
+                registry.apply(cell, source_cell, fill)
+                out.append(cell)
+            append_row(out, height)
+            write_extra_rows(row_idx)
+            next_row = row_idx + 1
+        
+        # 锚定在源文件最后一行之后的额外行
+        for source_row in sorted(r for r in extra_rows if r >= next_row):
+            write_extra_rows(source_row)
+    finally:
+        reader.close()
+    
+    for fill, runs in highlights or ():
+        add_highlight_rules(ws_out, fill, runs)
+    wb_out.save(output_path)
+
+
+# 标记方式：fills 逐单元格设置填充；conditional 将标记合并为矩形区域后写成条件格式规则
+HIGHLIGHT_MODES = ("fills", "conditional")
+
+
+def coalesce_ranges(runs):
+    """把按行的列区段合并为尽量少的矩形区域
+    
+    runs: 可迭代的 (行号, 起始列, 结束列)
+    返回 [(起始行, 起始列, 结束行, 结束列)]：同一行内相邻的区段先合并，
+    再把连续行上列范围完全相同的区段合并为一个矩形
+    """
+    runs_by_row = {}
+    for row, col_start, col_end in runs:
+        runs_by_row.setdefault(row, []).append((col_start, col_end))
+    
+    rects = []
+    open_rects = {}  # (起始列, 结束列) -> 起始行，只包含上一行的区段
+    last_row = None
+    for row in sorted(runs_by_row):
+        # 合并同一行内重叠或相邻的区段
+        row_runs = []
+        for col_start, col_end in sorted(runs_by_row[row]):
+            if row_runs and col_start <= row_runs[-1][1] + 1:
+                row_runs[-1] = (row_runs[-1][0], max(row_runs[-1][1], col_end))
+            else:
+                row_runs.append((col_start, col_end))
+        
+        next_open = {}
+        for run in row_runs:
+            if last_row == row - 1 and run in open_rects:
+                next_open[run] = open_rects.pop(run)
+            else:
+                next_open[run] = row
+        for (col_start, col_end), start_row in open_rects.items():
+            rects.append((start_row, col_start, last_row, col_end))
+        open_rects = next_open
+        last_row = row
+    for (col_start, col_end), start_row in open_rects.items():
+        rects.append((start_row, col_start, last_row, col_end))
+    return rects
+
+
+def add_highlight_rules(ws, fill, runs):
+    """把标记区段合并为矩形区域，以一条条件格式规则写入工作表，返回区域数量"""
+    rects = coalesce_ranges(runs)
+    if not rects:
+        return 0
+    sqref = " ".join(
+        f"{get_column_letter(col_start)}{start_row}:{get_column_letter(col_end)}{end_row}"
+        for start_row, col_start, end_row, col_end in sorted(rects)
+    )
+    ws.conditional_formatting.add(sqref, FormulaRule(formula=["TRUE"], fill=fill))
+    return len(rects)
+
+
+# 进度事件的阶段，整体进度按阶段均分
+PROGRESS_PHASES = ("加载文件", "行匹配", "单元格比较", "标记新增和删除行", "保存结果文件")
+# 同一阶段内两次进度事件的最小间隔（秒）
+PROGRESS_MIN_INTERVAL = 0.5
+# 报告进度时单元格比较按该行数分块，每块比较完更新一次进度
+DIFF_PROGRESS_BLOCK_ROWS = 10000
+
+
+class ProgressReporter:
+    """把比较进度整理为结构化事件，并限制发送频率
+    
+    事件为字典：phase（阶段名）、phase_index（从1开始）、phase_count、processed、total、
+    percent（整体进度百分比，各阶段均分）、elapsed_seconds（已用时间）、
+    eta_seconds（按当前阶段的速度估计的阶段剩余时间，无法估计时为None）。
+    阶段开始、阶段结束和比较完成时总是发送，阶段内两次更新的间隔不小于min_interval秒。
+    """
+    def __init__(self, callback=None, min_interval=PROGRESS_MIN_INTERVAL):
+        self.callback = callback
+        self.min_interval = min_interval
+        self.started_at = time.monotonic()
+        self.phase = None
+        self.phase_index = 0
+        self.phase_started_at = self.started_at
+        self.processed = 0
+        self.total = 0
+        self.last_sent = 0.0
+
+    def start(self, phase, total):
+        """进入新阶段，total为该阶段的工作量（行数或文件数）"""
+        self.phase = phase
+        self.phase_index = PROGRESS_PHASES.index(phase) + 1
+        self.phase_started_at = time.monotonic()
+        self.processed = 0
+        self.total = total
+        self._emit()
+
+    def update(self, processed):
+        """更新当前阶段已完成的工作量，阶段结束时总是发送"""
+        self.processed = processed
+        if processed >= self.total or time.monotonic() - self.last_sent >= self.min_interval:
+            self._emit()
+
+    def finish(self):
+        """比较完成"""
+        self.phase = "完成"
+        self.phase_index = len(PROGRESS_PHASES)
+        self.processed = self.total
+        self._emit()
+
+    def _emit(self):
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        self.last_sent = now
+        fraction = min(self.processed / self.total, 1.0) if self.total else 0.0
+        if self.phase == "完成":
+            fraction = 1.0
+        eta_seconds = None
+        if self.processed and self.total:
+            eta_seconds = round((now - self.phase_started_at) / self.processed * max(self.total - self.processed, 0), 1)
+        self.callback({
+            "phase": self.phase,
+            "phase_index": self.phase_index,
+            "phase_count": len(PROGRESS_PHASES),
+            "processed": self.processed,
+            "total": self.total,
+            "percent": round((self.phase_index - 1 + fraction) / len(PROGRESS_PHASES) * 100, 1),
+            "elapsed_seconds": round(now - self.started_at, 1),
+            "eta_seconds": eta_seconds,
+        })
+
+
+def compare_excel_files(baseline_path, compare_path, output_baseline_path, output_compare_path, results_folder, original_filename, timestamp, header_row=3, key_fields=None, stop_event=None, output_mode="styled", fidelity=None, highlight_mode="fills", diff_engine="auto", diff_workers=1, parallel_load=True, reader="openpyxl", include_columns=None, exclude_columns=None, cache_dir=None, table_cache=None, progress_callback=None, file_hashes=None):
     # 检查停止事件的辅助函数
     def check_stop():
         if stop_event and stop_event.is_set():
@@ -43,13 +1612,53 @@ def compare_excel_files(baseline_path, compare_path, output_baseline_path, outpu
     fill_added = PatternFill(start_color="00FF00", end_color="00FF00", fill_type="solid")      # 绿色：新增（在基准基础上）
     fill_deleted = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")    # 红色：删除（在基准基础上）
     
+    # 列投影：只加载特征列和需要比较的列（未指定特征列时默认前三列）
+    projection = None
+    if include_columns or exclude_columns:
+        projection = ColumnProjection(header_row, include_columns, exclude_columns, always=key_fields or [1, 2, 3])
+    # 解析缓存：重复比较同一个文件时直接读取上次的解析结果
+    cache = ParseCache(cache_dir) if cache_dir else None
+    # 结构化进度事件：阶段、已处理/总量、整体百分比和预计剩余时间
+    progress = ProgressReporter(progress_callback)
+    
     try:
         if check_stop():
             return False
+        progress.start("加载文件", 2)
             
-        # 加载工作簿
-        wb_baseline = openpyxl.load_workbook(baseline_path, data_only=True)  # 只加载数据，不加载公式
-        wb_compare = openpyxl.load_workbook(compare_path, data_only=True)
+        # 会话缓存：对话框中已经加载过且未修改的文件直接复用（列投影时数值表不完整，不参与会话缓存）
+        use_table_cache = table_cache is not None and projection is None
+        tables = {}
+        if use_table_cache:
+            for path in (baseline_path, compare_path):
+                # 选择文件后已开始的后台预加载，等待它结束后直接复用
+                while not table_cache.wait(path, 0.2):
+                    if check_stop():
+                        return False
+                cached = table_cache.lookup(path)
+                if cached is not None:
+                    tables[path] = cached
+        reused_paths = set(tables)
+        
+        # 以只读流式模式加载数值表，带样式的工作簿只在写出结果时才打开
+        pending_paths = [path for path in dict.fromkeys((baseline_path, compare_path)) if path not in tables]
+        loaded_tables, loaded_in_parallel = load_sheet_tables(pending_paths, parallel_load, reader, projection, cache, header_row, file_hashes)
+        for path, table in zip(pending_paths, loaded_tables):
+            tables[path] = table
+            if use_table_cache:
+                table_cache.put(path, table)
+        table_baseline, table_compare = tables[baseline_path], tables[compare_path]
+        if loaded_in_parallel:
+            log_queue.put("已在两个进程中并行加载基准文件和比较文件")
+        for label, path, table in (("基准文件", baseline_path, table_baseline), ("比较文件", compare_path, table_compare)):
+            if path in reused_paths:
+                log_queue.put(f"{label}已在本次会话中加载且未修改，直接复用")
+            elif table.from_cache:
+                log_queue.put(f"{label}内容未变化，已从解析缓存加载")
+            log_queue.put(f"{label}{table.dimension_summary()}")
+            if table.loaded_cols is not None:
+                log_queue.put(f"列投影：{label}数据区加载 {len(table.loaded_cols)}/{table.max_col} 列")
+        progress.update(2)
     except FileNotFoundError as e:
         log_queue.put(f"错误：找不到文件 - {e}")
         return False
@@ -57,53 +1666,35 @@ def compare_excel_files(baseline_path, compare_path, output_baseline_path, outpu
         log_queue.put(f"加载文件时出错: {e}")
         return False
 
-    # 使用第一个工作表
-    ws_baseline = wb_baseline.active
-    ws_compare = wb_compare.active
-
     # 获取实际使用的范围
-    baseline_max_row = ws_baseline.max_row
-    baseline_max_col = ws_baseline.max_column
-    compare_max_row = ws_compare.max_row
-    compare_max_col = ws_compare.max_column
+    baseline_max_row = table_baseline.max_row
+    baseline_max_col = table_baseline.max_col
+    compare_max_row = table_compare.max_row
+    compare_max_col = table_compare.max_col
 
     # 检查列数是否一致
     if baseline_max_col != compare_max_col:
         log_queue.put(f"警告：两个文件的列数不一致！基准文件：{baseline_max_col}列，比较文件：{compare_max_col}列")
 
-    # 预先获取所有单元格值
-    cells_baseline = {}
-    cells_compare = {}
-    
-    # 获取基准文件所有单元格值
-    for r in range(1, baseline_max_row + 1):
-        if check_stop():
-            return False
-        for c in range(1, baseline_max_col + 1):
-            cells_baseline[(r, c)] = ws_baseline.cell(row=r, column=c).value
-    
-    # 获取比较文件所有单元格值
-    for r in range(1, compare_max_row + 1):
-        if check_stop():
-            return False
-        for c in range(1, compare_max_col + 1):
-            cells_compare[(r, c)] = ws_compare.cell(row=r, column=c).value
+    # 单元格值已按行保存在数值表中
+    rows_baseline = table_baseline.rows
+    rows_compare = table_compare.rows
     
     # 如果没有提供关键字段，默认使用前三列作为特征列
     if not key_fields:
-        header_values = [cells_baseline.get((header_row, c), "").strip() for c in range(1, min(baseline_max_col + 1, 4))]
+        header_values = [table_baseline.header_name(header_row, c) for c in range(1, min(baseline_max_col + 1, 4))]
         key_fields = [v for v in header_values if v]  # 过滤空值
         if len(key_fields) < 3:
             key_fields = [f"列{c}" for c in range(1, min(baseline_max_col + 1, 4))]
     
     # 从指定表头行获取关键字段的列索引
-    def find_key_columns(cells, max_col, header_row_num, key_field_names):
+    def find_key_columns(table, header_row_num, key_field_names):
         """从指定行查找关键字段的列索引"""
         key_cols = {}
         # 获取表头行的所有列名映射
         header_values = {}
-        for col in range(1, max_col + 1):
-            cell_value = cells.get((header_row_num, col), "").strip()
+        for col in range(1, table.max_col + 1):
+            cell_value = table.header_name(header_row_num, col)
             header_values[cell_value] = col
         
         # 查找关键字段的列索引
@@ -114,37 +1705,40 @@ def compare_excel_files(baseline_path, compare_path, output_baseline_path, outpu
                 # 如果找不到字段名，尝试直接使用列索引
                 try:
                     col_idx = int(field.replace("列", ""))
-                    if 1 <= col_idx <= max_col:
+                    if 1 <= col_idx <= table.max_col:
                         key_cols[field] = col_idx
                 except ValueError:
                     pass
         return key_cols
     
     # 查找基准文件和比较文件的关键字段列索引
-    key_cols_baseline = find_key_columns(cells_baseline, baseline_max_col, header_row, key_fields)
-    key_cols_compare = find_key_columns(cells_compare, compare_max_col, header_row, key_fields)
+    key_cols_baseline = find_key_columns(table_baseline, header_row, key_fields)
+    key_cols_compare = find_key_columns(table_compare, header_row, key_fields)
     
     # 检查是否找到所有关键字段
     has_all_keys_baseline = all(field in key_cols_baseline for field in key_fields)
     has_all_keys_compare = all(field in key_cols_compare for field in key_fields)
     
     # 行匹配：基准行号 -> 比较行号
+    progress.start("行匹配", baseline_max_row + compare_max_row)
     row_mapping = {}
     
     if has_all_keys_baseline and has_all_keys_compare:
         # 构建行关键字映射：关键字 -> 行号
-        def build_row_key_map(cells, max_row, key_cols, data_start_row):
+        def build_row_key_map(rows, key_cols, data_start_row):
             row_key_map = {}
-            for row in range(data_start_row, max_row + 1):
-                key_values = tuple(cells.get((row, key_cols[field]), None) for field in key_fields)
+            key_indexes = [key_cols[field] - 1 for field in key_fields]
+            for row in range(data_start_row, len(rows) + 1):
+                row_values = rows[row - 1]
+                key_values = tuple(row_values[i] for i in key_indexes)
                 if all(v is not None for v in key_values):
                     row_key_map[key_values] = row
             return row_key_map
         
         # 数据行从表头行的下一行开始
         data_start_row = header_row + 1
-        row_key_map_baseline = build_row_key_map(cells_baseline, baseline_max_row, key_cols_baseline, data_start_row)
-        row_key_map_compare = build_row_key_map(cells_compare, compare_max_row, key_cols_compare, data_start_row)
+        row_key_map_baseline = build_row_key_map(rows_baseline, key_cols_baseline, data_start_row)
+        row_key_map_compare = build_row_key_map(rows_compare, key_cols_compare, data_start_row)
         
         # 建立行映射：基准行 -> 比较行
         for key in row_key_map_baseline:
@@ -155,23 +1749,10 @@ def compare_excel_files(baseline_path, compare_path, output_baseline_path, outpu
     else:
         log_queue.put("\n无法找到所有关键字段，使用默认行匹配...")
         
-        # 获取一行的所有单元格内容，作为比较的键
-        def get_row_content(row_num, cells, max_col):
-            return tuple(cells.get((row_num, c), None) for c in range(1, max_col + 1))
-        
-        # 构建行内容映射
-        row_contents_baseline = {r: get_row_content(r, cells_baseline, baseline_max_col) for r in range(1, baseline_max_row + 1)}
-        row_contents_compare = {r: get_row_content(r, cells_compare, compare_max_col) for r in range(1, compare_max_row + 1)}
-        
-        # 先找到完全匹配的行
-        for row_baseline, content_baseline in row_contents_baseline.items():
-            if check_stop():
-                return False
-            
-            for row_compare, content_compare in row_contents_compare.items():
-                if row_compare not in row_mapping.values() and content_baseline == content_compare:
-                    row_mapping[row_baseline] = row_compare
-                    break
+        # 先找到完全匹配的行（按整行内容哈希匹配）
+        row_mapping = match_rows_by_content(rows_baseline, rows_compare)
+        if check_stop():
+            return False
         
         # 如果没有找到足够的匹配，使用简单的索引映射
         if len(row_mapping) < min(baseline_max_row, compare_max_row) // 2:
@@ -182,6 +1763,11 @@ def compare_excel_files(baseline_path, compare_path, output_baseline_path, outpu
     changes_count = 0  # 数值变化计数
     added_rows_count = 0  # 新增行计数
     deleted_rows_count = 0  # 删除行计数
+    # 数值变化的单元格：(基准行, 基准列, 比较行, 比较列)
+    changed_cells = []
+    # 删除行（基准行号）和新增行（比较行号）
+    deleted_row_list = []
+    added_row_list = []
     
     # 定义关键字段列索引集合，避免重新计算
     key_col_set_baseline = set(key_cols_baseline.values()) if has_all_keys_baseline else set()
@@ -195,13 +1781,13 @@ def compare_excel_files(baseline_path, compare_path, output_baseline_path, outpu
         # 先获取基准文件的列名映射
         baseline_col_names = {}
         for col_b in range(1, baseline_max_col + 1):
-            col_name_b = cells_baseline.get((header_row, col_b), "").strip()
+            col_name_b = table_baseline.header_name(header_row, col_b)
             if col_name_b:
                 baseline_col_names[col_name_b] = col_b
         
         # 然后在比较文件中查找相同列名
         for col_c in range(1, compare_max_col + 1):
-            col_name_c = cells_compare.get((header_row, col_c), "").strip()
+            col_name_c = table_compare.header_name(header_row, col_c)
             if col_name_c in baseline_col_names:
                 col_name_map[baseline_col_names[col_name_c]] = col_c
         
@@ -213,34 +1799,37 @@ def compare_excel_files(baseline_path, compare_path, output_baseline_path, outpu
         return col_name_map
     
     col_name_map = create_col_name_map()
+    progress.update(baseline_max_row + compare_max_row)
     
-    for row_baseline, row_compare in row_mapping.items():
-        if check_stop():
-            return False
-            
-        # 比较匹配的列
-        for col_baseline, col_compare in col_name_map.items():
-            # 跳过关键字段列（它们已经匹配，不需要比较）
-            if col_baseline in key_col_set_baseline or col_compare in key_col_set_compare:
-                continue
-            
-            val_baseline = cells_baseline.get((row_baseline, col_baseline), None)
-            val_compare = cells_compare.get((row_compare, col_compare), None)
-            
-            # 只在值不同时标记为黄色（数值变化）
-            if val_baseline != val_compare:
-                ws_baseline.cell(row=row_baseline, column=col_baseline).fill = fill_changed
-                ws_compare.cell(row=row_compare, column=col_compare).fill = fill_changed
-                changes_count += 1
+    compared_cols = [
+        (col_baseline, col_compare)
+        for col_baseline, col_compare in col_name_map.items()
+        # 跳过关键字段列（它们已经匹配，不需要比较）
+        if col_baseline not in key_col_set_baseline and col_compare not in key_col_set_compare
+        # 列投影时只比较两边都已加载的列
+        and table_baseline.is_loaded(col_baseline) and table_compare.is_loaded(col_compare)
+    ]
+    # 行指纹：对齐列内容完全相同的匹配行不再逐单元格比较
+    rows_to_compare, skipped_rows = skip_identical_rows(table_baseline, table_compare, row_mapping, compared_cols)
+    log_queue.put(f"行指纹相同、跳过逐单元格比较的匹配行: {skipped_rows}/{len(row_mapping)}")
+    progress.start("单元格比较", len(rows_to_compare))
+    changed_cells, used_engine = diff_matched_cells(table_baseline, table_compare, rows_to_compare, compared_cols, diff_engine, diff_workers, progress.update)
+    changes_count += len(changed_cells)
+    log_queue.put(f"单元格比较引擎: {used_engine}")
+    if check_stop():
+        return False
     
+    progress.start("标记新增和删除行", baseline_max_row + compare_max_row)
     log_queue.put("\n开始标记新增行、删除行和数值变化行...")
     
     # 获取所有数据行的关键字映射
-    def get_all_row_keys(cells, max_row, key_cols, data_start_row):
+    def get_all_row_keys(rows, key_cols, data_start_row):
         """获取所有数据行的关键字映射"""
         all_row_keys = {}
-        for row in range(data_start_row, max_row + 1):
-            key_values = tuple(cells.get((row, key_cols[field]), None) for field in key_fields)
+        key_indexes = [key_cols[field] - 1 for field in key_fields]
+        for row in range(data_start_row, len(rows) + 1):
+            row_values = rows[row - 1]
+            key_values = tuple(row_values[i] for i in key_indexes)
             if all(v is not None for v in key_values):
                 all_row_keys[key_values] = row
         return all_row_keys
@@ -248,8 +1837,8 @@ def compare_excel_files(baseline_path, compare_path, output_baseline_path, outpu
     if has_all_keys_baseline and has_all_keys_compare:
         # 获取所有数据行的关键字映射
         data_start_row = header_row + 1
-        all_baseline_keys = get_all_row_keys(cells_baseline, baseline_max_row, key_cols_baseline, data_start_row)
-        all_compare_keys = get_all_row_keys(cells_compare, compare_max_row, key_cols_compare, data_start_row)
+        all_baseline_keys = get_all_row_keys(rows_baseline, key_cols_baseline, data_start_row)
+        all_compare_keys = get_all_row_keys(rows_compare, key_cols_compare, data_start_row)
         
         # 标记删除行（基准文件中有，比较文件中没有）
         for key, row_baseline in all_baseline_keys.items():
@@ -257,9 +1846,7 @@ def compare_excel_files(baseline_path, compare_path, output_baseline_path, outpu
                 return False
                 
             if key not in all_compare_keys:
-                # 标记整行为绿色
-                for col in range(1, baseline_max_col + 1):
-                    ws_baseline.cell(row=row_baseline, column=col).fill = fill_added
+                deleted_row_list.append(row_baseline)
                 deleted_rows_count += 1
         log_queue.put(f"\n已标记 {deleted_rows_count} 行删除（绿色）")
         
@@ -269,9 +1856,7 @@ def compare_excel_files(baseline_path, compare_path, output_baseline_path, outpu
                 return False
                 
             if key not in all_baseline_keys:
-                # 标记整行为红色
-                for col in range(1, compare_max_col + 1):
-                    ws_compare.cell(row=row_compare, column=col).fill = fill_deleted
+                added_row_list.append(row_compare)
                 added_rows_count += 1
         log_queue.put(f"\n已标记 {added_rows_count} 行新增（红色）")
     else:
@@ -284,9 +1869,7 @@ def compare_excel_files(baseline_path, compare_path, output_baseline_path, outpu
                 return False
                 
             if row_baseline not in row_mapping:
-                # 标记整行为绿色
-                for col in range(1, baseline_max_col + 1):
-                    ws_baseline.cell(row=row_baseline, column=col).fill = fill_added
+                deleted_row_list.append(row_baseline)
                 deleted_rows_count += 1
         log_queue.put(f"\n已标记 {deleted_rows_count} 行删除（绿色）")
         
@@ -297,9 +1880,7 @@ def compare_excel_files(baseline_path, compare_path, output_baseline_path, outpu
                 return False
                 
             if row_compare not in mapped_compare_rows:
-                # 标记整行为红色
-                for col in range(1, compare_max_col + 1):
-                    ws_compare.cell(row=row_compare, column=col).fill = fill_deleted
+                added_row_list.append(row_compare)
                 added_rows_count += 1
         log_queue.put(f"\n已标记 {added_rows_count} 行新增（红色）")
     
@@ -311,149 +1892,221 @@ def compare_excel_files(baseline_path, compare_path, output_baseline_path, outpu
     total_changes = changes_count + added_rows_count + deleted_rows_count
     log_queue.put(f"\n比较完成！共发现 {total_changes} 处差异。")
 
-    # 保存比较结果文件
-    try:
-        wb_baseline.save(output_baseline_path)
-        wb_compare.save(output_compare_path)
-    except Exception as e:
-        log_queue.put(f"保存结果文件时出错: {e}")
-        return False
-    
-    # 生成差异结果文件
-    log_queue.put("\n正在生成差异结果文件...")
+    # 差异结果中的新增行需要完整的行数据，列投影时从比较文件中重新读取这些行
+    added_row_values = {}
+    if table_compare.loaded_cols is not None:
+        try:
+            added_row_values = read_sheet_rows(compare_path, added_row_list, compare_max_col)
+        except Exception as e:
+            log_queue.put(f"读取新增行时出错: {e}")
+            return False
     
-    try:
-        # 使用保存后的基准文件作为差异结果的基础
-        wb_diff = openpyxl.load_workbook(output_baseline_path)
-        ws_diff = wb_diff.active
-        ws_diff.title = "差异比较结果"
-        
-        # 重新加载保存后的文件以获取准确的格式信息
-        wb_baseline_saved = openpyxl.load_workbook(output_baseline_path)
-        ws_baseline_saved = wb_baseline_saved.active
-        
-        wb_compare_saved = openpyxl.load_workbook(output_compare_path)
-        ws_compare_saved = wb_compare_saved.active
-    except Exception as e:
-        log_queue.put(f"加载保存后的文件时出错: {e}")
-        return False
+    progress.update(baseline_max_row + compare_max_row)
     
-    # 创建一个字典来快速查找基准行
-    key_to_row = {}
+    # 差异结果文件路径
+    progress.start("保存结果文件", 3)
+    diff_output_path = os.path.join(results_folder, f"{original_filename}_差异结果_{timestamp}.xlsx")
     
-    # 获取基准文件中所有行的关键字段值
-    for row_baseline in range(4, ws_baseline_saved.max_row + 1):
-        if check_stop():
-            return False
-            
-        key_values = tuple(ws_baseline_saved.cell(row=row_baseline, column=key_cols_baseline[field]).value for field in key_fields)
-        if all(v is not None for v in key_values):
-            key_to_row[key_values] = row_baseline
+    # 条件格式模式：标记不再逐单元格设置填充，而是合并为矩形区域写成条件格式规则
+    use_conditional = highlight_mode == "conditional"
+    baseline_highlights = compare_highlights = None
+    if use_conditional:
+        baseline_highlights = [
+            (fill_changed, [(row_baseline, col_baseline, col_baseline) for row_baseline, col_baseline, _, _ in changed_cells]),
+            (fill_added, [(row_baseline, 1, baseline_max_col) for row_baseline in deleted_row_list]),
+        ]
+        compare_highlights = [
+            (fill_changed, [(row_compare, col_compare, col_compare) for _, _, row_compare, col_compare in changed_cells]),
+            (fill_deleted, [(row_compare, 1, compare_max_col) for row_compare in added_row_list]),
+        ]
     
-    # 收集比较文件中的新增行（红色行）
-    added_rows = []
-    for row_compare in range(4, ws_compare_saved.max_row + 1):
-        if check_stop():
-            return False
-            
-        # 获取当前行的关键字段值
-        key_values = tuple(ws_compare_saved.cell(row=row_compare, column=key_cols_compare[field]).value for field in key_fields)
-        if not all(v is not None for v in key_values):
-            continue
+    if output_mode == "streaming":
+        # 流式输出：逐行读取源文件并以write_only模式写出，内存中不保留完整的工作簿
+        log_queue.put("\n正在以流式模式保存结果文件...")
+        fidelity = STREAMING_FIDELITY_OPTIONS if fidelity is None else fidelity
+        baseline_cell_fills = {}
+        compare_cell_fills = {}
+        deleted_row_fills = {}
+        added_row_fills = {}
+        if not use_conditional:
+            for row_baseline, col_baseline, row_compare, col_compare in changed_cells:
+                baseline_cell_fills.setdefault(row_baseline, {})[col_baseline] = fill_changed
+                compare_cell_fills.setdefault(row_compare, {})[col_compare] = fill_changed
+            deleted_row_fills = {row_baseline: fill_added for row_baseline in deleted_row_list}
+            added_row_fills = {row_compare: fill_deleted for row_compare in added_row_list}
+        
+        # 差异结果中的新增行紧随其定位到的基准行写出
+        data_start_row = header_row + 1
+        if has_all_keys_baseline and has_all_keys_compare:
+            key_indexes_compare = [key_cols_compare[field] - 1 for field in key_fields]
+            diff_plan = plan_diff_rows(baseline_max_row, added_row_list, rows_compare, key_indexes_compare, dict(all_baseline_keys), data_start_row)
+        else:
+            diff_plan = [("baseline", row) for row in range(1, baseline_max_row + 1)]
+        diff_extra_rows = {}
+        last_baseline_row = 0
+        for source, row in diff_plan:
+            if source == "baseline":
+                last_baseline_row = row
+                continue
+            values_compare = added_row_values.get(row, rows_compare[row - 1])
+            values = [None] * baseline_max_col
+            for col_baseline, col_compare in col_name_map.items():
+                values[col_baseline - 1] = values_compare[col_compare - 1]
+            diff_extra_rows.setdefault(last_baseline_row, []).append((values, None if use_conditional else fill_deleted))
         
-        # 检查是否为新增行（红色）
-        first_cell = ws_compare_saved.cell(row=row_compare, column=1)
-        if first_cell.fill.start_color.rgb == fill_deleted.start_color.rgb:
-            # 获取当前行在比较文件中的上一行关键字段值
-            prev_key_values = None
-            if row_compare > 4:
-                prev_key_values = tuple(ws_compare_saved.cell(row=row_compare - 1, column=key_cols_compare[field]).value for field in key_fields)
-            added_rows.append((key_values, row_compare, prev_key_values))
-    
-    # 计算需要插入的行数，提前插入空白行
-    for _ in range(len(added_rows)):
-        if check_stop():
+        diff_highlights = None
+        if use_conditional:
+            diff_changed_runs, diff_deleted_runs, diff_added_runs = plan_highlight_runs(diff_plan, changed_cells, deleted_row_list, baseline_max_col)
+            diff_highlights = [(fill_changed, diff_changed_runs), (fill_added, diff_deleted_runs), (fill_deleted, diff_added_runs)]
+        
+        try:
+            write_streaming_sheet(baseline_path, output_baseline_path, table_baseline.title, baseline_max_col, fidelity,
+                                  cell_fills=baseline_cell_fills, row_fills=deleted_row_fills,
+                                  highlights=baseline_highlights)
+            progress.update(1)
+            if check_stop():
+                return False
+            write_streaming_sheet(compare_path, output_compare_path, table_compare.title, compare_max_col, fidelity,
+                                  cell_fills=compare_cell_fills, row_fills=added_row_fills,
+                                  highlights=compare_highlights)
+            progress.update(2)
+            if check_stop():
+                return False
+            log_queue.put("\n正在生成差异结果文件...")
+            write_streaming_sheet(baseline_path, diff_output_path, "差异比较结果", baseline_max_col, fidelity,
+                                  cell_fills=baseline_cell_fills, row_fills=deleted_row_fills,
+                                  extra_rows=diff_extra_rows, template_row=data_start_row,
+                                  highlights=diff_highlights)
+            progress.update(3)
+        except Exception as e:
+            log_queue.put(f"保存结果文件时出错: {e}")
             return False
-        ws_diff.append(['' for _ in range(baseline_max_col)])
-    
-    # 将新增行插入到正确位置
-    for key_values, row_compare, prev_key_values in added_rows:
-        if check_stop():
+    else:
+        # 保存比较结果文件：此时才打开带样式的工作簿
+        try:
+            wb_compare = openpyxl.load_workbook(compare_path, data_only=True)  # 只加载数据，不加载公式
+            ws_compare = wb_compare.active
+            if use_conditional:
+                for fill, runs in compare_highlights:
+                    add_highlight_rules(ws_compare, fill, runs)
+            else:
+                compare_styles = StyleRegistry(ws_compare)
+                for _, _, row_compare, col_compare in changed_cells:
+                    compare_styles.apply_fill(ws_compare.cell(row=row_compare, column=col_compare), fill_changed)
+                for row_compare in added_row_list:
+                    # 标记整行为红色
+                    for col in range(1, compare_max_col + 1):
+                        compare_styles.apply_fill(ws_compare.cell(row=row_compare, column=col), fill_deleted)
+            wb_compare.save(output_compare_path)
+            progress.update(1)
+            del wb_compare, ws_compare
+        
+            if check_stop():
+                return False
+        
+            # 基准工作簿保存后继续留在内存中，作为差异结果文件的基础
+            wb_baseline = openpyxl.load_workbook(baseline_path, data_only=True)
+            ws_baseline = wb_baseline.active
+            baseline_styles = StyleRegistry(ws_baseline)
+            if use_conditional:
+                # 差异结果中的行会移动，保存后恢复源文件自身的条件格式，再按输出行号重新添加标记
+                source_conditional_formatting = deepcopy(ws_baseline.conditional_formatting)
+                for fill, runs in baseline_highlights:
+                    add_highlight_rules(ws_baseline, fill, runs)
+            else:
+                for row_baseline, col_baseline, _, _ in changed_cells:
+                    baseline_styles.apply_fill(ws_baseline.cell(row=row_baseline, column=col_baseline), fill_changed)
+                for row_baseline in deleted_row_list:
+                    # 标记整行为绿色
+                    for col in range(1, baseline_max_col + 1):
+                        baseline_styles.apply_fill(ws_baseline.cell(row=row_baseline, column=col), fill_added)
+            wb_baseline.save(output_baseline_path)
+            progress.update(2)
+            if use_conditional:
+                ws_baseline.conditional_formatting = source_conditional_formatting
+        except Exception as e:
+            log_queue.put(f"保存结果文件时出错: {e}")
             return False
-            
-        # 找到插入位置
-        insert_row = ws_diff.max_row
-        if prev_key_values and prev_key_values in key_to_row:
-            insert_row = key_to_row[prev_key_values] + 1
-        
-        # 插入空白行
-        ws_diff.insert_rows(insert_row)
-        
-        # 更新key_to_row字典
-        for k, v in list(key_to_row.items()):
-            if v >= insert_row:
-                key_to_row[k] = v + 1
-        
-        # 使用基准文件的第4行作为模板，复制其格式
-        template_row = 4
-        
-        # 先复制模板行的格式到新插入的行
-        for col in range(1, baseline_max_col + 1):
-            template_cell = ws_baseline_saved.cell(row=template_row, column=col)
-            new_cell = ws_diff.cell(row=insert_row, column=col)
-            
-            # 复制格式
-            new_cell.number_format = template_cell.number_format
-            new_cell.font = Font(**template_cell.font.__dict__)
-            new_cell.border = Border(**template_cell.border.__dict__)
-            new_cell.alignment = Alignment(**template_cell.alignment.__dict__)
-        
-        # 然后填入新增行的数据
-        for col in range(1, baseline_max_col + 1):
-            # 获取基准文件中对应的列名
-            col_name_b = ws_baseline_saved.cell(row=3, column=col).value
-            col_name_b = col_name_b.strip() if col_name_b else ""
-            if not col_name_b:
+        
+        # 生成差异结果文件
+        log_queue.put("\n正在生成差异结果文件...")
+        
+        # 直接在已标记的基准工作簿上生成差异结果，新增行、关键字和数据全部来自内存中的比较结果
+        wb_diff = wb_baseline
+        ws_diff = ws_baseline
+        ws_diff.title = "差异比较结果"
+        
+        # 基准文件关键字 -> 行号
+        data_start_row = header_row + 1
+        key_to_row = dict(all_baseline_keys) if has_all_keys_baseline and has_all_keys_compare else {}
+        
+        # 一次性计算差异结果的最终行顺序：基准行与按上一行关键字定位的新增行交错排列
+        if has_all_keys_baseline and has_all_keys_compare:
+            key_indexes_compare = [key_cols_compare[field] - 1 for field in key_fields]
+            diff_plan = plan_diff_rows(ws_diff.max_row, added_row_list, rows_compare, key_indexes_compare, key_to_row, data_start_row)
+        else:
+            diff_plan = [("baseline", row) for row in range(1, ws_diff.max_row + 1)]
+        
+        if use_conditional:
+            diff_changed_runs, diff_deleted_runs, diff_added_runs = plan_highlight_runs(diff_plan, changed_cells, deleted_row_list, baseline_max_col)
+            for fill, runs in ((fill_changed, diff_changed_runs), (fill_added, diff_deleted_runs), (fill_deleted, diff_added_runs)):
+                add_highlight_rules(ws_diff, fill, runs)
+        
+        # 使用基准文件的第一个数据行作为模板，在移动行之前先记录其格式
+        template_styles = [copy(ws_diff.cell(row=data_start_row, column=col)._style) for col in range(1, baseline_max_col + 1)]
+        
+        # 基准行的新行号和新增行的输出位置
+        baseline_row_shift = {}
+        added_positions = []
+        for output_row, (source, row) in enumerate(diff_plan, start=1):
+            if source == "baseline":
+                baseline_row_shift[row] = output_row - row
+            else:
+                added_positions.append((output_row, row))
+        
+        # 自下而上按连续块移动基准行，每个单元格最多移动一次
+        last_col_letter = get_column_letter(ws_diff.max_column)
+        block_end = ws_diff.max_row
+        for row in range(ws_diff.max_row, 0, -1):
+            shift = baseline_row_shift[row]
+            if row > 1 and baseline_row_shift[row - 1] == shift:
                 continue
+            if shift:
+                ws_diff.move_range(f"A{row}:{last_col_letter}{block_end}", rows=shift)
+            block_end = row - 1
+        
+        # 行高跟随基准行一起移动
+        row_heights = {
+            row: ws_diff.row_dimensions[row].height
+            for row in list(ws_diff.row_dimensions)
+            if row in baseline_row_shift and baseline_row_shift[row] and ws_diff.row_dimensions[row].height is not None
+        }
+        for row in row_heights:
+            ws_diff.row_dimensions[row].height = None
+        for row, height in row_heights.items():
+            ws_diff.row_dimensions[row + baseline_row_shift[row]].height = height
+        
+        # 将新增行写入预留的位置
+        for insert_row, row_compare in added_positions:
+            if check_stop():
+                return False
+        
+            # 新增行沿用模板行的格式（填充标记模式下整行设置为红色），同一列的样式在所有新增行间共享
+            for col in range(1, baseline_max_col + 1):
+                baseline_styles.apply_fill(ws_diff.cell(row=insert_row, column=col), None if use_conditional else fill_deleted, template_styles[col - 1])
             
-            # 在比较文件中查找对应的列
-            for c in range(1, ws_compare_saved.max_column + 1):
-                col_name_c = ws_compare_saved.cell(row=3, column=c).value
-                col_name_c = col_name_c.strip() if col_name_c else ""
-                if col_name_c == col_name_b:
-                    # 填入数据
-                    value = ws_compare_saved.cell(row=row_compare, column=c).value
-                    ws_diff.cell(row=insert_row, column=col, value=value)
-                    break
-        
-        # 最后将整行设置为红色填充
-        for col in range(1, baseline_max_col + 1):
-            ws_diff.cell(row=insert_row, column=col).fill = fill_deleted
-    
-    # 复制基准文件的列宽设置
-    for col in range(1, ws_baseline_saved.max_column + 1):
-        if check_stop():
-            return False
-            
-        col_letter = get_column_letter(col)
-        if col_letter in ws_baseline_saved.column_dimensions:
-            ws_diff.column_dimensions[col_letter].width = ws_baseline_saved.column_dimensions[col_letter].width
-    
-    # 复制基准文件的行高设置
-    for row in range(1, ws_baseline_saved.max_row + 1):
-        if check_stop():
+            # 然后按列映射填入新增行的数据
+            values_compare = added_row_values.get(row_compare, rows_compare[row_compare - 1])
+            for col_baseline, col_compare in col_name_map.items():
+                ws_diff.cell(row=insert_row, column=col_baseline, value=values_compare[col_compare - 1])
+        
+        # 保存差异结果文件
+        try:
+            wb_diff.save(diff_output_path)
+            progress.update(3)
+        except Exception as e:
+            log_queue.put(f"保存差异结果文件时出错: {e}")
             return False
-            
-        if row in ws_baseline_saved.row_dimensions:
-            ws_diff.row_dimensions[row].height = ws_baseline_saved.row_dimensions[row].height
-    
-    # 保存差异结果文件
-    diff_output_path = os.path.join(results_folder, f"{original_filename}_差异结果_{timestamp}.xlsx")
-    try:
-        wb_diff.save(diff_output_path)
-    except Exception as e:
-        log_queue.put(f"保存差异结果文件时出错: {e}")
-        return False
     
     # 设置文件为只读
     try:
@@ -477,6 +2130,8 @@ def compare_excel_files(baseline_path, compare_path, output_baseline_path, outpu
     
     log_queue.put(f"\n已生成差异结果文件至: \n{diff_output_path}")
     
+    progress.finish()
+    
     # 自动打开文件
     try:
         subprocess.Popen(['start', '', output_baseline_path], shell=True)
@@ -489,6 +2144,108 @@ def compare_excel_files(baseline_path, compare_path, output_baseline_path, outpu
 
 
 
+# GUI的结果文件保留时长（秒）
+GUI_RESULTS_TTL_SECONDS = 7 * 24 * 3600
+
+
+def format_progress(event):
+    """把进度事件格式化为进度条下方显示的文字"""
+    if event["phase"] == "完成":
+        return f"完成，用时 {event['elapsed_seconds']} 秒"
+    text = f"{event['phase']}（{event['phase_index']}/{event['phase_count']}）：{event['processed']}/{event['total']}，整体 {event['percent']}%，已用 {event['elapsed_seconds']} 秒"
+    if event["eta_seconds"] is not None:
+        text += f"，本阶段预计剩余 {event['eta_seconds']} 秒"
+    return text
+
+
+def parse_column_numbers(text):
+    """解析列号列表，支持多种格式："1,2,3" 或 "1 2 3" 或 "1-3"，返回去重排序后的列号列表"""
+    cols = []
+    # 处理逗号分隔
+    parts = [p.strip() for p in text.split(",")]
+    for part in parts:
+        # 处理空格分隔
+        sub_parts = [sp.strip() for sp in part.split() if sp.strip()]
+        for sub_part in sub_parts:
+            # 处理范围
+            if "-" in sub_part:
+                start, end = map(int, sub_part.split("-"))
+                cols.extend(range(start, end + 1))
+            else:
+                cols.append(int(sub_part))
+    # 去重并排序
+    return sorted(set(cols))
+
+
+class SessionTableCache:
+    """GUI会话内的数值表缓存：同一个文件在表头行/特征列对话框和比较任务之间只解析一次
+    
+    以文件的绝对路径为键，同时记录修改时间和大小，文件被替换或修改后自动重新加载；
+    最多保留max_entries个文件，按最近使用淘汰。对话框在主线程、比较任务在工作线程中访问，用锁保护。
+    选择文件后用preload()在后台线程中完整加载，比较任务用wait()等待正在进行的预加载，不重复解析。
+    """
+
+    def __init__(self, max_entries=4):
+        self.max_entries = max_entries
+        self._tables = OrderedDict()
+        self._loading = {}  # 文件路径 -> 预加载结束时设置的事件
+        self._lock = threading.Lock()
+
+    def preload(self, path, loader):
+        """在后台线程中以loader(path)加载文件并缓存，文件已缓存或正在加载时不重复加载"""
+        path = os.path.abspath(path)
+        with self._lock:
+            if path in self._loading:
+                return
+            event = self._loading[path] = threading.Event()
+        
+        def run():
+            try:
+                if self.lookup(path) is None:
+                    self.put(path, loader(path))
+            except Exception:
+                # 预加载失败时由比较任务自行加载并报告错误
+                pass
+            finally:
+                with self._lock:
+                    self._loading.pop(path, None)
+                event.set()
+        
+        threading.Thread(target=run, daemon=True).start()
+
+    def wait(self, path, timeout=None):
+        """等待文件正在进行的预加载结束，没有预加载或已结束时返回True，超时返回False"""
+        with self._lock:
+            event = self._loading.get(os.path.abspath(path))
+        return event is None or event.wait(timeout)
+
+    @staticmethod
+    def _signature(path):
+        info = os.stat(path)
+        return info.st_mtime_ns, info.st_size
+
+    def lookup(self, path):
+        """返回文件未变化时缓存的数值表，否则返回None"""
+        path = os.path.abspath(path)
+        signature = self._signature(path)
+        with self._lock:
+            cached = self._tables.get(path)
+            if cached is None or cached[0] != signature:
+                return None
+            self._tables.move_to_end(path)
+            return cached[1]
+
+    def put(self, path, table):
+        """缓存文件的数值表"""
+        path = os.path.abspath(path)
+        signature = self._signature(path)
+        with self._lock:
+            self._tables[path] = (signature, table)
+            self._tables.move_to_end(path)
+            while len(self._tables) > self.max_entries:
+                self._tables.popitem(last=False)
+
+
 class StdoutRedirector:
     """重定向stdout到GUI的Text组件"""
     def __init__(self, text_widget):
@@ -513,6 +2270,18 @@ class ExcelCompareGUI(ctk.CTk):
         self.parent_dir = os.path.dirname(self.current_dir)
         self.results_folder = os.path.join(self.parent_dir, "tmp", "results")
         os.makedirs(self.results_folder, exist_ok=True)
+        # 结果目录的后台清理：结果文件保留7天，目录总大小不超过2GB
+        self.results_janitor = ResultsJanitor(
+            self.results_folder, ttl_seconds=GUI_RESULTS_TTL_SECONDS,
+            on_cleanup=lambda files, size: log_queue.put(f"已清理 {files} 个过期的结果文件，释放 {size / (1024 * 1024):.1f}MB")
+        )
+        self.results_janitor.start()
+        # 解析缓存目录：重复比较同一个基准文件时不再重新解析
+        self.cache_folder = os.path.join(self.parent_dir, "tmp", "cache")
+        # 会话内的数值表缓存：选择文件后在后台预加载，表头行/特征列对话框与比较任务共用
+        self.table_cache = SessionTableCache()
+        # 结果缓存：同一对文件以相同选项重复比较时直接打开上次的结果文件
+        self.result_cache = ResultCache(os.path.join(self.parent_dir, "tmp", "result_cache"), janitor=self.results_janitor)
         
         self.baseline_file = ""
         self.compare_file = ""
@@ -794,6 +2563,110 @@ class ExcelCompareGUI(ctk.CTk):
         )
         self.feature_cols_preview_label.pack(anchor="w")
         
+        # 列投影：只比较的列和不比较的列，宽表只选少数列时加载更快、内存占用更低
+        columns_frame = ctk.CTkFrame(config_section, fg_color="transparent")
+        columns_frame.pack(fill="x", pady=5)
+        
+        ctk.CTkLabel(
+            columns_frame, 
+            text="只比较列:", 
+            width=100,
+            font=("微软雅黑", 12)
+        ).pack(side="left", anchor="center")
+        
+        self.include_cols_var = ctk.StringVar(value="")
+        ctk.CTkEntry(columns_frame, textvariable=self.include_cols_var, font=("微软雅黑", 12), width=100).pack(side="left", padx=5)
+        
+        ctk.CTkLabel(
+            columns_frame, 
+            text="不比较列:", 
+            width=80,
+            font=("微软雅黑", 12)
+        ).pack(side="left", anchor="center")
+        
+        self.exclude_cols_var = ctk.StringVar(value="")
+        ctk.CTkEntry(columns_frame, textvariable=self.exclude_cols_var, font=("微软雅黑", 12), width=100).pack(side="left", padx=5)
+        
+        # 输出模式选择
+        output_mode_frame = ctk.CTkFrame(config_section, fg_color="transparent")
+        output_mode_frame.pack(fill="x", pady=5)
+        
+        ctk.CTkLabel(
+            output_mode_frame, 
+            text="输出模式:", 
+            width=100,
+            font=("微软雅黑", 12)
+        ).pack(side="left", anchor="center")
+        
+        self.output_mode_optionmenu = ctk.CTkOptionMenu(
+            output_mode_frame,
+            values=list(OUTPUT_MODES),
+            font=("微软雅黑", 12),
+            width=150
+        )
+        self.output_mode_optionmenu.set("完整格式")
+        self.output_mode_optionmenu.pack(side="left", padx=5)
+        
+        # 标记方式选择
+        highlight_mode_frame = ctk.CTkFrame(config_section, fg_color="transparent")
+        highlight_mode_frame.pack(fill="x", pady=5)
+        
+        ctk.CTkLabel(
+            highlight_mode_frame, 
+            text="标记方式:", 
+            width=100,
+            font=("微软雅黑", 12)
+        ).pack(side="left", anchor="center")
+        
+        self.highlight_mode_optionmenu = ctk.CTkOptionMenu(
+            highlight_mode_frame,
+            values=list(HIGHLIGHT_MODE_OPTIONS),
+            font=("微软雅黑", 12),
+            width=150
+        )
+        self.highlight_mode_optionmenu.set("单元格填充")
+        self.highlight_mode_optionmenu.pack(side="left", padx=5)
+        
+        # 比较进程数选择
+        diff_workers_frame = ctk.CTkFrame(config_section, fg_color="transparent")
+        diff_workers_frame.pack(fill="x", pady=5)
+        
+        ctk.CTkLabel(
+            diff_workers_frame, 
+            text="比较进程数:", 
+            width=100,
+            font=("微软雅黑", 12)
+        ).pack(side="left", anchor="center")
+        
+        self.diff_workers_optionmenu = ctk.CTkOptionMenu(
+            diff_workers_frame,
+            values=["1", "2", "4", "8"],
+            font=("微软雅黑", 12),
+            width=150
+        )
+        self.diff_workers_optionmenu.set("1")
+        self.diff_workers_optionmenu.pack(side="left", padx=5)
+        
+        # 读取方式选择
+        reader_frame = ctk.CTkFrame(config_section, fg_color="transparent")
+        reader_frame.pack(fill="x", pady=5)
+        
+        ctk.CTkLabel(
+            reader_frame, 
+            text="读取方式:", 
+            width=100,
+            font=("微软雅黑", 12)
+        ).pack(side="left", anchor="center")
+        
+        self.reader_optionmenu = ctk.CTkOptionMenu(
+            reader_frame,
+            values=list(READER_OPTIONS),
+            font=("微软雅黑", 12),
+            width=150
+        )
+        self.reader_optionmenu.set("标准读取")
+        self.reader_optionmenu.pack(side="left", padx=5)
+        
         ctk.CTkLabel(
             config_section, 
             text="提示: 特征列用于判断行的增删变化，特征列内容的变化不视为数值变化", 
@@ -842,6 +2715,22 @@ class ExcelCompareGUI(ctk.CTk):
             font=("微软雅黑", 16, "bold")
         ).pack(anchor="w")
         
+        # 比较进度：整体进度条和当前阶段
+        progress_frame = ctk.CTkFrame(right_panel, fg_color="transparent")
+        progress_frame.pack(fill="x", padx=15, pady=(0, 5))
+        
+        self.progress_bar = ctk.CTkProgressBar(progress_frame)
+        self.progress_bar.set(0)
+        self.progress_bar.pack(fill="x", padx=5)
+        
+        self.progress_label = ctk.CTkLabel(
+            progress_frame,
+            text="",
+            font=("微软雅黑", 12),
+            anchor="w"
+        )
+        self.progress_label.pack(fill="x", padx=5)
+        
         # 日志显示区域
         log_frame = ctk.CTkFrame(right_panel, fg_color="transparent")
         log_frame.pack(fill="both", expand=True, padx=15, pady=5)
@@ -891,6 +2780,7 @@ class ExcelCompareGUI(ctk.CTk):
             self.baseline_entry.delete(0, ctk.END)
             self.baseline_entry.insert(0, file_path)
             self.baseline_file = file_path
+            self._preload_table(file_path)
     
     def _browse_compare_file(self):
         """浏览比较文件"""
@@ -902,6 +2792,19 @@ class ExcelCompareGUI(ctk.CTk):
             self.compare_entry.delete(0, ctk.END)
             self.compare_entry.insert(0, file_path)
             self.compare_file = file_path
+            self._preload_table(file_path)
+    
+    def _preload_table(self, file_path):
+        """选择文件后在后台完整加载数值表（经过解析缓存），对话框和比较任务直接复用"""
+        try:
+            header_row = int(self.header_row_var.get())
+        except ValueError:
+            header_row = 3
+        reader = READER_OPTIONS[self.reader_optionmenu.get()]
+        cache = ParseCache(self.cache_folder)
+        self.table_cache.preload(
+            file_path, lambda path: load_sheet_tables([path], False, reader, cache=cache, header_row=header_row)[0][0]
+        )
     
     def _start_compare(self):
         """开始比较"""
@@ -933,8 +2836,12 @@ class ExcelCompareGUI(ctk.CTk):
         self.start_button.configure(state="disabled")
         self.stop_button.configure(state="normal")
         
-        # 清空日志
+        # 清空日志和进度
         self.log_text.delete("1.0", ctk.END)
+        while not progress_queue.empty():
+            progress_queue.get_nowait()
+        self.progress_bar.set(0)
+        self.progress_label.configure(text="")
         
         # 创建工作线程
         self.worker_thread = threading.Thread(
@@ -955,13 +2862,12 @@ class ExcelCompareGUI(ctk.CTk):
             return
         
         try:
-            # 加载基准文件获取数据
-            wb = openpyxl.load_workbook(self.baseline_file, data_only=True)
-            ws = wb.active
+            # 会话内已加载且未修改时直接复用，否则只读取前10行、前6列
+            table = self.table_cache.lookup(self.baseline_file) or read_sheet_preview(self.baseline_file, 10, 6)
             
             # 获取前10行数据
-            max_row = min(10, ws.max_row)
-            max_col = min(6, ws.max_column)
+            max_row = min(10, table.max_row)
+            max_col = min(6, table.max_col)
             
             # 创建表头行选择窗口
             select_window = ctk.CTkToplevel(self)
@@ -1008,7 +2914,7 @@ class ExcelCompareGUI(ctk.CTk):
                 
                 # 显示前6列数据
                 for col in range(1, max_col + 1):
-                    cell_value = ws.cell(row=row, column=col).value
+                    cell_value = table.value(row, col)
                     cell_text = str(cell_value) if cell_value else "空"
                     
                     cell_label = ctk.CTkLabel(
@@ -1038,14 +2944,13 @@ class ExcelCompareGUI(ctk.CTk):
         
         # 更新预览信息
         try:
-            wb = openpyxl.load_workbook(self.baseline_file, data_only=True)
-            ws = wb.active
+            table = self.table_cache.lookup(self.baseline_file) or read_sheet_preview(self.baseline_file, row_num, 6)
             
             # 获取所选行的前6列数据
             cols_data = []
-            max_col = min(6, ws.max_column)
+            max_col = min(6, table.max_col)
             for col in range(1, max_col + 1):
-                cell_value = ws.cell(row=row_num, column=col).value
+                cell_value = table.value(row_num, col)
                 cols_data.append(f"列{col}={str(cell_value) if cell_value else '空'}")
             
             self.header_preview_label.configure(
@@ -1065,10 +2970,6 @@ class ExcelCompareGUI(ctk.CTk):
             return
         
         try:
-            # 加载基准文件获取表头信息
-            wb = openpyxl.load_workbook(self.baseline_file, data_only=True)
-            ws = wb.active
-            
             # 获取用户选择的表头行号
             try:
                 header_row = int(self.header_row_var.get())
@@ -1076,14 +2977,16 @@ class ExcelCompareGUI(ctk.CTk):
                 messagebox.showerror("错误", "表头行号必须是数字")
                 return
             
+            # 会话内已加载且未修改时直接复用，否则只读取到表头行为止
+            table = self.table_cache.lookup(self.baseline_file) or read_sheet_preview(self.baseline_file, header_row)
+            
             # 获取表头行的列名
-            max_col = ws.max_column
+            max_col = table.max_col
             header_values = []
             # 创建列号到列名的映射字典
             col_name_map = {}
             for col in range(1, max_col + 1):
-                cell_value = ws.cell(row=header_row, column=col).value
-                col_name = cell_value.strip() if cell_value else "空"
+                col_name = table.header_name(header_row, col) or "空"
                 header_values.append(f"{col}: {col_name}")
                 col_name_map[col] = col_name
             
@@ -1175,70 +3078,97 @@ class ExcelCompareGUI(ctk.CTk):
             feature_cols_str = self.feature_cols_var.get()
             key_fields = None
             try:
-                # 解析特征列，支持多种格式："1,2,3" 或 "1 2 3" 或 "1-3"
-                feature_cols = []
-                # 处理逗号分隔
-                parts = [p.strip() for p in feature_cols_str.split(",")]
-                for part in parts:
-                    # 处理空格分隔
-                    sub_parts = [sp.strip() for sp in part.split() if sp.strip()]
-                    for sub_part in sub_parts:
-                        # 处理范围
-                        if "-" in sub_part:
-                            start, end = map(int, sub_part.split("-"))
-                            feature_cols.extend(range(start, end + 1))
-                        else:
-                            feature_cols.append(int(sub_part))
-                # 去重并排序
-                feature_cols = sorted(list(set(feature_cols)))
+                feature_cols = parse_column_numbers(feature_cols_str)
                 # 转换为列名格式
                 key_fields = [f"列{col}" for col in feature_cols]
             except ValueError:
                 log_queue.put("\n❌ 错误：特征列格式无效")
                 return False
             
+            # 获取列投影：只比较的列和不比较的列，留空表示比较全部列
+            try:
+                include_columns = parse_column_numbers(self.include_cols_var.get())
+                exclude_columns = parse_column_numbers(self.exclude_cols_var.get())
+            except ValueError:
+                log_queue.put("\n❌ 错误：比较列或排除列格式无效")
+                return False
+            
             # 生成结果文件名
             baseline_folder = os.path.basename(os.path.dirname(self.baseline_file))
             compare_folder = os.path.basename(os.path.dirname(self.compare_file))
             original_filename = os.path.basename(self.baseline_file).replace('.xlsx', '')
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
             
+            # 构建结果文件路径
+            result_baseline = os.path.join(
+                self.results_folder, 
+                f"{original_filename}_{baseline_folder}_比较结果_{timestamp}.xlsx"
+            )
+            result_compare = os.path.join(
+                self.results_folder, 
+                f"{original_filename}_{compare_folder}_比较结果_{timestamp}.xlsx"
+            )
+            
+            diff_result = os.path.join(self.results_folder, f"{original_filename}_差异结果_{timestamp}.xlsx")
+            output_mode = OUTPUT_MODES[self.output_mode_optionmenu.get()]
+            highlight_mode = HIGHLIGHT_MODE_OPTIONS[self.highlight_mode_optionmenu.get()]
+            
+            # 结果缓存：键只包含影响结果文件内容的选项，读取方式、进程数等只影响速度的选项不参与
+            # 两个文件的内容哈希只计算一次，结果缓存和解析缓存共用
+            file_hashes = {path: file_sha256(path) for path in (self.baseline_file, self.compare_file)}
+            result_cache_key = ResultCache.key_from_hashes(file_hashes[self.baseline_file], file_hashes[self.compare_file], {
+                "header_row": header_row,
+                "key_fields": key_fields,
+                "output_mode": output_mode,
+                "highlight_mode": highlight_mode,
+                "include_columns": include_columns,
+                "exclude_columns": exclude_columns
+            })
+            cached_result = self.result_cache.lookup(result_cache_key)
+            if cached_result is not None:
+                log_queue.put("\n文件内容和比较选项与之前的比较相同，直接使用已有的结果文件：")
+                for path in cached_result["files"]:
+                    log_queue.put(path)
+                ProgressReporter(progress_queue.put).finish()
+                try:
+                    for path in cached_result["files"]:
+                        subprocess.Popen(['start', '', path], shell=True)
+                except Exception as e:
+                    log_queue.put(f"打开文件时出错: {e}")
+                log_queue.put("\n✅ 任务完成！")
+                return True
+            
             # 读取表头行内容用于预览
             header_preview = ""
             try:
-                import openpyxl
-                wb = openpyxl.load_workbook(self.baseline_file, data_only=True)
-                ws = wb.active
-                if header_row <= ws.max_row:
+                # 会话内已加载的基准文件直接复用，否则只读取到表头行为止；完整解析留给比较任务（经过解析缓存）
+                table = self.table_cache.lookup(self.baseline_file) or read_sheet_preview(self.baseline_file, header_row)
+                if header_row <= table.max_row:
                     # 获取表头行的前6列内容作为预览
-                    max_col = min(6, ws.max_column)
+                    max_col = min(6, table.max_col)
                     header_cells = []
                     for col in range(1, max_col + 1):
-                        cell_value = ws.cell(row=header_row, column=col).value
+                        cell_value = table.value(header_row, col)
                         if cell_value:
                             header_cells.append(str(cell_value))
                         else:
                             header_cells.append("空")
                     header_preview = ", ".join(header_cells)
-                    if ws.max_column > 6:
-                        header_preview += f", ... (共{ws.max_column}列)"
+                    if table.max_col > 6:
+                        header_preview += f", ... (共{table.max_col}列)"
             except Exception as e:
                 header_preview = "无法读取表头内容"
             
             # 输出比较配置信息
             log_queue.put("\n已定义比较配置：")
             log_queue.put(f"\n已选择表头行 {header_row}")
+            if header_preview:
+                log_queue.put(f"\n表头内容预览：{header_preview}")
             log_queue.put(f"\n已选择特征列：{feature_cols_str}")
-            
-            # 构建结果文件路径
-            result_baseline = os.path.join(
-                self.results_folder, 
-                f"{original_filename}_{baseline_folder}_比较结果_{timestamp}.xlsx"
-            )
-            result_compare = os.path.join(
-                self.results_folder, 
-                f"{original_filename}_{compare_folder}_比较结果_{timestamp}.xlsx"
-            )
+            if include_columns:
+                log_queue.put(f"\n只比较列：{self.include_cols_var.get()}")
+            if exclude_columns:
+                log_queue.put(f"\n不比较列：{self.exclude_cols_var.get()}")
             
             # 调用比较函数
             success = compare_excel_files(
@@ -1251,10 +3181,25 @@ class ExcelCompareGUI(ctk.CTk):
                 timestamp,
                 header_row,
                 key_fields,
-                self.stop_event
+                self.stop_event,
+                output_mode,
+                highlight_mode=highlight_mode,
+                diff_workers=int(self.diff_workers_optionmenu.get()),
+                reader=READER_OPTIONS[self.reader_optionmenu.get()],
+                include_columns=include_columns,
+                exclude_columns=exclude_columns,
+                cache_dir=self.cache_folder,
+                table_cache=self.table_cache,
+                progress_callback=progress_queue.put,
+                file_hashes=file_hashes
             )
             
             if success:
+                try:
+                    self.result_cache.store(result_cache_key, [result_baseline, result_compare, diff_result])
+                except OSError as e:
+                    # 结果缓存写入失败不影响本次比较结果
+                    log_queue.put(f"写入结果缓存失败: {e}")
                 log_queue.put("\n✅ 任务完成！")
             else:
                 log_queue.put("\n❌ 任务失败！")
@@ -1319,8 +3264,16 @@ class ExcelCompareGUI(ctk.CTk):
         self.version_label.configure(text=new_text)
     
     def _listen_queues(self):
-        """监听日志队列并更新UI"""
+        """监听日志队列和进度队列并更新UI"""
         try:
+            # 进度事件只显示最新的一条
+            latest_progress = None
+            while not progress_queue.empty():
+                latest_progress = progress_queue.get_nowait()
+            if latest_progress is not None:
+                self.progress_bar.set(latest_progress["percent"] / 100)
+                self.progress_label.configure(text=format_progress(latest_progress))
+            
             while not log_queue.empty():
                 message = log_queue.get_nowait()
                 # 确保每条日志单独一行
@@ -1372,5 +3325,7 @@ class ExcelCompareGUI(ctk.CTk):
             self.after(100, self._listen_queues)
 
 if __name__ == "__main__":
+    # 打包为EXE后，多进程比较的子进程需要此调用才能正常启动
+    multiprocessing.freeze_support()
     app = ExcelCompareGUI()
     app.mainloop()
\ No newline at end of file
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""测试公共工具：生成测试用的工作簿，读取结果文件中的标记"""
+
+import datetime
+import os
+import sys
+
+import openpyxl
+import pytest
+from openpyxl.cell.rich_text import CellRichText, TextBlock
+from openpyxl.cell.text import InlineFont
+from openpyxl.styles import Alignment, Border, Font, Side
+from openpyxl.utils import range_boundaries
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Web版核心比较逻辑不依赖GUI库，测试直接导入
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "web"))
+
+HEADER = ("部门", "合同号", "产品代码", "数量", "单价", "金额", "备注")
+KEY_FIELDS = ["部门", "合同号", "产品代码"]
+# 结果文件中的标记颜色
+MARK_COLORS = {"FFFF00": "changed", "00FF00": "added", "FF0000": "deleted"}
+
+
+def make_workbook(path, rows, header=HEADER, title="明细"):
+    """生成与实际报表结构相同的工作簿：两行标题、第3行表头，数据从第4行开始"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = title
+    ws.append(["销售毛利分析表"])
+    ws.append(["2026年"])
+    ws.append(list(header))
+    thin = Side(style="thin")
+    for row in rows:
+        ws.append(list(row))
+    for row in ws.iter_rows(min_row=4):
+        for cell in row:
+            cell.font = Font(name="宋体", size=10)
+            cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+            cell.alignment = Alignment(horizontal="center")
+    ws.column_dimensions["B"].width = 20
+    wb.save(path)
+    return path
+
+
+def sample_rows(n=30):
+    """基准数据和比较数据：比较数据中有数值变化、删除行、新增行（中间和末尾）"""
+    baseline = [("销售%d部" % (i % 3), "HT%04d" % i, "P%03d" % (i * 7 % 100), i, round(i * 1.5, 2), i * 10, "x") for i in range(n)]
+    compare = [list(row) for row in baseline]
+    for i in (5, 17):
+        compare[i][3] += 1
+    compare[12][6] = "changed"
+    del compare[25]
+    del compare[2]
+    compare.insert(8, ("销售9部", "HT9001", "P999", 1, 2, 3, "new"))
+    compare.insert(9, ("销售9部", "HT9002", "P998", 1, 2, 3, "new2"))
+    compare.append(("销售9部", "HT9004", "P996", 1, 2, 3, "new4"))
+    return baseline, [tuple(row) for row in compare]
+
+
+def make_edge_workbook(path, epoch=None, active=0):
+    """包含各种单元格类型的工作簿：日期时间、布尔、公式、富文本、重复字符串、空行空列"""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "数据"
+    other = wb.create_sheet("其他")
+    other["B2"] = "第二页"
+    ws["A1"] = "名称"
+    ws["B1"] = 1.5
+    ws["C1"] = 3
+    ws["D1"] = True
+    ws["E1"] = False
+    ws["A3"] = datetime.datetime(2024, 5, 6, 7, 8, 9)
+    ws["B3"] = datetime.date(2020, 1, 1)
+    ws["C3"] = datetime.time(12, 30)
+    ws["D3"] = datetime.timedelta(hours=30)
+    # openpyxl写出的公式没有缓存的计算结果，两个后端都读为None
+    ws["E3"] = "=SUM(B1:C1)"
+    ws["F3"] = 1e20
+    ws["G3"] = -2.5e-7
+    ws["A5"] = "x005F_abc"
+    ws["H5"] = "同值"
+    ws["I5"] = "同值"
+    ws["A6"] = CellRichText([TextBlock(InlineFont(b=True), "粗"), "体"])
+    ws["B6"].number_format = "0.00%"
+    ws["B6"] = 0.25
+    ws["C6"] = "#N/A"
+    if epoch is not None:
+        wb.epoch = epoch
+    wb.active = active
+    wb.save(path)
+    return path
+
+
+@pytest.fixture
+def sample_pair(tmp_path):
+    """按文件夹区分的一对测试文件 (基准文件路径, 比较文件路径)"""
+    baseline, compare = sample_rows()
+    return (
+        make_workbook(str(tmp_path / "my" / "data.xlsx"), baseline),
+        make_workbook(str(tmp_path / "from" / "data.xlsx"), compare),
+    )
+
+
+def collect_marks(path):
+    """读取结果文件中的标记，返回 {标记类型: {(行, 列), ...}}
+
+    同时包含单元格填充和条件格式区域，两种标记方式的结果可以直接比较
+    """
+    wb = openpyxl.load_workbook(path)
+    try:
+        ws = wb.active
+        marks = {kind: set() for kind in MARK_COLORS.values()}
+        for row in ws.iter_rows():
+            for cell in row:
+                if cell.fill is not None and cell.fill.fill_type == "solid":
+                    kind = MARK_COLORS.get(str(cell.fill.fgColor.rgb)[-6:])
+                    if kind:
+                        marks[kind].add((cell.row, cell.column))
+        for conditional in ws.conditional_formatting:
+            for rule in conditional.rules:
+                color = rule.dxf.fill.fgColor.rgb if rule.dxf is not None and rule.dxf.fill is not None else None
+                kind = MARK_COLORS.get(str(color)[-6:])
+                if not kind:
+                    continue
+                for cell_range in conditional.sqref.ranges:
+                    min_col, min_row, max_col, max_row = range_boundaries(cell_range.coord)
+                    marks[kind].update((r, c) for r in range(min_row, max_row + 1) for c in range(min_col, max_col + 1))
+        return marks
+    finally:
+        wb.close()
+
+
+def column_values(path, col):
+    """结果文件某一列从第1行起的全部值"""
+    wb = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return [row[0] for row in wb.active.iter_rows(min_col=col, max_col=col, values_only=True)]
+    finally:
+        wb.close()
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """Web服务器模块（需要安装FastAPI），上传、结果和缓存目录以及任务队列都替换为测试专用的实例"""
+    for module in ("fastapi", "multipart", "requests"):
+        pytest.importorskip(module)
+    import server
+
+    for name in ("RESULTS_FOLDER", "UPLOAD_FOLDER", "CACHE_FOLDER", "RESULT_CACHE_FOLDER"):
+        folder = tmp_path / name.lower()
+        folder.mkdir()
+        monkeypatch.setattr(server, name, str(folder))
+    results_janitor = server.ResultsJanitor(server.RESULTS_FOLDER)
+    result_cache = server.ResultCache(server.RESULT_CACHE_FOLDER, janitor=results_janitor)
+    job_manager = server.CompareJobManager(1, 2, result_cache)
+    monkeypatch.setattr(server, "results_janitor", results_janitor)
+    monkeypatch.setattr(server, "result_cache", result_cache)
+    monkeypatch.setattr(server, "job_manager", job_manager)
+    monkeypatch.setattr(server, "upload_sessions", server.UploadSessionStore(server.UPLOAD_FOLDER, 3600))
+    yield server
+    if job_manager.executor is not None:
+        job_manager.executor.shutdown(wait=True)
+
+
+@pytest.fixture
+def client(server):
+    """不触发启动事件的测试客户端，后台清理线程不会启动"""
+    from fastapi.testclient import TestClient
+    return TestClient(server.app)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""列对齐：按表头、按内容指纹、不足一半时按位置补齐"""
+
+import compare_excel_web
+from compare_excel_web import SheetTable, align_columns
+from conftest import KEY_FIELDS
+
+
+def make_table(header, columns):
+    """由表头和按列给出的数据构造数值表，表头在第1行"""
+    rows = [tuple(header)] + [tuple(values) for values in zip(*columns)]
+    return SheetTable("表", ["表"], rows)
+
+
+def test_same_headers_align_by_header():
+    header = ("部门", "合同号", "数量")
+    columns = [("A", "B"), ("HT1", "HT2"), (1, 2)]
+    alignment = align_columns(make_table(header, columns), make_table(header, columns), 1)
+    assert alignment.mapping == {1: 1, 2: 2, 3: 3}
+    assert set(alignment.methods.values()) == {"表头"}
+    assert alignment.unmatched_baseline == []
+    assert alignment.unmatched_compare == []
+
+
+def test_reordered_headers():
+    baseline = make_table(("部门", "合同号", "数量"), [("A",), ("HT1",), (1,)])
+    compare = make_table(("数量", "部门", "合同号"), [(1,), ("A",), ("HT1",)])
+    assert align_columns(baseline, compare, 1).mapping == {1: 2, 2: 3, 3: 1}
+
+
+def test_duplicate_header_names_pair_in_order():
+    baseline = make_table(("备注", "备注"), [("a",), ("b",)])
+    compare = make_table(("备注", "备注"), [("c",), ("d",)])
+    assert align_columns(baseline, compare, 1).mapping == {1: 1, 2: 2}
+
+
+def test_renamed_column_matched_by_content():
+    baseline = make_table(("部门", "金额", "备注"), [("A", "B"), (10, 20), ("x", "y")])
+    compare = make_table(("部门", "金额(元)", "备注"), [("A", "B"), (10, 20), ("x", "y")])
+    alignment = align_columns(baseline, compare, 1)
+    assert alignment.mapping == {1: 1, 2: 2, 3: 3}
+    assert alignment.methods[2] == "内容"
+
+
+def test_colliding_columns_are_not_matched_by_content():
+    # CPython中 hash((-1, -1)) == hash((-2, -2))，内容不同的列不能按内容配对
+    assert hash((-1, -1)) == hash((-2, -2))
+    baseline = make_table(("部门", "旧列"), [("A", "B"), (-1, -1)])
+    compare = make_table(("部门", "新列"), [("A", "B"), (-2, -2)])
+    alignment = align_columns(baseline, compare, 1)
+    assert alignment.mapping == {1: 1}
+    assert alignment.unmatched_baseline == [2]
+    assert alignment.unmatched_compare == [2]
+
+
+def test_empty_columns_are_not_matched_by_content():
+    baseline = make_table(("部门", "旧列"), [("A", "B"), (None, None)])
+    compare = make_table(("部门", "新列"), [("A", "B"), (None, None)])
+    alignment = align_columns(baseline, compare, 1)
+    assert alignment.mapping == {1: 1}
+    assert alignment.unmatched_baseline == [2]
+    assert alignment.unmatched_compare == [2]
+
+
+def test_positional_fallback_keeps_matched_columns():
+    # 只有"部门"按表头匹配、"备注"按内容匹配，不足一半，其余未匹配的列按位置补齐
+    baseline = make_table(
+        ("部门", "列A", "列B", "列C", "列D", "备注"),
+        [("A", "B"), (1, 2), (3, 4), (5, 6), (7, 8), ("x", "y")],
+    )
+    compare = make_table(
+        ("说明", "部门", "列甲", "列乙", "列丙", "列丁"),
+        [("x", "y"), ("A", "B"), (11, 12), (13, 14), (15, 16), (17, 18)],
+    )
+    alignment = align_columns(baseline, compare, 1)
+    assert alignment.mapping == {1: 2, 3: 3, 4: 4, 5: 5, 6: 1}
+    assert alignment.methods == {1: "表头", 3: "位置", 4: "位置", 5: "位置", 6: "内容"}
+    assert alignment.unmatched_baseline == [2]
+    assert alignment.unmatched_compare == [6]
+
+
+def test_alignment_is_computed_once_per_comparison(sample_pair, tmp_path, monkeypatch):
+    calls = []
+    original = compare_excel_web.align_columns
+    monkeypatch.setattr(compare_excel_web, "align_columns", lambda *args: calls.append(args) or original(*args))
+    out = tmp_path / "out"
+    out.mkdir()
+    compare_excel_web.compare_excel_files(
+        sample_pair[0], sample_pair[1], str(out / "my.xlsx"), str(out / "from.xlsx"), "data", "T", 3, list(KEY_FIELDS)
+    )
+    assert len(calls) == 1
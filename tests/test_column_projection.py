@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""列投影：只加载特征列和需要比较的列"""
+
+import pytest
+
+from compare_excel_web import ColumnProjection, load_sheet_table
+from conftest import HEADER, make_workbook, sample_rows
+
+
+def test_no_projection_loads_everything():
+    assert ColumnProjection(3).resolve(HEADER) is None
+
+
+def test_include_by_name_number_and_label():
+    projection = ColumnProjection(3, include=["数量", 5, "列6", "不存在"], always=["部门"])
+    assert projection.resolve(HEADER) == {1, 4, 5, 6}
+
+
+def test_exclude_never_drops_always_columns():
+    projection = ColumnProjection(3, exclude=["部门", "备注"], always=["部门", "合同号"])
+    assert projection.resolve(HEADER) == {1, 2, 3, 4, 5, 6}
+
+
+@pytest.mark.parametrize("reader", ["openpyxl", "fast"])
+def test_projected_load(tmp_path, reader):
+    baseline, _ = sample_rows()
+    path = make_workbook(str(tmp_path / "data.xlsx"), baseline)
+    full = load_sheet_table(path, reader)
+    table = load_sheet_table(path, reader, ColumnProjection(3, include=["数量"], always=["合同号"]))
+    assert table.loaded_cols == {2, 4}
+    assert table.is_loaded(4) and not table.is_loaded(7)
+    # 表头行及以上完整加载，数据区只保留投影中的列
+    assert table.rows[:3] == full.rows[:3]
+    for row, full_row in zip(table.rows[3:], full.rows[3:]):
+        assert row[1] == full_row[1] and row[3] == full_row[3]
+        assert all(value is None for col, value in enumerate(row, start=1) if col not in (2, 4))
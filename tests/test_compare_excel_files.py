@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""完整比较流程：结果文件中的标记与原来的实现一致"""
+
+import os
+
+import openpyxl
+import pytest
+
+import compare_excel_web
+from compare_excel_web import compare_excel_files
+from conftest import HEADER, KEY_FIELDS, collect_marks, column_values
+
+
+def whole_rows(rows, col_count=len(HEADER)):
+    return {(row, col) for row in rows for col in range(1, col_count + 1)}
+
+
+# 原来的实现对 conftest.sample_rows() 生成的结果（基准文件和比较文件的标记逐格相同）
+EXPECTED_BASELINE_MARKS = {
+    "changed": {(9, 4), (16, 7), (21, 4)},
+    "added": whole_rows([6, 29]),
+    "deleted": set(),
+}
+EXPECTED_COMPARE_MARKS = {
+    "changed": {(8, 4), (17, 7), (22, 4)},
+    "added": set(),
+    "deleted": whole_rows([12, 13, 34]),
+}
+# 差异结果：基准行按原顺序，新增行紧跟在比较文件中其上一行对应的基准行之后，连续的新增行保持在一起
+EXPECTED_DIFF_MARKS = {
+    "changed": {(9, 4), (18, 7), (23, 4)},
+    "added": whole_rows([6, 31]),
+    "deleted": whole_rows([13, 14, 36]),
+}
+EXPECTED_DIFF_KEYS = (
+    [None, None, "合同号"]
+    + ["HT%04d" % i for i in range(9)]
+    + ["HT9001", "HT9002"]
+    + ["HT%04d" % i for i in range(9, 30)]
+    + ["HT9004"]
+)
+
+
+def run_compare(sample_pair, tmp_path, **options):
+    """执行一次比较，返回 (基准结果文件, 比较结果文件, 差异结果文件)"""
+    baseline_path, compare_path = sample_pair
+    out = tmp_path / "out"
+    out.mkdir(exist_ok=True)
+    paths = (str(out / "data_my_比较结果_T.xlsx"), str(out / "data_from_比较结果_T.xlsx"), str(out / "data_差异结果_T.xlsx"))
+    compare_excel_files(baseline_path, compare_path, paths[0], paths[1], "data", "T", 3, list(KEY_FIELDS), **options)
+    assert all(os.path.exists(path) for path in paths)
+    return paths
+
+
+def assert_expected_results(paths):
+    baseline_result, compare_result, diff_result = paths
+    assert collect_marks(baseline_result) == EXPECTED_BASELINE_MARKS
+    assert collect_marks(compare_result) == EXPECTED_COMPARE_MARKS
+    assert collect_marks(diff_result) == EXPECTED_DIFF_MARKS
+    assert column_values(diff_result, 2) == EXPECTED_DIFF_KEYS
+
+
+def test_matches_original_results(sample_pair, tmp_path):
+    assert_expected_results(run_compare(sample_pair, tmp_path))
+
+
+def test_streaming_output_matches_original_results(sample_pair, tmp_path):
+    assert_expected_results(run_compare(sample_pair, tmp_path, output_mode="streaming"))
+
+
+@pytest.mark.parametrize("fidelity, kept", [(None, True), ([], False)])
+def test_streaming_output_fidelity(sample_pair, tmp_path, fidelity, kept):
+    baseline_result = run_compare(sample_pair, tmp_path, output_mode="streaming", fidelity=fidelity)[0]
+    wb = openpyxl.load_workbook(baseline_result)
+    try:
+        ws = wb.active
+        assert (ws.column_dimensions["B"].width == 20) is kept
+        assert (ws.cell(4, 1).font.name == "宋体") is kept
+        assert ws.cell(4, 2).value == "HT0000"
+    finally:
+        wb.close()
+
+
+@pytest.mark.parametrize("output_mode", ["styled", "streaming"])
+def test_conditional_highlight_matches_original_results(sample_pair, tmp_path, output_mode):
+    paths = run_compare(sample_pair, tmp_path, output_mode=output_mode, highlight_mode="conditional")
+    assert_expected_results(paths)
+    wb = openpyxl.load_workbook(paths[2])
+    try:
+        # 标记全部写成条件格式，单元格本身没有填充
+        assert not any(cell.fill.fill_type == "solid" for row in wb.active.iter_rows() for cell in row)
+    finally:
+        wb.close()
+
+
+@pytest.mark.parametrize("diff_engine", ["python", "numpy"])
+def test_diff_engines_match_original_results(sample_pair, tmp_path, diff_engine):
+    if diff_engine == "numpy":
+        pytest.importorskip("numpy")
+    assert_expected_results(run_compare(sample_pair, tmp_path, diff_engine=diff_engine))
+
+
+def test_parallel_diff_matches_original_results(sample_pair, tmp_path, monkeypatch):
+    # 测试数据的匹配行很少，降低阈值使多进程比较生效
+    monkeypatch.setattr(compare_excel_web, "PARALLEL_DIFF_MIN_ROWS", 1)
+    assert_expected_results(run_compare(sample_pair, tmp_path, diff_workers=2))
+
+
+def test_fast_reader_matches_original_results(sample_pair, tmp_path):
+    assert_expected_results(run_compare(sample_pair, tmp_path, reader="fast"))
+
+
+@pytest.mark.parametrize("reader", ["openpyxl", "fast"])
+def test_excluded_columns_are_not_compared(sample_pair, tmp_path, reader):
+    baseline_result, compare_result, diff_result = run_compare(sample_pair, tmp_path, reader=reader, exclude_columns=["备注"])
+    # 只少了"备注"列上的数值变化，行的增删不受影响
+    for path, expected in ((baseline_result, EXPECTED_BASELINE_MARKS), (compare_result, EXPECTED_COMPARE_MARKS), (diff_result, EXPECTED_DIFF_MARKS)):
+        marks = collect_marks(path)
+        assert marks["changed"] == {(row, col) for row, col in expected["changed"] if col != 7}
+        assert marks["added"] == expected["added"]
+        assert marks["deleted"] == expected["deleted"]
+    assert column_values(diff_result, 2) == EXPECTED_DIFF_KEYS
+    # 差异结果中新增行的未加载列从比较文件中补齐
+    assert "new2" in column_values(diff_result, 7)
+
+
+def test_parse_cache_gives_the_same_results(sample_pair, tmp_path, capsys):
+    cache_dir = str(tmp_path / "cache")
+    assert_expected_results(run_compare(sample_pair, tmp_path, cache_dir=cache_dir))
+    assert len(os.listdir(cache_dir)) == 2
+    capsys.readouterr()
+    # 第二次比较从缓存加载两个文件
+    assert_expected_results(run_compare(sample_pair, tmp_path, cache_dir=cache_dir))
+    output = capsys.readouterr().out
+    assert "基准文件内容未变化，已从解析缓存加载" in output
+    assert "比较文件内容未变化，已从解析缓存加载" in output
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_progress_callback_reports_every_phase(sample_pair, tmp_path):
+    events = []
+    assert_expected_results(run_compare(sample_pair, tmp_path, progress_callback=events.append))
+    phases = [event["phase"] for event in events]
+    assert list(dict.fromkeys(phases)) == list(compare_excel_web.PROGRESS_PHASES) + ["完成"]
+    # 整体进度单调不减，最后为100%
+    percents = [event["percent"] for event in events]
+    assert percents == sorted(percents)
+    assert percents[-1] == 100.0
+
+
+def test_result_files_are_not_reloaded(sample_pair, tmp_path, monkeypatch):
+    loaded = []
+    load_workbook = openpyxl.load_workbook
+    monkeypatch.setattr(compare_excel_web.openpyxl, "load_workbook", lambda path, **kwargs: loaded.append(path) or load_workbook(path, **kwargs))
+    paths = run_compare(sample_pair, tmp_path)
+    # 差异结果由内存中的匹配结果生成，刚保存的结果文件不再重新加载
+    assert not set(loaded) & set(paths)
+    assert_expected_results(paths)
+
+
+def test_inserted_rows_use_template_styles(sample_pair, tmp_path):
+    diff_result = run_compare(sample_pair, tmp_path)[2]
+    wb = openpyxl.load_workbook(diff_result)
+    try:
+        ws = wb.active
+        # 第14行是插入到差异结果中的比较文件新增行，格式取自数据行
+        assert ws.cell(row=14, column=2).value == "HT9002"
+        for col in range(1, 8):
+            cell = ws.cell(row=14, column=col)
+            assert cell.font.name == "宋体"
+            assert cell.border.left.style == "thin"
+            assert cell.alignment.horizontal == "center"
+            assert cell.fill.fill_type == "solid"
+    finally:
+        wb.close()
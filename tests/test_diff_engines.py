@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""单元格比较引擎：各引擎的结果（包括顺序）与逐单元格比较完全一致"""
+
+import datetime
+import random
+
+import pytest
+
+import compare_excel_web
+from compare_excel_web import (
+    SheetTable, diff_cells_numpy, diff_cells_parallel, diff_cells_python, diff_matched_cells, skip_identical_rows,
+)
+from conftest import KEY_FIELDS, collect_marks, make_workbook, sample_rows
+
+# 混合类型的取值，包括 1 == 1.0、None 和日期
+VALUES = [None, 0, 1, 1.0, 2.5, "", "a", "b", True, datetime.date(2026, 1, 1), datetime.datetime(2026, 1, 1)]
+
+
+def random_case(seed, rows=60, cols=6):
+    """返回 (基准数值表, 比较数值表, 行映射, 对齐列)"""
+    rng = random.Random(seed)
+    table_baseline = SheetTable("表", ["表"], [tuple(rng.choice(VALUES) for _ in range(cols)) for _ in range(rows)])
+    compare_rows = [list(row) for row in table_baseline.rows]
+    for _ in range(rows):
+        compare_rows[rng.randrange(rows)][rng.randrange(cols)] = rng.choice(VALUES)
+    rng.shuffle(compare_rows)
+    table_compare = SheetTable("表", ["表"], [tuple(row) for row in compare_rows])
+    compare_order = list(range(1, rows + 1))
+    rng.shuffle(compare_order)
+    row_mapping = dict(zip(rng.sample(range(1, rows + 1), rows * 2 // 3), compare_order))
+    compared_cols = [(col, cols + 1 - col) for col in range(1, cols + 1) if rng.random() < 0.8]
+    return table_baseline, table_compare, row_mapping, compared_cols
+
+
+def diff_cells_reference(table_baseline, table_compare, row_mapping, compared_cols):
+    """按匹配行、对齐列的顺序逐个取值比较"""
+    return [
+        (row_baseline, col_baseline, row_compare, col_compare)
+        for row_baseline, row_compare in row_mapping.items()
+        for col_baseline, col_compare in compared_cols
+        if table_baseline.value(row_baseline, col_baseline) != table_compare.value(row_compare, col_compare)
+    ]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_python_engine_matches_reference(seed):
+    case = random_case(seed)
+    assert diff_cells_python(*case) == diff_cells_reference(*case)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_numpy_engine_matches_python(seed):
+    pytest.importorskip("numpy")
+    case = random_case(seed)
+    assert diff_cells_numpy(*case) == diff_cells_python(*case)
+
+
+def test_numpy_engine_empty_inputs():
+    pytest.importorskip("numpy")
+    table_baseline, table_compare, row_mapping, compared_cols = random_case(0)
+    assert diff_cells_numpy(table_baseline, table_compare, {}, compared_cols) == []
+    assert diff_cells_numpy(table_baseline, table_compare, row_mapping, []) == []
+
+
+@pytest.mark.parametrize("engine", ["python", "numpy", "auto"])
+def test_diff_matched_cells_reports_engine(engine):
+    if engine == "numpy":
+        pytest.importorskip("numpy")
+    case = random_case(3)
+    changed_cells, used_engine = diff_matched_cells(*case, engine=engine)
+    assert changed_cells == diff_cells_python(*case)
+    assert used_engine in ("python", "numpy")
+    if engine != "auto":
+        assert used_engine == engine
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_skip_identical_rows_keeps_every_changed_row(seed):
+    table_baseline, table_compare, row_mapping, compared_cols = random_case(seed)
+    remaining, skipped = skip_identical_rows(table_baseline, table_compare, row_mapping, compared_cols)
+    assert skipped == len(row_mapping) - len(remaining)
+    assert diff_cells_python(table_baseline, table_compare, remaining, compared_cols) == diff_cells_python(table_baseline, table_compare, row_mapping, compared_cols)
+
+
+def test_skip_identical_rows_with_colliding_hashes():
+    # CPython中 hash(-1) == hash(-2)，指纹相同但内容不同的行不能跳过
+    assert hash((-1,)) == hash((-2,))
+    table_baseline = SheetTable("表", ["表"], [("a", -1), ("b", 1)])
+    table_compare = SheetTable("表", ["表"], [("a", -2), ("b", 1)])
+    row_mapping = {1: 1, 2: 2}
+    remaining, skipped = skip_identical_rows(table_baseline, table_compare, row_mapping, [(2, 2)])
+    assert remaining == {1: 1}
+    assert skipped == 1
+
+
+@pytest.mark.parametrize("diff_engine", ["python", "numpy"])
+def test_colliding_change_is_marked(tmp_path, diff_engine):
+    baseline = [list(row) for row in sample_rows()[0][:5]]
+    compare = [list(row) for row in baseline]
+    baseline[1][3], compare[1][3] = -1, -2
+    paths = [make_workbook(str(tmp_path / name / "data.xlsx"), rows) for name, rows in (("my", baseline), ("from", compare))]
+    out = tmp_path / "out"
+    out.mkdir()
+    result_baseline = str(out / "my.xlsx")
+    compare_excel_web.compare_excel_files(
+        paths[0], paths[1], result_baseline, str(out / "from.xlsx"), "data", "T", 3, list(KEY_FIELDS), diff_engine=diff_engine
+    )
+    # 第2个数据行（第5行）的"数量"列从-1变为-2
+    assert collect_marks(result_baseline)["changed"] == {(5, 4)}
+
+
+def test_skip_identical_rows_without_compared_columns():
+    table_baseline, table_compare, row_mapping, _ = random_case(0)
+    assert skip_identical_rows(table_baseline, table_compare, row_mapping, []) == ({}, len(row_mapping))
+
+
+@pytest.mark.parametrize("cols", [
+    (3, 4, 5),                            # 连续的列
+    (1, 2, 6, 7, 12),                     # 少量连续区段
+    (1, 3, 5, 7, 9, 11, 13, 15, 17, 19),  # 区段很多时逐列取值
+    (5, 2, 9),                            # 乱序
+])
+def test_row_fingerprints_hash_selected_values(cols):
+    rng = random.Random(1)
+    table = SheetTable("表", ["表"], [tuple(rng.choice(VALUES) for _ in range(20)) for _ in range(30)])
+    expected = [hash(tuple(row[col - 1] for col in cols)) for row in table.rows]
+    assert table.row_fingerprints(cols) == expected
+    # 同一组列的指纹只计算一次
+    assert table.row_fingerprints(list(cols)) is table.row_fingerprints(cols)
+
+
+@pytest.mark.parametrize("fork", [True, False])
+@pytest.mark.parametrize("workers", [2, 3])
+def test_parallel_engine_matches_python(workers, fork, monkeypatch):
+    # fork方式继承整个比较数据，其他方式按数据块传递各自的行
+    monkeypatch.setattr(compare_excel_web, "_fork_start_method", lambda: fork)
+    case = random_case(4, rows=200)
+    progress = []
+    assert diff_cells_parallel(*case, workers, progress.append) == diff_cells_python(*case)
+    # 每合并一个数据块报告一次已比较的行数
+    assert progress == sorted(progress)
+    assert progress[-1] == len(case[2])
+
+
+def test_diff_matched_cells_uses_processes_for_many_rows(monkeypatch):
+    monkeypatch.setattr(compare_excel_web, "PARALLEL_DIFF_MIN_ROWS", 10)
+    case = random_case(5)
+    changed_cells, used_engine = diff_matched_cells(*case, engine="python", workers=2)
+    assert used_engine == "parallel(2进程)"
+    assert changed_cells == diff_cells_python(*case)
+
+
+
+def test_progress_blocks_do_not_change_results(monkeypatch):
+    monkeypatch.setattr(compare_excel_web, "DIFF_PROGRESS_BLOCK_ROWS", 7)
+    case = random_case(6)
+    progress = []
+    changed_cells, _ = diff_matched_cells(*case, engine="python", progress=progress.append)
+    assert changed_cells == diff_cells_python(*case)
+    assert progress == list(range(7, len(case[2]), 7)) + [len(case[2])]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""差异结果文件的行顺序"""
+
+from compare_excel_web import plan_diff_rows
+
+# 第1行为表头，数据从第2行开始；特征列为第1列
+ROWS_COMPARE = [("表头",), ("新0",), ("k1",), ("新1",), ("新2",), ("孤",), ("新3",), ("k2",), ("k3",)]
+KEY_TO_ROW = {("k1",): 2, ("k2",): 3, ("k3",): 4}
+BASELINE_ROWS = [("baseline", row) for row in range(1, 5)]
+
+
+def plan(added_rows):
+    return plan_diff_rows(len(BASELINE_ROWS), added_rows, ROWS_COMPARE, [0], KEY_TO_ROW, 2)
+
+
+def test_no_added_rows():
+    assert plan([]) == BASELINE_ROWS
+
+
+def test_consecutive_added_rows_stay_after_their_anchor():
+    assert plan([5, 4]) == BASELINE_ROWS[:2] + [("added", 4), ("added", 5)] + BASELINE_ROWS[2:]
+
+
+def test_added_row_below_header_goes_before_first_data_row():
+    assert plan([2]) == BASELINE_ROWS[:1] + [("added", 2)] + BASELINE_ROWS[1:]
+
+
+def test_added_row_without_anchor_goes_to_end():
+    # 上一行"孤"在基准文件中找不到对应的行
+    assert plan([7]) == BASELINE_ROWS + [("added", 7)]
+
+
+def test_every_row_appears_once():
+    added = [2, 4, 5, 7]
+    result = plan(added)
+    assert sorted(row for source, row in result if source == "added") == added
+    assert [item for item in result if item[0] == "baseline"] == BASELINE_ROWS
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""快速读取后端：直接解析XML得到的数值表与openpyxl后端一致"""
+
+import pytest
+from openpyxl.utils.datetime import CALENDAR_MAC_1904
+
+from compare_excel_web import load_sheet_table, read_xlsx_values
+from conftest import make_edge_workbook, make_workbook, sample_rows
+
+
+def assert_same_table(path):
+    expected = load_sheet_table(path, "openpyxl")
+    table = load_sheet_table(path, "fast")
+    assert table.title == expected.title
+    assert table.sheetnames == expected.sheetnames
+    assert table.rows == expected.rows
+    assert table.declared_dimensions == expected.declared_dimensions
+    for row_fast, row_openpyxl in zip(table.rows, expected.rows):
+        assert [type(value) for value in row_fast] == [type(value) for value in row_openpyxl]
+
+
+def test_report_workbook(tmp_path):
+    baseline, _ = sample_rows()
+    assert_same_table(make_workbook(str(tmp_path / "data.xlsx"), baseline))
+
+
+@pytest.mark.parametrize("epoch, active", [(None, 0), (CALENDAR_MAC_1904, 0), (None, 1)])
+def test_edge_cases(tmp_path, epoch, active):
+    assert_same_table(make_edge_workbook(str(tmp_path / "edge.xlsx"), epoch, active))
+
+
+def test_returns_loaded_columns_and_dimensions(tmp_path):
+    title, sheetnames, rows, loaded_cols, declared_dimensions = read_xlsx_values(make_edge_workbook(str(tmp_path / "edge.xlsx")))
+    assert title == "数据"
+    assert sheetnames == ["数据", "其他"]
+    assert loaded_cols is None
+    assert declared_dimensions == (6, 9)
+    assert len(rows) == 6
+
+
+def test_unknown_reader_is_rejected(tmp_path):
+    baseline, _ = sample_rows()
+    with pytest.raises(ValueError):
+        load_sheet_table(make_workbook(str(tmp_path / "data.xlsx"), baseline), "xml")
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""GUI会话内的数值表缓存（需要安装CustomTkinter）"""
+
+import os
+import shutil
+import sys
+import types
+
+import pytest
+
+from conftest import KEY_FIELDS, PROJECT_ROOT, make_workbook, sample_rows
+
+pytest.importorskip("customtkinter")
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "gui"))
+import compare_excel  # noqa: E402
+
+
+def drain_log():
+    lines = []
+    while not compare_excel.log_queue.empty():
+        lines.append(compare_excel.log_queue.get())
+    return lines
+
+
+@pytest.fixture
+def workbooks(tmp_path):
+    baseline, compare = sample_rows()
+    return (
+        make_workbook(str(tmp_path / "my" / "data.xlsx"), baseline),
+        make_workbook(str(tmp_path / "from" / "data.xlsx"), compare),
+    )
+
+
+def test_lookup_and_put(workbooks):
+    cache = compare_excel.SessionTableCache()
+    path = workbooks[0]
+    assert cache.lookup(path) is None
+    table = compare_excel.load_sheet_table(path)
+    cache.put(path, table)
+    assert cache.lookup(path) is table
+
+
+def test_modified_file_is_not_reused(workbooks):
+    cache = compare_excel.SessionTableCache()
+    path = workbooks[0]
+    cache.put(path, compare_excel.load_sheet_table(path))
+    info = os.stat(path)
+    os.utime(path, ns=(info.st_atime_ns, info.st_mtime_ns + 10 ** 9))
+    assert cache.lookup(path) is None
+
+
+def test_least_recently_used_entry_is_dropped(workbooks):
+    cache = compare_excel.SessionTableCache(max_entries=1)
+    for path in workbooks:
+        cache.put(path, compare_excel.load_sheet_table(path))
+    assert cache.lookup(workbooks[0]) is None
+    assert cache.lookup(workbooks[1]) is not None
+
+
+def test_session_tables_go_through_the_parse_cache(workbooks, tmp_path):
+    """两个新的会话：第一次比较写入解析缓存，第二次从解析缓存加载两个文件"""
+    cache_dir = str(tmp_path / "cache")
+    out = str(tmp_path / "out")
+    os.makedirs(out)
+    drain_log()
+    for session in range(2):
+        table_cache = compare_excel.SessionTableCache()
+        assert compare_excel.compare_excel_files(
+            workbooks[0], workbooks[1], os.path.join(out, f"my_{session}.xlsx"), os.path.join(out, f"from_{session}.xlsx"),
+            out, "data", str(session), 3, list(KEY_FIELDS), cache_dir=cache_dir, table_cache=table_cache,
+        )
+        log = drain_log()
+        assert table_cache.lookup(workbooks[0]) is not None
+        assert len(os.listdir(cache_dir)) == 2
+    assert "基准文件内容未变化，已从解析缓存加载" in log
+    assert "比较文件内容未变化，已从解析缓存加载" in log
+
+
+
+def test_preload_fills_the_cache_once(workbooks):
+    cache = compare_excel.SessionTableCache()
+    path = workbooks[0]
+    loads = []
+    
+    def loader(path):
+        loads.append(path)
+        return compare_excel.load_sheet_table(path)
+    
+    cache.preload(path, loader)
+    assert cache.wait(path, 10)
+    assert cache.lookup(path) is not None
+    # 已缓存的文件不再重复加载
+    cache.preload(path, loader)
+    assert cache.wait(path, 10)
+    assert loads == [os.path.abspath(path)]
+
+
+def test_failed_preload_leaves_the_cache_empty(workbooks):
+    cache = compare_excel.SessionTableCache()
+    cache.preload(workbooks[0], lambda path: 1 / 0)
+    assert cache.wait(workbooks[0], 10)
+    assert cache.lookup(workbooks[0]) is None
+
+
+def test_first_compare_reuses_preloaded_tables(workbooks, tmp_path):
+    table_cache = compare_excel.SessionTableCache()
+    for path in workbooks:
+        table_cache.preload(path, compare_excel.load_sheet_table)
+    out = str(tmp_path / "out")
+    os.makedirs(out)
+    drain_log()
+    assert compare_excel.compare_excel_files(
+        workbooks[0], workbooks[1], os.path.join(out, "my.xlsx"), os.path.join(out, "from.xlsx"),
+        out, "data", "T", 3, list(KEY_FIELDS), table_cache=table_cache,
+    )
+    log = drain_log()
+    # 会话中的第一次比较就直接使用预加载的数值表
+    assert "基准文件已在本次会话中加载且未修改，直接复用" in log
+    assert "比较文件已在本次会话中加载且未修改，直接复用" in log
+
+
+class FakeWidget:
+    """代替界面控件，只提供比较任务用到的 get() 和 configure()"""
+
+    def __init__(self, value=None):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def configure(self, **kwargs):
+        pass
+
+
+@pytest.fixture
+def run_worker(workbooks, tmp_path, monkeypatch):
+    """以新的会话执行一次GUI比较任务，返回本次的日志；不创建窗口，也不打开结果文件"""
+    monkeypatch.setattr(compare_excel.subprocess, "Popen", lambda *args, **kwargs: None)
+    results_folder = tmp_path / "results"
+    results_folder.mkdir()
+    
+    def run():
+        gui = types.SimpleNamespace(
+            baseline_file=workbooks[0],
+            compare_file=workbooks[1],
+            header_row_var=FakeWidget("3"),
+            feature_cols_var=FakeWidget("1,2,3"),
+            include_cols_var=FakeWidget(""),
+            exclude_cols_var=FakeWidget(""),
+            results_folder=str(results_folder),
+            output_mode_optionmenu=FakeWidget(next(iter(compare_excel.OUTPUT_MODES))),
+            highlight_mode_optionmenu=FakeWidget(next(iter(compare_excel.HIGHLIGHT_MODE_OPTIONS))),
+            diff_workers_optionmenu=FakeWidget("1"),
+            reader_optionmenu=FakeWidget(next(iter(compare_excel.READER_OPTIONS))),
+            cache_folder=str(tmp_path / "cache"),
+            table_cache=compare_excel.SessionTableCache(),
+            result_cache=compare_excel.ResultCache(str(tmp_path / "result_cache")),
+            stop_event=None,
+            start_button=FakeWidget(),
+            stop_button=FakeWidget(),
+            running=True,
+        )
+        drain_log()
+        compare_excel.ExcelCompareGUI._compare_worker(gui)
+        return drain_log()
+    
+    return run
+
+
+def test_selected_file_is_preloaded_through_the_parse_cache(workbooks, tmp_path):
+    gui = types.SimpleNamespace(
+        header_row_var=FakeWidget(""),
+        reader_optionmenu=FakeWidget(next(iter(compare_excel.READER_OPTIONS))),
+        cache_folder=str(tmp_path / "cache"),
+        table_cache=compare_excel.SessionTableCache(),
+    )
+    compare_excel.ExcelCompareGUI._preload_table(gui, workbooks[0])
+    assert gui.table_cache.wait(workbooks[0], 10)
+    assert gui.table_cache.lookup(workbooks[0]) is not None
+    assert len(os.listdir(tmp_path / "cache")) == 1
+
+
+def test_worker_baseline_goes_through_the_parse_cache(run_worker, tmp_path):
+    # 结果缓存不可用时，第二个会话仍应从解析缓存加载两个文件
+    log = run_worker()
+    assert "\n✅ 任务完成！" in log
+    assert len(os.listdir(tmp_path / "cache")) == 2
+    shutil.rmtree(tmp_path / "result_cache")
+    log = run_worker()
+    assert "基准文件内容未变化，已从解析缓存加载" in log
+    assert "比较文件内容未变化，已从解析缓存加载" in log
+
+
+def test_worker_result_cache_hit_skips_the_preview(run_worker, monkeypatch):
+    log = run_worker()
+    assert "\n✅ 任务完成！" in log
+    previews = []
+    monkeypatch.setattr(compare_excel, "read_sheet_preview", lambda *args: previews.append(args))
+    # 第二次比较命中结果缓存，在读取表头预览之前返回
+    log = run_worker()
+    assert "\n文件内容和比较选项与之前的比较相同，直接使用已有的结果文件：" in log
+    assert "\n✅ 任务完成！" in log
+    assert previews == []
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""条件格式标记：按行的列区段合并为矩形区域"""
+
+import random
+
+from compare_excel_web import coalesce_ranges, plan_highlight_runs
+
+
+def covered_cells(rects):
+    """矩形区域覆盖的单元格，同一单元格被覆盖多次时重复出现"""
+    return [
+        (row, col)
+        for start_row, col_start, end_row, col_end in rects
+        for row in range(start_row, end_row + 1)
+        for col in range(col_start, col_end + 1)
+    ]
+
+
+def test_adjacent_runs_in_a_row_are_merged():
+    assert coalesce_ranges([(3, 1, 1), (3, 2, 2), (3, 4, 5)]) == [(3, 1, 3, 2), (3, 4, 3, 5)]
+
+
+def test_consecutive_rows_with_same_columns_form_one_rect():
+    assert coalesce_ranges([(2, 1, 7), (3, 1, 7), (4, 1, 7)]) == [(2, 1, 4, 7)]
+
+
+def test_gap_between_rows_splits_rects():
+    assert sorted(coalesce_ranges([(2, 1, 7), (4, 1, 7)])) == [(2, 1, 2, 7), (4, 1, 4, 7)]
+
+
+def test_empty_input():
+    assert coalesce_ranges([]) == []
+
+
+def test_rects_cover_exactly_the_input_cells():
+    rng = random.Random(9)
+    for _ in range(100):
+        runs = []
+        for _ in range(rng.randint(0, 40)):
+            col_start = rng.randint(1, 8)
+            runs.append((rng.randint(1, 15), col_start, col_start + rng.randint(0, 3)))
+        expected = {(row, col) for row, col_start, col_end in runs for col in range(col_start, col_end + 1)}
+        cells = covered_cells(coalesce_ranges(runs))
+        # 每个单元格恰好被一个矩形覆盖
+        assert len(cells) == len(set(cells))
+        assert set(cells) == expected
+
+
+def test_highlight_runs_use_output_rows():
+    diff_plan = [("baseline", 1), ("baseline", 2), ("added", 5), ("baseline", 3)]
+    changed_cells = [(3, 2, 4, 2)]
+    changed, deleted, added = plan_highlight_runs(diff_plan, changed_cells, [2], 7)
+    assert changed == [(4, 2, 2)]
+    assert deleted == [(2, 1, 7)]
+    assert added == [(3, 1, 7)]
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""解析缓存：按文件内容索引，重复加载直接读取上次的解析结果"""
+
+import os
+import shutil
+
+import pytest
+
+import compare_excel_web
+from compare_excel_web import ColumnProjection, ParseCache, file_sha256, load_sheet_table, load_sheet_tables
+from conftest import make_workbook, sample_rows
+
+
+@pytest.fixture
+def workbooks(tmp_path):
+    baseline, compare = sample_rows()
+    return make_workbook(str(tmp_path / "a.xlsx"), baseline), make_workbook(str(tmp_path / "b.xlsx"), compare)
+
+
+def test_key_depends_on_content_not_path(tmp_path, workbooks):
+    cache = ParseCache(str(tmp_path / "cache"))
+    copy_path = str(tmp_path / "copy" / "a.xlsx")
+    os.makedirs(os.path.dirname(copy_path))
+    shutil.copyfile(workbooks[0], copy_path)
+    assert cache.entry_path(copy_path, 3) == cache.entry_path(workbooks[0], 3)
+    assert cache.entry_path(workbooks[1], 3) != cache.entry_path(workbooks[0], 3)
+
+
+def test_key_depends_on_header_row_and_projection(tmp_path, workbooks):
+    cache = ParseCache(str(tmp_path / "cache"))
+    path = workbooks[0]
+    entries = {
+        cache.entry_path(path, 3),
+        cache.entry_path(path, 4),
+        cache.entry_path(path, 3, ColumnProjection(3, include=["数量"])),
+        cache.entry_path(path, 3, ColumnProjection(3, exclude=["数量"])),
+    }
+    assert len(entries) == 4
+
+
+def test_known_hash_gives_the_same_key(tmp_path, workbooks):
+    cache = ParseCache(str(tmp_path / "cache"))
+    path = workbooks[0]
+    assert cache.entry_path(path, 3, sha256=file_sha256(path)) == cache.entry_path(path, 3)
+
+
+def test_store_and_load(tmp_path, workbooks):
+    cache = ParseCache(str(tmp_path / "cache"))
+    entry = cache.entry_path(workbooks[0], 3)
+    assert cache.load(entry) is None
+    table = load_sheet_table(workbooks[0])
+    cache.store(entry, table)
+    cached = cache.load(entry)
+    assert cached.from_cache
+    assert cached.rows == table.rows
+    assert (cached.title, cached.sheetnames, cached.declared_dimensions) == (table.title, table.sheetnames, table.declared_dimensions)
+
+
+def test_corrupt_entry_is_discarded(tmp_path, workbooks):
+    cache = ParseCache(str(tmp_path / "cache"))
+    entry = cache.entry_path(workbooks[0], 3)
+    os.makedirs(cache.folder)
+    with open(entry, "wb") as f:
+        f.write(b"not a pickle")
+    assert cache.load(entry) is None
+    assert not os.path.exists(entry)
+
+
+def test_evicts_least_recently_used(tmp_path, workbooks):
+    cache = ParseCache(str(tmp_path / "cache"))
+    table = load_sheet_table(workbooks[0])
+    entries = [os.path.join(cache.folder, f"{i}.pkl") for i in range(3)]
+    for i, entry in enumerate(entries):
+        cache.store(entry, table)
+        os.utime(entry, (1000 + i, 1000 + i))
+    # 读取第一个条目，使其成为最近使用的条目
+    cache.load(entries[0])
+    cache.max_bytes = os.path.getsize(entries[0]) * 2
+    cache.evict()
+    assert [os.path.exists(entry) for entry in entries] == [True, False, True]
+
+
+def test_load_sheet_tables_uses_cache(tmp_path, workbooks, monkeypatch):
+    cache = ParseCache(str(tmp_path / "cache"))
+    tables, _ = load_sheet_tables(list(workbooks), parallel=False, cache=cache, header_row=3)
+    assert not any(table.from_cache for table in tables)
+    assert len(os.listdir(cache.folder)) == 2
+    
+    # 已知哈希时不再重新读取文件计算
+    hashes = {path: file_sha256(path) for path in workbooks}
+    def fail(path):
+        raise AssertionError("文件被重复计算哈希")
+    monkeypatch.setattr(compare_excel_web, "file_sha256", fail)
+    cached, _ = load_sheet_tables(list(workbooks), parallel=False, cache=cache, header_row=3, file_hashes=hashes)
+    assert all(table.from_cache for table in cached)
+    assert [table.rows for table in cached] == [table.rows for table in tables]
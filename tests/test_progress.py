@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""比较进度：结构化进度事件和发送频率限制"""
+
+from compare_excel_web import PROGRESS_PHASES, ProgressReporter
+
+
+def test_events_cover_phases_in_order():
+    events = []
+    progress = ProgressReporter(events.append, min_interval=0)
+    progress.start("加载文件", 2)
+    progress.update(1)
+    progress.update(2)
+    progress.start("行匹配", 0)
+    progress.finish()
+    assert [(event["phase"], event["processed"], event["total"]) for event in events] == [
+        ("加载文件", 0, 2), ("加载文件", 1, 2), ("加载文件", 2, 2), ("行匹配", 0, 0), ("完成", 0, 0),
+    ]
+    assert [event["phase_index"] for event in events] == [1, 1, 1, 2, len(PROGRESS_PHASES)]
+    assert all(event["phase_count"] == len(PROGRESS_PHASES) for event in events)
+    # 各阶段均分整体进度，工作量为0的阶段按刚开始计算
+    assert [event["percent"] for event in events] == [0.0, 10.0, 20.0, 20.0, 100.0]
+    # 还没有完成任何工作时无法估计剩余时间
+    assert events[0]["eta_seconds"] is None
+    assert events[2]["eta_seconds"] == 0.0
+
+
+def test_updates_are_throttled():
+    events = []
+    progress = ProgressReporter(events.append, min_interval=3600)
+    progress.start("单元格比较", 100)
+    for processed in range(1, 101):
+        progress.update(processed)
+    # 阶段内的更新被限制，阶段开始和结束总是发送
+    assert [event["processed"] for event in events] == [0, 100]
+
+
+def test_without_callback_nothing_is_sent():
+    progress = ProgressReporter()
+    progress.start("加载文件", 2)
+    progress.update(2)
+    progress.finish()
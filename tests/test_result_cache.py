@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""比较结果缓存：按文件内容和比较选项命中，结果文件删除后失效，超过容量时淘汰最久未用的条目"""
+
+import os
+import time
+
+from compare_excel_web import ResultCache, ResultsJanitor, file_sha256
+
+OPTIONS = {"header_row": 3, "key_fields": ["部门"]}
+
+
+def write_files(folder, name, size):
+    """生成一组结果文件，返回路径列表"""
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for suffix in ("my", "from", "diff"):
+        path = os.path.join(folder, f"{name}_{suffix}.xlsx")
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        paths.append(path)
+    return paths
+
+
+def test_key_depends_on_content_and_options(sample_pair, tmp_path):
+    baseline_path, compare_path = sample_pair
+    key = ResultCache.key(baseline_path, compare_path, OPTIONS)
+    assert key == ResultCache.key_from_hashes(file_sha256(baseline_path), file_sha256(compare_path), OPTIONS)
+    # 与文件路径无关
+    copy_path = str(tmp_path / "copy.xlsx")
+    with open(baseline_path, "rb") as src, open(copy_path, "wb") as dst:
+        dst.write(src.read())
+    assert ResultCache.key(copy_path, compare_path, OPTIONS) == key
+    # 交换两个文件或改变选项时键不同
+    assert ResultCache.key(compare_path, baseline_path, OPTIONS) != key
+    assert ResultCache.key(baseline_path, compare_path, {**OPTIONS, "header_row": 4}) != key
+
+
+def test_store_and_lookup(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    files = write_files(str(tmp_path / "results"), "a", 10)
+    assert cache.lookup("k") is None
+    cache.store("k", files, "比较完成")
+    manifest = cache.lookup("k")
+    assert manifest == {"files": [os.path.abspath(path) for path in files], "output": "比较完成"}
+
+
+def test_deleted_result_file_invalidates_entry(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    files = write_files(str(tmp_path / "results"), "a", 10)
+    cache.store("k", files)
+    os.remove(files[1])
+    assert cache.lookup("k") is None
+    assert os.listdir(tmp_path / "cache") == []
+
+
+def test_corrupt_manifest_is_removed(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    os.makedirs(cache.folder)
+    with open(os.path.join(cache.folder, "k.json"), "w") as f:
+        f.write("{")
+    assert cache.lookup("k") is None
+    assert os.listdir(cache.folder) == []
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=70)
+    results = str(tmp_path / "results")
+    old_files = write_files(results, "old", 10)
+    cache.store("old", old_files)
+    used_files = write_files(results, "used", 10)
+    cache.store("used", used_files)
+    past = time.time() - 100
+    for key in ("old", "used"):
+        os.utime(os.path.join(cache.folder, key + ".json"), (past, past))
+    # 命中的条目更新为最近使用
+    assert cache.lookup("used") is not None
+    cache.store("new", write_files(results, "new", 10))
+    assert cache.lookup("old") is None
+    assert not any(os.path.exists(path) for path in old_files)
+    assert cache.lookup("used") is not None
+    assert cache.lookup("new") is not None
+
+
+def test_eviction_keeps_files_being_downloaded(tmp_path):
+    results = str(tmp_path / "results")
+    janitor = ResultsJanitor(results)
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=30, janitor=janitor)
+    old_files = write_files(results, "old", 10)
+    cache.store("old", old_files)
+    past = time.time() - 100
+    os.utime(os.path.join(cache.folder, "old.json"), (past, past))
+    assert janitor.acquire(old_files[0])
+    cache.store("new", write_files(results, "new", 10))
+    # 条目被淘汰，正在下载的文件保留，其余文件经由清理删除
+    assert cache.lookup("old") is None
+    assert [os.path.exists(path) for path in old_files] == [True, False, False]
+    assert not any(name.endswith(".deleting") for name in os.listdir(results))
+    janitor.release(old_files[0])
+
+
+def test_newest_entry_is_kept_even_if_too_large(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=1)
+    files = write_files(str(tmp_path / "results"), "a", 10)
+    cache.store("k", files)
+    assert cache.lookup("k") is not None
+
+
+def test_compare_endpoint_reuses_results(server, client, sample_pair, monkeypatch):
+    files = {
+        "baselineFile": ("data.xlsx", open(sample_pair[0], "rb").read()),
+        "compareFile": ("data.xlsx", open(sample_pair[1], "rb").read()),
+    }
+    monkeypatch.setattr(server, "COMPARE_INLINE", True)
+    first = client.post("/api/compare", files=files).json()
+    second = client.post("/api/compare", files=files).json()
+    assert first["state"] == second["state"] == "succeeded"
+    assert second["message"] == "文件和比较选项与之前的比较相同，直接返回已有的结果文件"
+    assert second["resultFiles"] == first["resultFiles"]
+    # 命中缓存时不再保留上传的文件
+    assert os.listdir(server.UPLOAD_FOLDER) == []
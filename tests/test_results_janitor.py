@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""结果目录清理：按保留时长和总大小删除结果文件，跳过正在下载的文件和非结果文件"""
+
+import os
+import time
+
+from compare_excel_web import ResultCache, ResultsJanitor
+
+
+def write_file(folder, name, size=10, age=0):
+    """生成文件，修改时间设为age秒以前"""
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_expired_files_are_removed(tmp_path):
+    folder = str(tmp_path)
+    old = write_file(folder, "old.xlsx", age=200)
+    new = write_file(folder, "new.xlsx", age=10)
+    cleaned = []
+    janitor = ResultsJanitor(folder, ttl_seconds=100, on_cleanup=lambda *args: cleaned.append(args))
+    assert janitor.run_once() == (1, 10)
+    assert not os.path.exists(old)
+    assert os.path.exists(new)
+    assert cleaned == [(1, 10)]
+    assert janitor.run_once() == (0, 0)
+    assert cleaned == [(1, 10)]
+
+
+def test_size_cap_removes_oldest_files_first(tmp_path):
+    folder = str(tmp_path)
+    paths = [write_file(folder, f"{i}.xlsx", age=age) for i, age in enumerate((400, 300, 200, 5))]
+    janitor = ResultsJanitor(folder, ttl_seconds=3600, max_bytes=15, min_age_seconds=100)
+    # 删除最旧的两个后仍超过上限，最新的文件还在最短保留时间内，不删除
+    assert janitor.run_once() == (3, 30)
+    assert [os.path.exists(path) for path in paths] == [False, False, False, True]
+
+
+def test_files_being_downloaded_are_kept(tmp_path):
+    folder = str(tmp_path)
+    path = write_file(folder, "old.xlsx", age=200)
+    janitor = ResultsJanitor(folder, ttl_seconds=100)
+    assert janitor.acquire(path)
+    assert janitor.acquire(path)
+    janitor.release(path)
+    assert janitor.run_once() == (0, 0)
+    assert janitor.metrics()["downloads_in_progress"] == 1
+    janitor.release(path)
+    assert janitor.run_once() == (1, 10)
+    # 已清理的文件不能再登记下载
+    assert not janitor.acquire(path)
+
+
+def test_only_managed_files_are_removed(tmp_path):
+    folder = str(tmp_path)
+    kept = [write_file(folder, name, age=200) for name in (".gitkeep", ".hidden.xlsx", "说明.txt", "key.json")]
+    removed = [write_file(folder, name, age=200) for name in ("a.xlsx", "B.XLSX")]
+    # 上次改名后没有删掉的文件同样只处理结果文件
+    leftover = write_file(folder, "c.xlsx.deleting")
+    other_leftover = write_file(folder, "notes.txt.deleting")
+    os.mkdir(os.path.join(folder, "sub.xlsx"))
+    janitor = ResultsJanitor(folder, ttl_seconds=100)
+    assert janitor.run_once() == (2, 20)
+    assert all(os.path.exists(path) for path in kept)
+    assert not any(os.path.exists(path) for path in removed)
+    assert not os.path.exists(leftover)
+    assert os.path.exists(other_leftover)
+    assert os.path.isdir(os.path.join(folder, "sub.xlsx"))
+
+
+def test_removed_result_files_drop_cache_entries(tmp_path):
+    folder = str(tmp_path / "results")
+    os.mkdir(folder)
+    janitor = ResultsJanitor(folder, ttl_seconds=100)
+    cache = ResultCache(str(tmp_path / "cache"), janitor=janitor)
+    old_files = [write_file(folder, f"old_{i}.xlsx") for i in range(3)]
+    new_files = [write_file(folder, f"new_{i}.xlsx") for i in range(3)]
+    cache.store("old", old_files)
+    cache.store("new", new_files)
+    os.utime(old_files[0], (0, 0))
+    assert janitor.run_once() == (1, 10)
+    # 引用了被删除文件的条目立即删除，不等到下次查找
+    assert sorted(os.listdir(cache.folder)) == ["new.json"]
+
+
+def test_metrics(tmp_path):
+    folder = str(tmp_path)
+    write_file(folder, "old.xlsx", age=200)
+    write_file(folder, "new.xlsx", size=5)
+    janitor = ResultsJanitor(folder, ttl_seconds=100, max_bytes=1000)
+    janitor.run_once()
+    metrics = janitor.metrics()
+    assert metrics["runs"] == 1
+    assert (metrics["files_removed"], metrics["bytes_reclaimed"]) == (1, 10)
+    assert (metrics["folder_files"], metrics["folder_bytes"]) == (1, 5)
+    assert (metrics["ttl_seconds"], metrics["max_bytes"]) == (100, 1000)
+    assert metrics["errors"] == 0
+
+
+def test_missing_folder(tmp_path):
+    janitor = ResultsJanitor(str(tmp_path / "missing"))
+    assert janitor.run_once() == (0, 0)
+
+
+def test_download_of_removed_file_returns_404(server, client):
+    path = write_file(server.RESULTS_FOLDER, "data_差异结果_T.xlsx", age=10 ** 6)
+    assert client.get("/api/download/data_差异结果_T.xlsx").content == b"x" * 10
+    server.results_janitor.run_once()
+    assert not os.path.exists(path)
+    assert client.get("/api/download/data_差异结果_T.xlsx").status_code == 404
+    assert client.get("/api/metrics").json()["results_janitor"]["files_removed"] == 1
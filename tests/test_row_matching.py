@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""按整行内容匹配行：哈希匹配与原来的逐行顺序查找结果一致"""
+
+import random
+
+from compare_excel_web import match_rows_by_content
+
+
+def match_rows_naive(rows_baseline, rows_compare):
+    """原来的实现：每个基准行顺序查找第一个未使用的相同内容的比较行"""
+    row_mapping = {}
+    for row_baseline, content in enumerate(rows_baseline, start=1):
+        for row_compare, content_compare in enumerate(rows_compare, start=1):
+            if row_compare not in row_mapping.values() and content == content_compare:
+                row_mapping[row_baseline] = row_compare
+                break
+    return row_mapping
+
+
+def test_identical_rows():
+    rows = [("a", 1), ("b", 2), ("c", 3)]
+    assert match_rows_by_content(rows, rows) == {1: 1, 2: 2, 3: 3}
+
+
+def test_duplicates_are_consumed_in_order():
+    rows_baseline = [("x",), ("x",), ("y",), ("x",)]
+    rows_compare = [("y",), ("x",), ("x",)]
+    # 第三个 ("x",) 没有可用的比较行
+    assert match_rows_by_content(rows_baseline, rows_compare) == {1: 2, 2: 3, 3: 1}
+
+
+def test_empty_inputs():
+    assert match_rows_by_content([], [("a",)]) == {}
+    assert match_rows_by_content([("a",)], []) == {}
+
+
+def test_matches_naive_implementation():
+    rng = random.Random(2)
+    for _ in range(50):
+        # 取值范围很小，保证有大量重复行和无法匹配的行
+        rows_baseline = [(rng.randint(0, 4), rng.choice("ab")) for _ in range(rng.randint(0, 30))]
+        rows_compare = [(rng.randint(0, 4), rng.choice("abc")) for _ in range(rng.randint(0, 30))]
+        assert match_rows_by_content(rows_baseline, rows_compare) == match_rows_naive(rows_baseline, rows_compare)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""比较任务队列：排队位置、队列上限、进程池执行和任务状态接口（需要安装FastAPI）"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import KEY_FIELDS
+
+
+def job_args(sample_pair, out, name="T"):
+    baseline_path, compare_path = sample_pair
+    return {
+        "baseline_path": baseline_path,
+        "compare_path": compare_path,
+        "output_baseline_path": os.path.join(out, f"data_my_比较结果_{name}.xlsx"),
+        "output_compare_path": os.path.join(out, f"data_from_比较结果_{name}.xlsx"),
+        "original_filename": "data",
+        "timestamp": name,
+        "header_row": 3,
+        "key_fields": list(KEY_FIELDS),
+    }
+
+
+def result_files(args):
+    out = os.path.dirname(args["output_baseline_path"])
+    return [os.path.join(out, f"data_差异结果_{args['timestamp']}.xlsx"), args["output_baseline_path"], args["output_compare_path"]]
+
+
+def wait_for(manager, job_id, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = manager.status(job_id)
+        if status["state"] in ("succeeded", "failed"):
+            return status
+        time.sleep(0.1)
+    raise AssertionError("任务未在限定时间内结束")
+
+
+def test_queue_positions_and_limit(server):
+    manager = server.CompareJobManager(1, 3)
+    # 模拟工作进程全部繁忙，新任务只进入等待队列
+    manager.running = 1
+    assert manager.full_position() is None
+    first = manager.submit({}, [], [])
+    second = manager.submit({}, [], [])
+    assert [manager.status(job.job_id)["queue_position"] for job in (first, second)] == [1, 2]
+    assert manager.status(first.job_id)["state"] == "queued"
+    # 排队和执行中的任务总数达到上限
+    assert manager.full_position() == 3
+    assert manager.submit({}, [], []) is None
+    assert manager.status("missing") is None
+
+
+def test_job_runs_in_process_pool(server, sample_pair, tmp_path):
+    args = job_args(sample_pair, str(tmp_path))
+    job = server.job_manager.submit(args, result_files(args), [])
+    status = wait_for(server.job_manager, job.job_id)
+    assert status["state"] == "succeeded"
+    assert status["resultFiles"] == [os.path.basename(path) for path in result_files(args)]
+    assert "比较完成" in status["stdout"]
+    assert status["queue_seconds"] >= 0 and status["run_seconds"] >= 0
+    # 进度事件由工作进程写入共享字典
+    assert status["progress"]["phase"] == "完成"
+
+
+def test_job_without_results_fails(server, sample_pair, tmp_path):
+    args = job_args(sample_pair, str(tmp_path))
+    args["baseline_path"] = str(tmp_path / "missing.xlsx")
+    job = server.job_manager.submit(args, result_files(args), [])
+    status = wait_for(server.job_manager, job.job_id)
+    assert status["state"] == "failed"
+    assert "找不到文件" in status["error"]
+    assert status["resultFiles"] == []
+
+
+def test_run_inline_returns_finished_job(server, sample_pair, tmp_path):
+    args = job_args(sample_pair, str(tmp_path))
+    temp_copy = str(tmp_path / "temp.xlsx")
+    with open(temp_copy, "wb"):
+        pass
+    job = server.job_manager.run_inline(args, result_files(args), [temp_copy])
+    assert job.state == "succeeded"
+    assert server.job_manager.running == 0
+    # 任务结束后删除临时文件
+    assert not os.path.exists(temp_copy)
+
+
+def test_concurrent_inline_jobs_keep_their_own_output(server, sample_pair, tmp_path):
+    names = ["A%d" % i for i in range(4)]
+    jobs = [job_args(sample_pair, str(tmp_path), name) for name in names]
+    # 同步模式下多个任务在线程池中同时执行
+    with ThreadPoolExecutor(len(jobs)) as executor:
+        outputs = list(executor.map(server.run_compare_job, jobs))
+    for name, output in zip(names, outputs):
+        assert output.count("比较完成") == 1
+        assert f"_比较结果_{name}.xlsx" in output
+        assert not any(f"_比较结果_{other}.xlsx" in output for other in names if other != name)
+
+
+def upload_pair(sample_pair):
+    return {
+        "baselineFile": ("data.xlsx", open(sample_pair[0], "rb").read()),
+        "compareFile": ("data.xlsx", open(sample_pair[1], "rb").read()),
+    }
+
+
+def test_compare_endpoint_returns_job(server, client, sample_pair):
+    response = client.post("/api/compare", files=upload_pair(sample_pair), data={"use_cache": "false"})
+    assert response.status_code == 202
+    job = response.json()
+    assert job["state"] in ("queued", "running")
+    status = wait_for(server.job_manager, job["job_id"])
+    assert status["state"] == "succeeded"
+    assert client.get(f"/api/jobs/{job['job_id']}").json()["resultFiles"] == status["resultFiles"]
+    # 已结束的任务只推送done事件
+    with client.stream("GET", f"/api/jobs/{job['job_id']}/events") as events:
+        lines = [line for line in events.iter_lines() if line]
+    assert lines[0] == "event: done"
+    assert json.loads(lines[1][len("data: "):])["state"] == "succeeded"
+    # 上传的临时文件在任务结束后删除
+    assert os.listdir(server.UPLOAD_FOLDER) == []
+
+
+def test_unknown_job_returns_404(client):
+    assert client.get("/api/jobs/missing").status_code == 404
+    assert client.get("/api/jobs/missing/events").status_code == 404
+
+
+def test_inline_mode_returns_final_status(server, client, sample_pair, monkeypatch):
+    monkeypatch.setattr(server, "COMPARE_INLINE", True)
+    response = client.post("/api/compare", files=upload_pair(sample_pair), data={"use_cache": "false"})
+    assert response.status_code == 200
+    assert response.json()["state"] == "succeeded"
+    assert len(response.json()["resultFiles"]) == 3
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""上传文件的接收：按块写盘、大小上限和文件格式检查（需要安装FastAPI）"""
+
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+
+from conftest import make_workbook, sample_rows
+
+
+@pytest.fixture
+def xlsx_bytes(tmp_path):
+    baseline, _ = sample_rows()
+    with open(make_workbook(str(tmp_path / "data.xlsx"), baseline), "rb") as f:
+        return f.read()
+
+
+def save(server, content, folder, **kwargs):
+    from fastapi import UploadFile
+    return asyncio.run(server.save_upload(UploadFile(io.BytesIO(content), filename="data.xlsx"), folder=folder, **kwargs))
+
+
+def test_saves_in_chunks_and_hashes(server, xlsx_bytes, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "UPLOAD_CHUNK_SIZE", 1000)
+    path, sha256 = save(server, xlsx_bytes, str(tmp_path))
+    with open(path, "rb") as f:
+        assert f.read() == xlsx_bytes
+    assert sha256 == hashlib.sha256(xlsx_bytes).hexdigest()
+
+
+@pytest.mark.parametrize("content, max_bytes, status_code", [
+    (b"not a zip file", None, 400),
+    (b"", None, 400),
+    (None, 1000, 413),
+])
+def test_rejected_uploads_leave_no_file(server, xlsx_bytes, tmp_path, content, max_bytes, status_code):
+    from fastapi import HTTPException
+    folder = tmp_path / "uploads_test"
+    folder.mkdir()
+    kwargs = {"max_bytes": max_bytes} if max_bytes else {}
+    with pytest.raises(HTTPException) as error:
+        save(server, xlsx_bytes if content is None else content, str(folder), **kwargs)
+    assert error.value.status_code == status_code
+    assert os.listdir(folder) == []
+
+
+def test_oversized_request_is_rejected_before_parsing(server, client, xlsx_bytes, monkeypatch):
+    monkeypatch.setattr(server, "MAX_UPLOAD_BYTES", 1000)
+    monkeypatch.setattr(server, "UPLOAD_FORM_OVERHEAD_BYTES", 0)
+    response = client.post("/api/uploads", files={"file": ("data.xlsx", xlsx_bytes)})
+    assert response.status_code == 413
+    assert "上传内容超过大小上限" in response.json()["detail"]
+    assert os.listdir(server.UPLOAD_FOLDER) == []
+
+
+def test_full_queue_rejects_compare_before_parsing(server, client, xlsx_bytes, monkeypatch):
+    monkeypatch.setattr(server.job_manager, "full_position", lambda: 3)
+    # 请求体不是有效的表单，能返回429说明在解析请求体之前就已拒绝
+    response = client.post("/api/compare", content=b"x" * 100, headers={"content-type": "multipart/form-data; boundary=none"})
+    assert response.status_code == 429
+    assert response.json()["queue_position"] == 3
+    assert response.headers["retry-after"] == str(server.JOB_RETRY_AFTER_SECONDS)
+
+
+def test_invalid_file_is_rejected(client):
+    response = client.post("/api/uploads", files={"file": ("data.xlsx", b"plain text")})
+    assert response.status_code == 400
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""预览读取：只读取左上角的若干行和列，结果与完整加载的对应部分一致"""
+
+import pytest
+
+from compare_excel_web import load_sheet_table, read_sheet_preview
+from conftest import make_edge_workbook, make_workbook, sample_rows
+
+
+def assert_preview_matches(path, max_rows, max_cols):
+    full = load_sheet_table(path)
+    preview = read_sheet_preview(path, max_rows, max_cols)
+    row_count = min(max_rows, full.max_row)
+    col_count = full.max_col if max_cols is None else min(max_cols, full.max_col)
+    for row in range(1, row_count + 1):
+        for col in range(1, col_count + 1):
+            assert preview.value(row, col) == full.value(row, col)
+            assert type(preview.value(row, col)) is type(full.value(row, col))
+    assert preview.max_row <= max_rows
+    if max_cols is not None:
+        assert preview.max_col <= max_cols
+    assert preview.title == full.title
+    assert preview.declared_dimensions == full.declared_dimensions
+
+
+@pytest.mark.parametrize("max_rows, max_cols", [(1, 1), (3, None), (10, 5), (100, 20)])
+def test_report_workbook(tmp_path, max_rows, max_cols):
+    baseline, _ = sample_rows()
+    assert_preview_matches(make_workbook(str(tmp_path / "data.xlsx"), baseline), max_rows, max_cols)
+
+
+@pytest.mark.parametrize("active", [0, 1])
+def test_edge_workbook(tmp_path, active):
+    assert_preview_matches(make_edge_workbook(str(tmp_path / "edge.xlsx"), active=active), 10, 20)
+
+
+def test_preview_stops_after_requested_rows(tmp_path):
+    baseline, _ = sample_rows()
+    preview = read_sheet_preview(make_workbook(str(tmp_path / "data.xlsx"), baseline), 4, 3)
+    assert preview.max_row == 4
+    assert preview.rows[3] == ("销售0部", "HT0000", "P000")
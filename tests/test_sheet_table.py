@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""数值表加载：只读流式加载的结果与完整加载工作簿一致"""
+
+import datetime
+
+import openpyxl
+import pytest
+from openpyxl.styles import Font
+
+import compare_excel_web
+from compare_excel_web import SheetTable, load_sheet_table, load_sheet_tables
+from conftest import make_workbook, sample_rows
+
+
+def full_load_values(path):
+    """以普通模式完整加载工作簿，按行返回单元格值"""
+    wb = openpyxl.load_workbook(path, data_only=True)
+    try:
+        return [tuple(row) for row in wb.active.iter_rows(values_only=True)]
+    finally:
+        wb.close()
+
+
+def test_values_match_full_load(tmp_path):
+    baseline, _ = sample_rows()
+    path = make_workbook(str(tmp_path / "data.xlsx"), baseline)
+    table = load_sheet_table(path)
+    expected = full_load_values(path)
+    assert table.max_row == len(expected)
+    for row in range(1, table.max_row + 1):
+        for col in range(1, table.max_col + 1):
+            assert table.value(row, col) == expected[row - 1][col - 1]
+    assert table.title == "明细"
+    assert table.sheetnames == ["明细"]
+
+
+def test_value_types_are_preserved(tmp_path):
+    rows = [("A", 1, 2.5, True, datetime.datetime(2026, 1, 2, 3, 4, 5), None, "尾")]
+    table = load_sheet_table(make_workbook(str(tmp_path / "types.xlsx"), rows))
+    assert table.rows[3] == rows[0]
+
+
+def test_short_rows_are_padded():
+    table = SheetTable("表", ["表"], [("a",), ("b", "c", "d"), ()])
+    assert table.max_row == 3
+    assert table.max_col == 3
+    assert table.rows[0] == ("a", None, None)
+    assert table.rows[2] == (None, None, None)
+    assert table.value(2, 3) == "d"
+    # 超出范围时返回None
+    assert table.value(4, 1) is None
+    assert table.value(1, 4) is None
+    assert table.value(0, 1) is None
+
+
+def test_header_name_strips_whitespace():
+    table = SheetTable("表", ["表"], [(" 部门 ", None, 3)])
+    assert table.header_name(1, 1) == "部门"
+    assert table.header_name(1, 2) == ""
+    assert table.header_name(1, 3) == "3"
+
+
+def test_parallel_load_matches_sequential_load(tmp_path, monkeypatch):
+    baseline, compare = sample_rows()
+    paths = [make_workbook(str(tmp_path / "a.xlsx"), baseline), make_workbook(str(tmp_path / "b.xlsx"), compare)]
+    sequential, used_parallel = load_sheet_tables(paths, parallel=False)
+    assert not used_parallel
+    # 测试文件很小，降低阈值使并行加载生效
+    monkeypatch.setattr(compare_excel_web, "PARALLEL_LOAD_MIN_BYTES", 0)
+    parallel, used_parallel = load_sheet_tables(paths, parallel=True)
+    assert used_parallel
+    assert [table.rows for table in parallel] == [table.rows for table in sequential]
+
+
+@pytest.mark.parametrize("reader", ["openpyxl", "fast"])
+def test_used_range_ignores_leftover_formatting(tmp_path, reader):
+    path = str(tmp_path / "formatted.xlsx")
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws["A1"] = "表头"
+    ws["C3"] = 1
+    # 数据区以外残留的格式使声明的尺寸远大于实际数据
+    ws["Z500"].font = Font(bold=True)
+    ws["D2"].font = Font(bold=True)
+    wb.save(path)
+    table = load_sheet_table(path, reader)
+    assert table.declared_dimensions == (500, 26)
+    assert (table.max_row, table.max_col) == (3, 3)
+    # 中间的空行保留，行号不变
+    assert table.rows == [("表头", None, None), (None, None, None), (None, None, 1)]
+    assert table.dimension_summary() == "声明尺寸 500行 x 26列，实际使用范围 3行 x 3列"
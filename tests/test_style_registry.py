@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""共享样式缓存：标记填充叠加在源样式上，相同的样式组合只解析一次"""
+
+import openpyxl
+from openpyxl.styles import Border, Font, PatternFill, Side
+
+from compare_excel_web import StyleRegistry
+
+FILL = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
+
+
+def styled_sheet():
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    thin = Side(style="thin")
+    for col in (1, 2):
+        cell = ws.cell(row=1, column=col, value=col)
+        cell.font = Font(name="宋体", bold=col == 2)
+        cell.border = Border(left=thin, right=thin)
+        cell.number_format = "0.00"
+    return ws
+
+
+def test_fill_keeps_source_style():
+    ws = styled_sheet()
+    registry = StyleRegistry(ws)
+    cell = ws.cell(row=1, column=2)
+    registry.apply_fill(cell, FILL)
+    assert cell.fill == FILL
+    assert (cell.font.name, cell.font.bold) == ("宋体", True)
+    assert cell.border.left.style == "thin"
+    assert cell.number_format == "0.00"
+
+
+def test_same_combination_shares_style():
+    ws = styled_sheet()
+    registry = StyleRegistry(ws)
+    template_style = ws.cell(row=1, column=1)._style
+    cells = [ws.cell(row=row, column=1) for row in (2, 3)]
+    for cell in cells:
+        registry.apply_fill(cell, FILL, template_style)
+    assert cells[0]._style == cells[1]._style
+    assert cells[0]._style is not cells[1]._style
+    assert len(registry._filled_styles) == 1
+    # 模板单元格本身不变
+    assert ws.cell(row=1, column=1).fill.fill_type is None
+    assert cells[0].font.name == "宋体"
+
+
+def test_new_cell_without_style():
+    ws = openpyxl.Workbook().active
+    cell = ws.cell(row=1, column=1)
+    StyleRegistry(ws).apply_fill(cell, FILL)
+    assert cell.fill == FILL
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""上传会话：一次上传多次预览和比较，会话数和总大小上限，过期会话定期删除（需要安装FastAPI）"""
+
+import os
+import shutil
+
+import pytest
+
+
+def session_file(folder, source, name="data.xlsx"):
+    """把测试文件复制到上传目录，模拟已保存的上传文件"""
+    path = os.path.join(folder, name)
+    shutil.copyfile(source, path)
+    return path
+
+
+def test_create_get_and_remove(server, sample_pair):
+    store = server.UploadSessionStore(server.UPLOAD_FOLDER, 3600)
+    path = session_file(server.UPLOAD_FOLDER, sample_pair[0])
+    session = store.create(path, "data.xlsx", "abc")
+    assert store.get(session.upload_id) is session
+    assert store.status(session)["size"] == os.path.getsize(path)
+    assert store.metrics()["sessions"] == 1
+    assert store.remove(session.upload_id)
+    assert not os.path.exists(path)
+    assert store.get(session.upload_id) is None
+    assert not store.remove(session.upload_id)
+
+
+def test_preview_is_reused(server, sample_pair, monkeypatch):
+    store = server.UploadSessionStore(server.UPLOAD_FOLDER, 3600)
+    session = store.create(session_file(server.UPLOAD_FOLDER, sample_pair[0]), "data.xlsx", "abc")
+    reads = []
+    read_sheet_preview = server.read_sheet_preview
+    monkeypatch.setattr(server, "read_sheet_preview", lambda *args: reads.append(args) or read_sheet_preview(*args))
+    table = store.preview(session, 10, 20)
+    # 请求的行数不超过已读取的行数时直接复用
+    assert store.preview(session, 5, 20) is table
+    assert store.preview(session, 12, 20) is not table
+    assert [args[1] for args in reads] == [10, 12]
+
+
+def test_job_link_survives_session_removal(server, sample_pair):
+    store = server.UploadSessionStore(server.UPLOAD_FOLDER, 3600)
+    session = store.create(session_file(server.UPLOAD_FOLDER, sample_pair[0]), "data.xlsx", "abc")
+    link = store.link_for_job(session)
+    assert link != session.path
+    store.remove(session.upload_id)
+    with open(link, "rb") as f, open(sample_pair[0], "rb") as source:
+        assert f.read() == source.read()
+
+
+def test_idle_sessions_are_pruned(server, sample_pair):
+    store = server.UploadSessionStore(server.UPLOAD_FOLDER, 0)
+    path = session_file(server.UPLOAD_FOLDER, sample_pair[0])
+    store.create(path, "data.xlsx", "abc")
+    assert store.prune() == 1
+    assert not os.path.exists(path)
+    assert store.metrics()["sessions"] == 0
+    assert store.prune() == 0
+
+
+def test_session_count_limit(server, sample_pair):
+    store = server.UploadSessionStore(server.UPLOAD_FOLDER, 3600, max_sessions=1)
+    store.create(session_file(server.UPLOAD_FOLDER, sample_pair[0], "a.xlsx"), "a.xlsx", "a")
+    path = session_file(server.UPLOAD_FOLDER, sample_pair[0], "b.xlsx")
+    with pytest.raises(server.HTTPException) as error:
+        store.create(path, "b.xlsx", "b")
+    assert error.value.status_code == 429
+    assert "Retry-After" in error.value.headers
+    # 被拒绝的文件不保留
+    assert not os.path.exists(path)
+
+
+def test_total_size_limit(server, sample_pair):
+    size = os.path.getsize(sample_pair[0])
+    store = server.UploadSessionStore(server.UPLOAD_FOLDER, 3600, max_bytes=size * 3 // 2)
+    store.create(session_file(server.UPLOAD_FOLDER, sample_pair[0], "a.xlsx"), "a.xlsx", "a")
+    # 总大小将超过上限为429，单个文件就超过上限为413
+    with pytest.raises(server.HTTPException) as error:
+        store.create(session_file(server.UPLOAD_FOLDER, sample_pair[0], "b.xlsx"), "b.xlsx", "b")
+    assert error.value.status_code == 429
+    store = server.UploadSessionStore(server.UPLOAD_FOLDER, 3600, max_bytes=size // 2)
+    with pytest.raises(server.HTTPException) as error:
+        store.create(session_file(server.UPLOAD_FOLDER, sample_pair[0], "c.xlsx"), "c.xlsx", "c")
+    assert error.value.status_code == 413
+    assert sorted(os.listdir(server.UPLOAD_FOLDER)) == ["a.xlsx"]
+
+
+def upload(client, path):
+    with open(path, "rb") as f:
+        return client.post("/api/uploads", files={"file": ("data.xlsx", f.read())})
+
+
+def test_upload_preview_and_compare_by_id(server, client, sample_pair, monkeypatch):
+    monkeypatch.setattr(server, "COMPARE_INLINE", True)
+    baseline = upload(client, sample_pair[0]).json()
+    compare = upload(client, sample_pair[1]).json()
+    assert baseline["filename"] == "data.xlsx"
+    preview = client.post("/api/preview", data={"header_row": "3", "upload_id": baseline["upload_id"]}).json()
+    assert preview["upload_id"] == baseline["upload_id"]
+    assert [cell["name"] for cell in preview["header_data"][:3]] == ["部门", "合同号", "产品代码"]
+    response = client.post("/api/compare", data={
+        "baseline_upload_id": baseline["upload_id"], "compare_upload_id": compare["upload_id"], "use_cache": "false",
+    })
+    assert response.json()["state"] == "succeeded"
+    # 会话文件在比较后保留，可以再次比较；任务使用的硬链接已删除
+    assert sorted(os.listdir(server.UPLOAD_FOLDER)) == sorted(
+        os.path.basename(server.upload_sessions.get(item["upload_id"]).path) for item in (baseline, compare)
+    )
+    assert client.delete(f"/api/uploads/{baseline['upload_id']}").json() == {"success": True}
+    assert client.delete(f"/api/uploads/{baseline['upload_id']}").status_code == 404
+    assert client.post("/api/preview", data={"header_row": "3", "upload_id": baseline["upload_id"]}).status_code == 404
+
+
+def test_upload_limits_through_api(server, client, sample_pair, monkeypatch):
+    monkeypatch.setattr(server, "upload_sessions", server.UploadSessionStore(server.UPLOAD_FOLDER, 3600, max_sessions=1))
+    assert upload(client, sample_pair[0]).status_code == 200
+    response = upload(client, sample_pair[0])
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == str(server.UPLOAD_SESSION_PRUNE_INTERVAL)
+    assert client.get("/api/metrics").json()["upload_sessions"]["sessions"] == 1
+    assert len(os.listdir(server.UPLOAD_FOLDER)) == 1
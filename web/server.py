@@ -2,9 +2,11 @@
 # -*- coding: utf-8 -*-
 
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 import os
 import tempfile
 import datetime
@@ -13,9 +15,19 @@ import webbrowser
 import threading
 import requests
 import json
+import hashlib
+import io
+import time
+import asyncio
+import multiprocessing
+import uuid
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
 
 # 导入核心比较函数
-from compare_excel_web import compare_excel_files
+from compare_excel_web import compare_excel_files, STREAMING_FIDELITY_OPTIONS, HIGHLIGHT_MODES, SHEET_READERS, read_sheet_preview, ResultCache, ResultsJanitor
 
 # 初始化FastAPI应用
 app = FastAPI(
@@ -38,6 +50,466 @@ PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 # 在Vercel上，只有/tmp目录是可写的，所以使用/tmp/results
 RESULTS_FOLDER = os.path.join("/tmp", "results")
 os.makedirs(RESULTS_FOLDER, exist_ok=True)
+# 结果文件的保留时长和结果目录总大小上限，可通过环境变量 RESULTS_TTL_HOURS、RESULTS_MAX_MB 配置
+RESULTS_TTL_SECONDS = int(float(os.environ.get("RESULTS_TTL_HOURS", "24")) * 3600)
+RESULTS_MAX_BYTES = int(os.environ.get("RESULTS_MAX_MB", "2048")) * 1024 * 1024
+# 解析缓存目录：重复上传同一个文件时直接读取上次的解析结果
+CACHE_FOLDER = os.path.join("/tmp", "cache")
+# 结果缓存目录：同一对文件以相同选项重复比较时直接返回上次的结果文件，结果文件总大小上限可通过环境变量 RESULT_CACHE_MAX_MB 配置
+RESULT_CACHE_FOLDER = os.path.join("/tmp", "result_cache")
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_MB", "1024")) * 1024 * 1024
+# 上传文件按块写入磁盘，单个文件大小上限可通过环境变量 MAX_UPLOAD_MB 配置
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+# 整个请求体的大小上限：每个文件的上限加上表单字段的余量，超过时按Content-Length在接收请求体之前拒绝
+UPLOAD_FORM_OVERHEAD_BYTES = 1024 * 1024
+UPLOAD_FILE_COUNTS = {"/api/compare": 2, "/api/preview": 1, "/api/uploads": 1}
+# XLSX文件本质是zip压缩包，文件头固定为 "PK\x03\x04"
+XLSX_MAGIC = b"PK\x03\x04"
+
+# 上传会话：文件只上传一次，预览和比较都通过upload_id引用；
+# 会话闲置超过该时长后连同文件一起删除，可通过环境变量 UPLOAD_SESSION_TTL_MINUTES 配置
+UPLOAD_FOLDER = os.path.join("/tmp", "uploads")
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+UPLOAD_SESSION_TTL_SECONDS = int(os.environ.get("UPLOAD_SESSION_TTL_MINUTES", "60")) * 60
+# 同时保留的上传会话数和文件总大小上限，超过时拒绝新的上传，可通过环境变量 UPLOAD_SESSIONS_MAX、UPLOAD_SESSIONS_MAX_MB 配置
+UPLOAD_SESSIONS_MAX = int(os.environ.get("UPLOAD_SESSIONS_MAX", "100"))
+UPLOAD_SESSIONS_MAX_BYTES = int(os.environ.get("UPLOAD_SESSIONS_MAX_MB", "2048")) * 1024 * 1024
+# 后台删除过期上传会话的间隔（秒）
+UPLOAD_SESSION_PRUNE_INTERVAL = 60
+
+async def save_upload(upload, max_bytes=MAX_UPLOAD_BYTES, folder=None):
+    """将上传文件按块写入临时文件，返回 (临时文件路径, 文件内容的SHA-256)
+    
+    不会一次性把整个文件读入内存，写入的同时计算哈希；文件头不是zip格式时立即拒绝（400），
+    超过大小上限时停止接收（413），两种情况都会删除已写入的临时文件
+    """
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx', dir=folder) as temp_file:
+        temp_path = temp_file.name
+        try:
+            written = 0
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if written == 0 and not chunk.startswith(XLSX_MAGIC):
+                    raise HTTPException(status_code=400, detail=f"文件 {upload.filename} 不是有效的XLSX文件")
+                written += len(chunk)
+                if written > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"文件 {upload.filename} 超过大小上限 {max_bytes // (1024 * 1024)}MB")
+                temp_file.write(chunk)
+                digest.update(chunk)
+            if written == 0:
+                raise HTTPException(status_code=400, detail=f"文件 {upload.filename} 为空")
+        except BaseException:
+            temp_file.close()
+            os.unlink(temp_path)
+            raise
+    return temp_path, digest.hexdigest()
+
+class UploadSession:
+    """一个已上传的文件"""
+    def __init__(self, path, filename, sha256):
+        self.upload_id = uuid.uuid4().hex
+        self.path = path
+        self.filename = filename
+        self.size = os.path.getsize(path)
+        self.sha256 = sha256
+        self.created_at = self.last_used = time.time()
+        self.preview_table = None  # 已读取的预览数值表
+        self.preview_rows = 0      # 预览数值表读取的行数，请求的行数不超过它时直接复用
+
+class UploadSessionStore:
+    """上传会话：文件保存在folder中，闲置超过ttl_seconds的会话连同文件一起删除
+    
+    会话数达到max_sessions或文件总大小将超过max_bytes时拒绝新的会话；过期会话除了在创建和查询时删除，
+    还由后台任务定期调用prune()删除。
+    比较任务使用指向会话文件的硬链接，会话过期或被删除不影响已提交的任务；
+    完整数值表在工作进程中解析，通过按文件内容索引的解析缓存在多次比较间复用
+    """
+    def __init__(self, folder, ttl_seconds, max_sessions=UPLOAD_SESSIONS_MAX, max_bytes=UPLOAD_SESSIONS_MAX_BYTES):
+        self.folder = folder
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def create(self, path, filename, sha256):
+        """为已保存的文件创建会话；超过会话数或总大小上限时删除文件并抛出HTTPException（单个文件超过总上限为413，否则为429）"""
+        session = UploadSession(path, filename, sha256)
+        with self.lock:
+            self._prune()
+            total_bytes = sum(existing.size for existing in self.sessions.values())
+            if len(self.sessions) >= self.max_sessions or total_bytes + session.size > self.max_bytes:
+                self._delete_file(path)
+                if session.size > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=f"文件 {filename} 超过上传会话的总大小上限 {self.max_bytes // (1024 * 1024)}MB")
+                raise HTTPException(
+                    status_code=429,
+                    detail="已上传的文件过多，请稍后重试或删除不再需要的上传",
+                    headers={"Retry-After": str(UPLOAD_SESSION_PRUNE_INTERVAL)}
+                )
+            self.sessions[session.upload_id] = session
+        return session
+
+    def get(self, upload_id):
+        """返回会话并刷新闲置时间，不存在或已过期时返回None"""
+        with self.lock:
+            self._prune()
+            session = self.sessions.get(upload_id)
+            if session is not None:
+                session.last_used = time.time()
+            return session
+
+    def remove(self, upload_id):
+        """删除会话和文件，会话不存在时返回False"""
+        with self.lock:
+            session = self.sessions.pop(upload_id, None)
+        if session is None:
+            return False
+        self._delete_file(session.path)
+        return True
+
+    def preview(self, session, max_rows, max_cols):
+        """读取会话文件的预览数值表，已读取的行数足够时直接复用"""
+        if session.preview_table is None or session.preview_rows < max_rows:
+            session.preview_table = read_sheet_preview(session.path, max_rows, max_cols)
+            session.preview_rows = max_rows
+        return session.preview_table
+
+    def link_for_job(self, session):
+        """为比较任务创建指向会话文件的硬链接（不支持时复制），返回路径，任务结束后删除"""
+        fd, path = tempfile.mkstemp(suffix='.xlsx', dir=self.folder)
+        os.close(fd)
+        os.unlink(path)
+        try:
+            os.link(session.path, path)
+        except OSError:
+            shutil.copyfile(session.path, path)
+        return path
+
+    def prune(self):
+        """删除闲置过期的会话，返回删除的会话数"""
+        with self.lock:
+            return self._prune()
+
+    def metrics(self):
+        """当前会话数和文件总大小"""
+        with self.lock:
+            return {
+                "sessions": len(self.sessions),
+                "bytes": sum(session.size for session in self.sessions.values()),
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes
+            }
+
+    def status(self, session):
+        return {
+            "upload_id": session.upload_id,
+            "filename": session.filename,
+            "size": session.size,
+            "sha256": session.sha256,
+            "expires_at": session.last_used + self.ttl_seconds
+        }
+
+    def _prune(self):
+        """删除闲置过期的会话，返回删除的会话数（调用方持有锁）"""
+        expire_before = time.time() - self.ttl_seconds
+        expired = [upload_id for upload_id, session in self.sessions.items() if session.last_used < expire_before]
+        for upload_id in expired:
+            self._delete_file(self.sessions.pop(upload_id).path)
+        return len(expired)
+
+    @staticmethod
+    def _delete_file(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+upload_sessions = UploadSessionStore(UPLOAD_FOLDER, UPLOAD_SESSION_TTL_SECONDS)
+
+# 比较任务在独立的进程池中执行，工作进程数和排队上限可通过环境变量配置
+COMPARE_WORKERS = int(os.environ.get("COMPARE_WORKERS", "2"))
+MAX_PENDING_JOBS = int(os.environ.get("MAX_PENDING_JOBS", "8"))
+# 队列已满时建议客户端重试的间隔（秒）
+JOB_RETRY_AFTER_SECONDS = 5
+# 已结束任务的状态保留时长（秒），过期后查询返回404
+JOB_RETENTION_SECONDS = 3600
+# 进度事件流检查任务状态的间隔（秒）
+JOB_EVENT_POLL_SECONDS = 0.5
+# 任务队列、进度和结果缓存都保存在服务进程的内存中，需要单个长期运行的服务实例；
+# 无服务器部署（如Vercel）中查询任务状态的请求可能落到其他实例上，此时比较在请求内同步执行并直接返回最终状态。
+# 在Vercel上自动开启，也可通过环境变量 COMPARE_INLINE=1 强制开启
+COMPARE_INLINE = os.environ.get("COMPARE_INLINE", "1" if os.environ.get("VERCEL") else "0") == "1"
+
+def run_compare_job(job_args, job_id=None, progress_events=None):
+    """在工作进程中执行一次比较，返回比较过程的输出
+    
+    progress_events: 进程间共享的字典，比较引擎的最新进度事件以任务ID为键写入
+    """
+    def report_progress(event):
+        try:
+            progress_events[job_id] = event
+        except Exception:
+            # 进度只用于展示，共享字典不可用时不影响比较
+            pass
+    
+    # 输出写入任务自己的缓冲区，不替换进程全局的标准输出，同步模式下同时执行的任务不会互相捕获输出
+    f = io.StringIO()
+    compare_excel_files(**job_args, progress_callback=report_progress if progress_events is not None else None, log=partial(print, file=f))
+    return f.getvalue()
+
+class CompareJob:
+    """一个比较任务的状态"""
+    def __init__(self, job_args, result_files, temp_files):
+        self.job_id = uuid.uuid4().hex
+        self.job_args = job_args
+        self.result_files = result_files  # 可能生成的结果文件，完成后只返回实际存在的
+        self.temp_files = temp_files      # 任务结束后删除的上传临时文件
+        self.state = "queued"             # queued / running / succeeded / failed
+        self.phase = "排队中"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stdout = ""
+        self.error = None
+        self.result_cache_key = None      # 成功后以该键记录到结果缓存
+        self.cached = False               # 是否直接使用了缓存的结果文件
+
+class CompareJobManager:
+    """比较任务队列
+    
+    任务先进入等待队列，有空闲工作进程时才提交到进程池，因此等待队列中的位置就是真实的排队位置；
+    排队和执行中的任务总数达到上限时拒绝新任务
+    """
+    def __init__(self, workers, max_pending, result_cache=None):
+        self.workers = max(1, workers)
+        self.result_cache = result_cache
+        self.max_pending = max(self.workers, max_pending)
+        self.jobs = {}
+        self.waiting = deque()
+        self.running = 0
+        self.executor = None
+        # 工作进程写入最新进度事件的共享字典，首次调度任务时创建
+        self.progress_events = None
+        # 任务结束回调可能在提交时同步执行，需要可重入锁
+        self.lock = threading.RLock()
+
+    def full_position(self):
+        """队列已满时返回新任务的排队位置，未满时返回None"""
+        with self.lock:
+            if len(self.waiting) + self.running < self.max_pending:
+                return None
+            return len(self.waiting) + 1
+
+    def submit(self, job_args, result_files, temp_files, result_cache_key=None):
+        """提交任务，队列已满时返回None"""
+        with self.lock:
+            self._prune()
+            if len(self.waiting) + self.running >= self.max_pending:
+                return None
+            job = CompareJob(job_args, result_files, temp_files)
+            job.result_cache_key = result_cache_key
+            self.jobs[job.job_id] = job
+            self.waiting.append(job)
+            self._dispatch()
+            return job
+
+    def run_inline(self, job_args, result_files, temp_files, result_cache_key=None):
+        """在当前线程中执行任务并等待结束，返回已结束的任务，队列已满时返回None（同步模式使用）"""
+        with self.lock:
+            self._prune()
+            if len(self.waiting) + self.running >= self.max_pending:
+                return None
+            job = CompareJob(job_args, result_files, temp_files)
+            job.result_cache_key = result_cache_key
+            job.state = "running"
+            job.phase = "比较中"
+            job.started_at = time.time()
+            self.jobs[job.job_id] = job
+            self.running += 1
+        future = Future()
+        try:
+            future.set_result(run_compare_job(job_args))
+        except Exception as e:
+            future.set_exception(e)
+        self._finish(job, future)
+        return job
+
+    def add_cached(self, result_files, output):
+        """登记一个命中结果缓存、不需要执行的任务，返回已完成的任务"""
+        with self.lock:
+            self._prune()
+            job = CompareJob(None, result_files, [])
+            job.state = "succeeded"
+            job.phase = "已完成"
+            job.started_at = job.finished_at = job.created_at
+            job.stdout = output
+            job.cached = True
+            self.jobs[job.job_id] = job
+            return job
+
+    def status(self, job_id):
+        """返回任务状态字典，任务不存在时返回None
+        
+        读取进度是对共享字典的跨进程调用，在锁外进行；异步接口中应通过 run_in_threadpool 调用
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            now = time.time()
+            queue_end = job.started_at or job.finished_at or now
+            progress_events = self.progress_events
+            job_status = {
+                "job_id": job.job_id,
+                "state": job.state,
+                "phase": job.phase,
+                "progress": None,
+                "queue_position": self.waiting.index(job) + 1 if job.state == "queued" else 0,
+                "created_at": job.created_at,
+                "started_at": job.started_at,
+                "finished_at": job.finished_at,
+                "queue_seconds": round(queue_end - job.created_at, 3),
+                "run_seconds": round((job.finished_at or now) - job.started_at, 3) if job.started_at else None,
+                "resultFiles": [os.path.basename(path) for path in job.result_files] if job.state == "succeeded" else [],
+                "stdout": job.stdout,
+                "error": job.error,
+                "cached": job.cached
+            }
+        if progress_events is not None:
+            try:
+                progress = progress_events.get(job_id)
+            except Exception:
+                # 进度只用于展示，共享字典不可用时不影响状态查询
+                progress = None
+            job_status["progress"] = progress
+            if job_status["state"] == "running" and progress:
+                # 执行中的阶段取比较引擎上报的进度阶段
+                job_status["phase"] = progress["phase"]
+        return job_status
+
+    def _dispatch(self):
+        """把等待队列中的任务提交到空闲的工作进程（调用方持有锁）"""
+        while self.waiting and self.running < self.workers:
+            job = self.waiting.popleft()
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            if self.progress_events is None:
+                self.progress_events = multiprocessing.Manager().dict()
+            try:
+                future = self.executor.submit(run_compare_job, job.job_args, job.job_id, self.progress_events)
+            except BrokenProcessPool:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+                future = self.executor.submit(run_compare_job, job.job_args, job.job_id, self.progress_events)
+            job.state = "running"
+            job.phase = "比较中"
+            job.started_at = time.time()
+            self.running += 1
+            future.add_done_callback(lambda done, job=job: self._finish(job, done))
+
+    def _finish(self, job, future):
+        """任务结束回调：记录结果、清理临时文件并调度下一个任务"""
+        for path in job.temp_files:
+            if os.path.exists(path):
+                os.unlink(path)
+        error = future.exception()
+        with self.lock:
+            job.finished_at = time.time()
+            if error is None:
+                job.stdout = future.result()
+                job.result_files = [path for path in job.result_files if os.path.exists(path)]
+            if error is None and job.result_files:
+                job.state = "succeeded"
+                job.phase = "已完成"
+                if job.result_cache_key and self.result_cache is not None:
+                    try:
+                        self.result_cache.store(job.result_cache_key, job.result_files, job.stdout)
+                    except OSError as e:
+                        # 结果缓存写入失败不影响本次比较结果
+                        print(f"写入结果缓存失败: {e}")
+            elif error is None:
+                # 比较函数出错时只输出错误信息后返回，不会生成结果文件
+                output_lines = [line for line in job.stdout.splitlines() if line.strip()]
+                job.error = output_lines[-1] if output_lines else "比较未生成结果文件"
+                job.state = "failed"
+                job.phase = "失败"
+            else:
+                job.error = str(error) or type(error).__name__
+                job.state = "failed"
+                job.phase = "失败"
+                if isinstance(error, BrokenProcessPool):
+                    # 工作进程异常退出后进程池不可再用，下次调度时重建
+                    self.executor = None
+            self.running -= 1
+            self._dispatch()
+
+    def _prune(self):
+        """删除过期的已结束任务（调用方持有锁）"""
+        expire_before = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished_at and job.finished_at < expire_before]:
+            del self.jobs[job_id]
+            if self.progress_events is not None:
+                self.progress_events.pop(job_id, None)
+
+# 结果目录的后台清理，服务启动时开始运行
+results_janitor = ResultsJanitor(
+    RESULTS_FOLDER, RESULTS_TTL_SECONDS, RESULTS_MAX_BYTES,
+    on_cleanup=lambda files, size: print(f"已清理 {files} 个结果文件，释放 {size / (1024 * 1024):.1f}MB")
+)
+
+# 结果缓存淘汰条目时经由结果目录清理删除结果文件，不会删除正在下载的文件
+result_cache = ResultCache(RESULT_CACHE_FOLDER, RESULT_CACHE_MAX_BYTES, results_janitor)
+job_manager = CompareJobManager(COMPARE_WORKERS, MAX_PENDING_JOBS, result_cache)
+
+@app.on_event("startup")
+async def start_results_janitor():
+    results_janitor.start()
+
+async def prune_upload_sessions():
+    """定期删除过期的上传会话，不依赖后续的上传或查询请求"""
+    while True:
+        await asyncio.sleep(UPLOAD_SESSION_PRUNE_INTERVAL)
+        try:
+            await run_in_threadpool(upload_sessions.prune)
+        except Exception as e:
+            print(f"清理上传会话失败: {e}")
+
+@app.on_event("startup")
+async def start_upload_session_pruner():
+    # 保留任务引用，避免后台任务被垃圾回收
+    app.state.upload_session_pruner = asyncio.get_running_loop().create_task(prune_upload_sessions())
+
+def queue_full_response(queue_position):
+    """任务队列已满时的429响应，客户端按Retry-After稍后重试"""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "比较任务过多，请稍后重试", "queue_position": queue_position},
+        headers={"Retry-After": str(JOB_RETRY_AFTER_SECONDS)}
+    )
+
+@app.middleware("http")
+async def reject_uploads_early(request, call_next):
+    """在解析multipart表单之前检查上传请求
+    
+    FastAPI会在调用接口函数前接收完整个请求体，接口内的检查只能在上传完成后生效；
+    这里按Content-Length拒绝超过大小上限的请求（413），队列已满时直接拒绝比较请求（429）。
+    未提供Content-Length的分块上传仍由save_upload逐块检查大小
+    """
+    file_count = UPLOAD_FILE_COUNTS.get(request.url.path)
+    if request.method == "POST" and file_count:
+        max_body_bytes = file_count * MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD_BYTES
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_body_bytes:
+            return JSONResponse(status_code=413, content={"detail": f"上传内容超过大小上限，每个文件不能超过 {MAX_UPLOAD_BYTES // (1024 * 1024)}MB"})
+        if request.url.path == "/api/compare":
+            queue_position = await run_in_threadpool(job_manager.full_position)
+            if queue_position is not None:
+                return queue_full_response(queue_position)
+    return await call_next(request)
 
 # 挂载静态文件到/static路径
 app.mount("/static", StaticFiles(directory=PROJECT_ROOT), name="static")
@@ -54,15 +526,23 @@ async def download_file(filename: str):
         # 构建完整的文件路径
         file_path = os.path.join(RESULTS_FOLDER, filename)
         
-        # 检查文件是否存在
-        if not os.path.exists(file_path):
+        # 检查文件是否存在，并登记为正在下载，下载结束前不会被后台清理删除
+        if not results_janitor.acquire(file_path):
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        # 返回文件下载响应
-        return FileResponse(file_path, filename=filename, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        # 返回文件下载响应，发送完成后释放登记
+        return FileResponse(file_path, filename=filename, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                            background=BackgroundTask(results_janitor.release, file_path))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """结果目录清理指标：累计删除的文件数、回收的字节数、目录当前大小等，以及上传会话的数量和总大小"""
+    return JSONResponse({"results_janitor": results_janitor.metrics(), "upload_sessions": upload_sessions.metrics()})
+
 @app.get("/api/get_project_info")
 async def get_project_info():
     """获取项目信息，包括最新版本和最后更新日期"""
@@ -116,73 +596,135 @@ async def get_project_info():
             "lastUpdateDate": None
         })
 
+@app.post("/api/uploads")
+async def create_upload(file: UploadFile = File(...)):
+    """上传文件并创建上传会话，之后预览和比较都可以通过返回的upload_id引用该文件，不需要重新上传"""
+    file_path, sha256 = await save_upload(file, folder=UPLOAD_FOLDER)
+    session = upload_sessions.create(file_path, file.filename, sha256)
+    return JSONResponse({"success": True, **upload_sessions.status(session)})
+
+@app.delete("/api/uploads/{upload_id}")
+async def delete_upload(upload_id: str):
+    """提前结束上传会话并删除文件"""
+    if not upload_sessions.remove(upload_id):
+        raise HTTPException(status_code=404, detail="上传会话不存在或已过期")
+    return JSONResponse({"success": True})
+
 @app.post("/api/preview")
 async def preview_excel(
-    baselineFile: UploadFile = File(...),
-    header_row: int = Form(...)
+    baselineFile: UploadFile = File(None),
+    header_row: int = Form(...),
+    upload_id: str = Form(None)
 ):
-    """预览Excel文件的表头行和特征列"""
+    """预览Excel文件的表头行和特征列
+    
+    upload_id: 引用已上传的文件；直接上传baselineFile时会创建上传会话，响应中的upload_id可用于后续的预览和比较
+    """
     try:
-        import openpyxl
+        if upload_id:
+            session = upload_sessions.get(upload_id)
+            if session is None:
+                raise HTTPException(status_code=404, detail="上传会话不存在或已过期，请重新上传文件")
+        elif baselineFile is not None:
+            # 按块保存上传的文件，并创建上传会话
+            file_path, sha256 = await save_upload(baselineFile, folder=UPLOAD_FOLDER)
+            session = upload_sessions.create(file_path, baselineFile.filename, sha256)
+        else:
+            raise HTTPException(status_code=400, detail="请上传基准文件或提供upload_id")
         
-        # 保存上传的文件到临时位置
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as temp_baseline:
-            temp_baseline.write(await baselineFile.read())
-            baseline_file_path = temp_baseline.name
+        # 只读取预览范围（前10行和表头行，前20列），读够后立即停止解析；同一会话中已读取的预览直接复用
+        # 解析在线程池中执行，不阻塞事件循环上的其他请求和进度事件流
+        table = await run_in_threadpool(upload_sessions.preview, session, max(10, header_row), 20)
         
-        try:
-            # 加载Excel文件
-            wb = openpyxl.load_workbook(baseline_file_path, data_only=True)
-            ws = wb.active
-            
-            # 获取前10行数据用于预览
-            max_preview_row = min(10, ws.max_row)
-            max_preview_col = min(20, ws.max_column)
-            
-            # 预览数据
-            preview_data = []
-            for r in range(1, max_preview_row + 1):
-                row_data = []
-                for c in range(1, max_preview_col + 1):
-                    cell_value = ws.cell(row=r, column=c).value
-                    row_data.append(str(cell_value) if cell_value is not None else "")
-                preview_data.append({
-                    "row": r,
-                    "data": row_data
-                })
-            
-            # 获取表头行数据
-            header_data = []
-            if header_row <= ws.max_row:
-                for c in range(1, max_preview_col + 1):
-                    cell_value = ws.cell(row=header_row, column=c).value
-                    header_data.append({
-                        "col": c,
-                        "name": str(cell_value) if cell_value is not None else f"列{c}"
-                    })
-            
-            return JSONResponse({
-                "success": True,
-                "preview_data": preview_data,
-                "header_data": header_data,
-                "max_row": ws.max_row,
-                "max_col": ws.max_column
+        # 获取前10行数据用于预览
+        max_preview_row = min(10, table.max_row)
+        max_preview_col = min(20, table.max_col)
+        
+        # 预览数据
+        preview_data = []
+        for r in range(1, max_preview_row + 1):
+            row_data = []
+            for c in range(1, max_preview_col + 1):
+                cell_value = table.value(r, c)
+                row_data.append(str(cell_value) if cell_value is not None else "")
+            preview_data.append({
+                "row": r,
+                "data": row_data
             })
-        finally:
-            # 清理临时文件
-            os.unlink(baseline_file_path)
+        
+        # 获取表头行数据
+        header_data = []
+        if header_row <= table.max_row:
+            for c in range(1, max_preview_col + 1):
+                cell_value = table.value(header_row, c)
+                header_data.append({
+                    "col": c,
+                    "name": str(cell_value) if cell_value is not None else f"列{c}"
+                })
+        
+        # 工作表的总行列数取声明的尺寸，未声明时为已读取的范围
+        max_row, max_col = table.declared_dimensions or (table.max_row, table.max_col)
+        return JSONResponse({
+            "success": True,
+            "preview_data": preview_data,
+            "header_data": header_data,
+            "max_row": max_row,
+            "max_col": max_col,
+            "upload_id": session.upload_id
+        })
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/compare")
 async def compare_excel(
-    baselineFile: UploadFile = File(...),
-    compareFile: UploadFile = File(...),
+    baselineFile: UploadFile = File(None),
+    compareFile: UploadFile = File(None),
     header_row: int = 3,
-    key_fields: str = None
+    key_fields: str = None,
+    output_mode: str = Form("styled"),
+    fidelity: str = Form(None),
+    highlight_mode: str = Form("fills"),
+    diff_workers: int = Form(1),
+    parallel_load: bool = Form(True),
+    reader: str = Form("openpyxl"),
+    include_columns: str = Form(None),
+    exclude_columns: str = Form(None),
+    use_cache: bool = Form(True),
+    baseline_upload_id: str = Form(None),
+    compare_upload_id: str = Form(None)
 ):
-    """比较两个Excel文件"""
+    """比较两个Excel文件
+    
+    output_mode: "styled"（完整格式，默认）或 "streaming"（流式输出，适合超大文件）
+    fidelity: 流式输出时保留的格式，逗号分隔，如 "column_widths,row_heights,fills"，默认全部保留
+    highlight_mode: "fills"（逐单元格填充，默认）或 "conditional"（合并为条件格式区域）
+    diff_workers: 单元格比较的进程数，0表示使用全部CPU核心，默认1（不启用多进程）
+    parallel_load: 是否在两个进程中并行加载基准文件和比较文件（文件较大时生效），默认开启
+    reader: 数值表加载后端，"openpyxl"（默认）或 "fast"（直接解析XML，速度更快）
+    include_columns: 只比较的列，逗号分隔的列名或列号（从1开始），特征列始终加载
+    exclude_columns: 不比较的列，逗号分隔的列名或列号，未加载的列在解析时直接跳过
+    use_cache: 是否使用按文件内容缓存的解析结果和比较结果，默认开启；
+        两个文件内容和影响结果的选项都与之前的某次比较相同时，直接返回那次的结果文件（cached为true）
+    baseline_upload_id / compare_upload_id: 引用已上传的文件（/api/uploads 或 /api/preview 返回的upload_id），代替上传baselineFile / compareFile
+    """
     try:
+        if output_mode not in ("styled", "streaming"):
+            raise HTTPException(status_code=400, detail=f"不支持的输出模式: {output_mode}")
+        if highlight_mode not in HIGHLIGHT_MODES:
+            raise HTTPException(status_code=400, detail=f"不支持的标记方式: {highlight_mode}")
+        if diff_workers < 0:
+            raise HTTPException(status_code=400, detail="比较进程数不能为负数")
+        if reader not in SHEET_READERS:
+            raise HTTPException(status_code=400, detail=f"不支持的读取后端: {reader}")
+        parsed_fidelity = None
+        if fidelity:
+            parsed_fidelity = [option.strip() for option in fidelity.split(",") if option.strip()]
+            unknown_options = [option for option in parsed_fidelity if option not in STREAMING_FIDELITY_OPTIONS]
+            if unknown_options:
+                raise HTTPException(status_code=400, detail=f"不支持的格式选项: {', '.join(unknown_options)}")
+        
         # 处理特征列参数
         parsed_key_fields = None
         if key_fields:
@@ -193,66 +735,111 @@ async def compare_excel(
                 # 如果不是JSON格式，尝试解析为逗号分隔的字符串
                 parsed_key_fields = [field.strip() for field in key_fields.split(",") if field.strip()]
         
-        # 生成唯一的文件名和时间戳
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        original_filename = os.path.splitext(baselineFile.filename)[0]
+        # 处理列投影参数：纯数字按列号处理，其余按表头列名处理
+        def parse_columns(value):
+            if not value:
+                return None
+            return [int(item) if item.isdigit() else item for item in (part.strip() for part in value.split(",")) if item]
+        
+        parsed_include_columns = parse_columns(include_columns)
+        parsed_exclude_columns = parse_columns(exclude_columns)
         
-        # 保存上传的文件到临时位置
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as temp_baseline:
-            temp_baseline.write(await baselineFile.read())
-            baseline_file_path = temp_baseline.name
+        async def resolve_input(upload, upload_id, label):
+            """返回 (任务使用的文件路径, 原始文件名, 文件内容的SHA-256)，引用上传会话时为指向会话文件的硬链接"""
+            if upload_id:
+                session = upload_sessions.get(upload_id)
+                if session is None:
+                    raise HTTPException(status_code=404, detail=f"{label}的上传会话不存在或已过期，请重新上传")
+                return upload_sessions.link_for_job(session), session.filename, session.sha256
+            if upload is None:
+                raise HTTPException(status_code=400, detail=f"请上传{label}或提供其upload_id")
+            # 按块保存上传的文件到临时位置
+            file_path, sha256 = await save_upload(upload)
+            return file_path, upload.filename, sha256
         
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as temp_compare:
-            temp_compare.write(await compareFile.read())
-            compare_file_path = temp_compare.name
+        baseline_file_path, baseline_filename, baseline_sha256 = await resolve_input(baselineFile, baseline_upload_id, "基准文件")
+        compare_file_path, _, compare_sha256 = await resolve_input(compareFile, compare_upload_id, "比较文件")
+        
+        # 生成唯一的文件名和时间戳
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        original_filename = os.path.splitext(baseline_filename)[0]
         
         # 生成结果文件路径
         result_baseline = os.path.join(RESULTS_FOLDER, f"{original_filename}_my_比较结果_{timestamp}.xlsx")
         result_compare = os.path.join(RESULTS_FOLDER, f"{original_filename}_from_比较结果_{timestamp}.xlsx")
-        
-        # 直接调用核心比较函数，使用多进程执行以提高性能
-        import io
-        import sys
-        from contextlib import redirect_stdout
-        
-        f = io.StringIO()
-        with redirect_stdout(f):
-            compare_excel_files(
-                baseline_file_path,  # 基准文件路径
-                compare_file_path,   # 比较文件路径
-                result_baseline,     # 输出基准文件路径
-                result_compare,      # 输出比较文件路径
-                original_filename,   # 原始文件名
-                timestamp,           # 时间戳
-                header_row,          # 表头行号
-                parsed_key_fields    # 特征列
-            )
-        
-        # 获取函数输出
-        stdout = f.getvalue()
-        
-        # 生成差异结果文件路径
         diff_file = os.path.join(RESULTS_FOLDER, f"{original_filename}_差异结果_{timestamp}.xlsx")
         
-        # 收集所有结果文件，只返回文件名
-        result_files = []
-        expected_files = [diff_file, result_baseline, result_compare]
-        for expected_file in expected_files:
-            if os.path.exists(expected_file):
-                # 只返回文件名，不返回完整路径
-                result_files.append(os.path.basename(expected_file))
+        # 结果缓存：键只包含影响结果文件内容的选项，读取后端、进程数等只影响速度的选项不参与
+        result_cache_key = None
+        if use_cache:
+            result_options = {
+                "header_row": header_row,
+                "key_fields": parsed_key_fields,
+                "output_mode": output_mode,
+                "fidelity": parsed_fidelity,
+                "highlight_mode": highlight_mode,
+                "include_columns": parsed_include_columns,
+                "exclude_columns": parsed_exclude_columns
+            }
+            # 文件哈希在接收上传时已经计算好
+            result_cache_key = ResultCache.key_from_hashes(baseline_sha256, compare_sha256, result_options)
+            cached_result = result_cache.lookup(result_cache_key)
+            if cached_result is not None:
+                os.unlink(baseline_file_path)
+                os.unlink(compare_file_path)
+                job = job_manager.add_cached(cached_result["files"], cached_result["output"])
+                return JSONResponse({
+                    "success": True,
+                    "message": "文件和比较选项与之前的比较相同，直接返回已有的结果文件",
+                    **await run_in_threadpool(job_manager.status, job.job_id)
+                })
         
-        # 清理临时文件
-        os.unlink(baseline_file_path)
-        os.unlink(compare_file_path)
+        # 提交到任务队列，比较在进程池中执行，不阻塞事件循环；同步模式下在线程池中执行完再返回
+        job = await run_in_threadpool(
+            job_manager.run_inline if COMPARE_INLINE else job_manager.submit,
+            {
+                "baseline_path": baseline_file_path,      # 基准文件路径
+                "compare_path": compare_file_path,        # 比较文件路径
+                "output_baseline_path": result_baseline,  # 输出基准文件路径
+                "output_compare_path": result_compare,    # 输出比较文件路径
+                "original_filename": original_filename,   # 原始文件名
+                "timestamp": timestamp,                   # 时间戳
+                "header_row": header_row,                 # 表头行号
+                "key_fields": parsed_key_fields,          # 特征列
+                "output_mode": output_mode,               # 输出模式
+                "fidelity": parsed_fidelity,              # 流式输出保留的格式
+                "highlight_mode": highlight_mode,         # 标记方式
+                "diff_workers": diff_workers,             # 比较进程数
+                "parallel_load": parallel_load,           # 并行加载两个文件
+                "reader": reader,                         # 数值表加载后端
+                "include_columns": parsed_include_columns,  # 只比较的列
+                "exclude_columns": parsed_exclude_columns,  # 不比较的列
+                "cache_dir": CACHE_FOLDER if use_cache else None,  # 解析缓存目录
+                "file_hashes": {baseline_file_path: baseline_sha256, compare_file_path: compare_sha256}  # 接收上传时已计算的文件内容哈希
+            },
+            [diff_file, result_baseline, result_compare],
+            [baseline_file_path, compare_file_path],
+            result_cache_key
+        )
+        if job is None:
+            # 队列已满时请求在接收文件前就会被中间件拒绝，这里是上传期间队列被其他请求占满的情况
+            os.unlink(baseline_file_path)
+            os.unlink(compare_file_path)
+            return queue_full_response(job_manager.full_position())
         
-        # 返回结果
-        return JSONResponse({
+        if COMPARE_INLINE:
+            # 同步模式直接返回任务的最终状态
+            return JSONResponse({
+                "success": True,
+                "message": "比较任务已结束",
+                **await run_in_threadpool(job_manager.status, job.job_id)
+            })
+        
+        # 立即返回任务ID，客户端通过 /api/jobs/{job_id} 查询进度和结果
+        return JSONResponse(status_code=202, content={
             "success": True,
-            "message": "比较完成",
-            "resultFiles": result_files,
-            "stdout": stdout,
-            "stderr": ""
+            "message": "比较任务已提交",
+            **await run_in_threadpool(job_manager.status, job.job_id)
         })
         
     except Exception as e:
@@ -262,8 +849,42 @@ async def compare_excel(
         if 'compare_file_path' in locals() and os.path.exists(compare_file_path):
             os.unlink(compare_file_path)
         
+        if isinstance(e, HTTPException):
+            raise
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """查询比较任务的状态、阶段、耗时和结果文件"""
+    job_status = await run_in_threadpool(job_manager.status, job_id)
+    if job_status is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return JSONResponse(job_status)
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """以Server-Sent Events推送比较任务的排队位置和进度，任务结束时推送最终状态（done事件）后关闭"""
+    if await run_in_threadpool(job_manager.status, job_id) is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    
+    async def event_stream():
+        last_sent = None
+        while True:
+            job_status = await run_in_threadpool(job_manager.status, job_id)
+            if job_status is None:
+                break
+            if job_status["state"] in ("succeeded", "failed"):
+                yield f"event: done\ndata: {json.dumps(job_status, ensure_ascii=False)}\n\n"
+                break
+            # 只在排队位置或进度变化时推送
+            current = (job_status["state"], job_status["queue_position"], job_status["progress"])
+            if current != last_sent:
+                yield f"event: progress\ndata: {json.dumps(job_status, ensure_ascii=False)}\n\n"
+                last_sent = current
+            await asyncio.sleep(JOB_EVENT_POLL_SECONDS)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 def open_browser():
     """延迟打开浏览器，确保服务器已经启动"""
     import time